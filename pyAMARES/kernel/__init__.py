@@ -1,10 +1,18 @@
+from .batch import batch_to_parameters, fit_batch
+from .compiled import fit_compiled
+from .constraints import compile_parameters, constraint_matrix
 from .fid import (
     Jac6,
     Jac6c,
     add_noise_FID,
+    complex_view,
+    equation6_array,
     fidSNR,
     interleavefid,
+    jacobian_array,
     multieq6,
+    multieq6_array,
+    params_to_array,
     process_fid,
     remove_zero_padding,
     simulate_fid,
@@ -25,15 +33,32 @@ from .lmfit import (
     save_parameter_to_csv,
     set_vary_parameters,
 )
-from .objective_func import default_objective, objective, objective3, objective_range
+from .multistart import fit_multistart
+from .objective_func import (
+    default_jacobian,
+    default_objective,
+    get_analytic_jacobian,
+    jacobian_range,
+    objective,
+    objective3,
+    objective_range,
+    objective_workspace,
+)
 from .PriorKnowledge import generateparameter, initialize_FID
+from .result import AMARESResult, FIDNamespace
+from .varpro import fit_varpro
 
 __all__ = [
     "interleavefid",
     "uninterleave",
+    "complex_view",
     "multieq6",
     "Jac6",
     "Jac6c",
+    "params_to_array",
+    "equation6_array",
+    "multieq6_array",
+    "jacobian_array",
     "process_fid",
     "simulate_fid",
     "remove_zero_padding",
@@ -58,4 +83,17 @@ __all__ = [
     "default_objective",
     "objective",
     "objective3",
+    "default_jacobian",
+    "jacobian_range",
+    "get_analytic_jacobian",
+    "objective_workspace",
+    "constraint_matrix",
+    "compile_parameters",
+    "fit_compiled",
+    "fit_batch",
+    "fit_varpro",
+    "fit_multistart",
+    "batch_to_parameters",
+    "AMARESResult",
+    "FIDNamespace",
 ]
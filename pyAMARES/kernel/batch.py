@@ -0,0 +1,278 @@
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from ..libs.logger import get_logger
+from .constraints import compile_parameters, split_fixed_peaks
+from .fid import engine_inputs, jacobian_array, multieq6_array
+
+logger = get_logger(__name__)
+
+# Status codes of levenberg_marquardt_batch, numbered after the info codes of MINPACK
+batch_status_messages = {
+    1: "Converged.",
+    5: "Maximum number of iterations reached.",
+    6: "Stalled: the damping factor is saturated and no further reduction of chi-square is possible.",
+}
+
+
+def batch_residual(x, compiled, timeaxis, fids):
+    """
+    Complex residuals of ``default_objective`` for a stack of voxels.
+
+    Args:
+        x (numpy.ndarray): The varying parameters with shape ``(nvoxel, nvar)``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        timeaxis (1D array): The time axis.
+        fids (numpy.ndarray): The complex FIDs with shape ``(nvoxel, len(timeaxis))``.
+
+    Returns:
+        numpy.ndarray: The complex residuals with shape ``(nvoxel, len(timeaxis))``.
+    """
+    popt = (x @ compiled.Pmatrix.T + compiled.offset).reshape(len(x), -1, 5)
+    return fids - multieq6_array(popt, timeaxis)
+
+
+def batch_normal_equations(x, compiled, timeaxis, residual):
+    """
+    Gauss-Newton normal equations of a stack of voxels.
+
+    The Jacobian is block-diagonal across voxels, so only the ``(nvar, nvar)`` block
+    of each voxel is built.
+
+    Args:
+        x (numpy.ndarray): The varying parameters with shape ``(nvoxel, nvar)``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        timeaxis (1D array): The time axis.
+        residual (numpy.ndarray): The complex residuals returned by ``batch_residual``.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: ``J.T @ J`` with shape ``(nvoxel, nvar, nvar)``.
+            - numpy.ndarray: ``-J.T @ residual`` with shape ``(nvoxel, nvar)``.
+    """
+    popt = (x @ compiled.Pmatrix.T + compiled.offset).reshape(len(x), -1, 5)
+    jacobian = jacobian_array(popt, timeaxis)
+    # Projected in the precision of the model engine, accumulated in double precision
+    jacobian = (compiled.Pmatrix.T.astype(jacobian.real.dtype) @ jacobian).astype(
+        complex, copy=False
+    )  # (nvoxel, nvar, npts)
+    residual = residual.astype(complex, copy=False)
+    hessian = np.real(jacobian @ np.conj(jacobian).transpose(0, 2, 1))
+    gradient = np.real(jacobian @ np.conj(residual)[..., np.newaxis])[..., 0]
+    return hessian, gradient
+
+
+def levenberg_marquardt_batch(
+    x0, compiled, timeaxis, fids, max_iter=200, xtol=1e-8, ftol=1e-8, lambda0=1e-3
+):
+    """
+    Levenberg-Marquardt minimization of a stack of voxels that share the same prior knowledge.
+
+    Each voxel has its own damping factor. The steps of all active voxels are solved
+    in one batched ``numpy.linalg.solve``, the bounds are enforced by projection, and
+    voxels are removed from the active set as soon as they have converged.
+
+    Args:
+        x0 (numpy.ndarray): The initial varying parameters with shape ``(nvoxel, nvar)``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        timeaxis (1D array): The time axis.
+        fids (numpy.ndarray): The complex FIDs with shape ``(nvoxel, len(timeaxis))``.
+        max_iter (int, optional): Maximum number of iterations per voxel. Defaults to 200.
+        xtol (float, optional): Relative tolerance of the step size. Defaults to 1e-8.
+        ftol (float, optional): Relative tolerance of the reduction of chi-square. Defaults to 1e-8.
+        lambda0 (float, optional): Initial damping factor. Defaults to 1e-3.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The fitted varying parameters with shape ``(nvoxel, nvar)``.
+            - numpy.ndarray: Chi-square of each voxel.
+            - numpy.ndarray: Number of iterations of each voxel.
+            - numpy.ndarray: The status of each voxel, 1 if it converged within ``max_iter``,
+              5 if it reached ``max_iter``, and 6 if it stalled because no step with a smaller
+              chi-square is found, see ``batch_status_messages``.
+    """
+    lower, upper = compiled.lower, compiled.upper
+    x = np.clip(np.array(x0, dtype=float), lower, upper)
+    nvoxel = len(x)
+    residual = batch_residual(x, compiled, timeaxis, fids)
+    chisqr = np.sum(np.abs(residual) ** 2, axis=-1, dtype=float)
+    # The reduction of chi-square is not resolved below the precision of the model engine
+    ftol = max(ftol, np.finfo(residual.dtype).eps)
+    damping = np.full(nvoxel, lambda0)
+    niter = np.zeros(nvoxel, dtype=int)
+    status = np.full(nvoxel, 5)
+    active = np.ones(nvoxel, dtype=bool)
+    hessian, gradient = batch_normal_equations(x, compiled, timeaxis, residual)
+
+    while np.any(active):
+        idx = np.flatnonzero(active)
+        lhs = hessian[idx]
+        rhs = gradient[idx]
+        # Parameters at a bound that the gradient pushes outwards are held fixed
+        pinned = ((x[idx] <= lower) & (rhs < 0)) | ((x[idx] >= upper) & (rhs > 0))
+        free = ~pinned
+        lhs = lhs * (free[..., np.newaxis] & free[..., np.newaxis, :])
+        rhs = rhs * free
+        diag = np.diagonal(lhs, axis1=-2, axis2=-1)
+        diag = np.maximum(diag, 1e-12 * np.max(diag, axis=-1, keepdims=True) + 1e-300)
+        lhs = lhs + (damping[idx, np.newaxis] * diag)[..., np.newaxis] * np.eye(
+            diag.shape[-1]
+        )
+        step = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+        x_new = np.clip(x[idx] + step, lower, upper)
+        residual_new = batch_residual(x_new, compiled, timeaxis, fids[idx])
+        chisqr_new = np.sum(np.abs(residual_new) ** 2, axis=-1, dtype=float)
+        niter[idx] += 1
+
+        accepted = chisqr_new < chisqr[idx]
+        step_size = np.linalg.norm(x_new - x[idx], axis=-1)
+        converged = accepted & (
+            (chisqr[idx] - chisqr_new <= ftol * chisqr[idx])
+            | (step_size <= xtol * (np.linalg.norm(x[idx], axis=-1) + xtol))
+        )
+        # The damping is too large to find a smaller chi-square
+        stalled = ~accepted & (damping[idx] > 1e10)
+
+        acc = idx[accepted]
+        x[acc] = x_new[accepted]
+        residual[acc] = residual_new[accepted]
+        chisqr[acc] = chisqr_new[accepted]
+        damping[acc] = np.maximum(damping[acc] * 0.1, 1e-12)
+        damping[idx[~accepted]] *= 10.0
+        status[idx[converged]] = 1
+        status[idx[stalled]] = 6
+        active[idx[converged | stalled]] = False
+        active &= niter < max_iter
+
+        update = acc[active[acc]]
+        if len(update):
+            hessian[update], gradient[update] = batch_normal_equations(
+                x[update], compiled, timeaxis, residual[update]
+            )
+    return x, chisqr, niter, status
+
+
+def fit_batch(
+    fid_parameters,
+    fitting_parameters,
+    fid_arrs,
+    x0=None,
+    batch_size=32,
+    max_iter=200,
+    xtol=1e-8,
+    ftol=1e-8,
+    compiled=None,
+):
+    """
+    Fit many FIDs that share one prior knowledge simultaneously, e.g. the voxels of an MRSI dataset.
+
+    The ``expr`` constraints are compiled once by ``compile_parameters``. The voxels are fitted
+    in chunks of ``batch_size`` by ``levenberg_marquardt_batch`` with stacked ``(nvoxel, npeak, 5)``
+    parameters, so there is neither a ``fitAMARES`` call nor a deepcopy of ``fid_parameters`` per voxel.
+    Only ``default_objective`` (the full time domain) is supported. With
+    ``initialize_FID(..., precision="single")``, the model and the Jacobian are evaluated in single
+    precision, while the normal equations are accumulated and solved in double precision.
+
+    Args:
+        fid_parameters (argspace namespace): Contains the time axis shared by all FIDs.
+        fitting_parameters (lmfit.Parameters): The initial fitting parameters shared by all FIDs.
+        fid_arrs (numpy.ndarray): The complex FIDs with shape ``(nvoxel, npts)``.
+        x0 (numpy.ndarray, optional): Initial varying parameters with shape ``(nvar,)`` or ``(nvoxel, nvar)``,
+          ordered as ``var_names``. If None, the values of ``fitting_parameters`` are used for all voxels.
+        batch_size (int, optional): Number of voxels solved together. Defaults to 32.
+        max_iter (int, optional): Maximum number of iterations per voxel. Defaults to 200.
+        xtol (float, optional): Relative tolerance of the step size. Defaults to 1e-8.
+        ftol (float, optional): Relative tolerance of the reduction of chi-square. Defaults to 1e-8.
+        compiled (argparse.Namespace, optional): The result of ``compile_parameters(fitting_parameters)``,
+          e.g. compiled once per worker process. If None, ``fitting_parameters`` is compiled here.
+
+    Returns:
+        argparse.Namespace: A namespace with the following attributes:
+
+            - names (list of str): Names of all parameters.
+            - var_names (list of str): Names of the varying parameters.
+            - values (numpy.ndarray): The fitted parameters with shape ``(nvoxel, len(names))``.
+            - x (numpy.ndarray): The fitted varying parameters with shape ``(nvoxel, len(var_names))``.
+            - chisqr (numpy.ndarray): Chi-square of each voxel.
+            - niter (numpy.ndarray): Number of iterations of each voxel.
+            - status (numpy.ndarray): The status of each voxel, see ``levenberg_marquardt_batch``.
+            - success (numpy.ndarray): True for voxels that converged, i.e. ``status == 1``.
+    """
+    timebefore = datetime.now()
+    if compiled is None:
+        compiled = compile_parameters(fitting_parameters)
+    # In single precision with initialize_FID(..., precision="single")
+    timeaxis, fid_arrs = engine_inputs(fid_parameters, fid_arrs)
+    fid_arrs = np.atleast_2d(fid_arrs)
+    nvoxel = fid_arrs.shape[0]
+    # The fixed peaks are subtracted once, see split_fixed_peaks
+    active, fixed_popt = split_fixed_peaks(compiled)
+    if len(fixed_popt):
+        fid_arrs = fid_arrs - multieq6_array(fixed_popt, timeaxis)
+    if x0 is None:
+        x0 = compiled.x0
+    x0 = np.broadcast_to(np.asarray(x0, dtype=float), (nvoxel, len(compiled.x0)))
+
+    x = np.empty((nvoxel, len(compiled.x0)))
+    chisqr = np.empty(nvoxel)
+    niter = np.empty(nvoxel, dtype=int)
+    status = np.empty(nvoxel, dtype=int)
+    for start in range(0, nvoxel, batch_size):
+        chunk = slice(start, start + batch_size)
+        x[chunk], chisqr[chunk], niter[chunk], status[chunk] = (
+            levenberg_marquardt_batch(
+                x0[chunk],
+                active,
+                timeaxis,
+                fid_arrs[chunk],
+                max_iter=max_iter,
+                xtol=xtol,
+                ftol=ftol,
+            )
+        )
+    timeafter = datetime.now()
+    logger.info(
+        "Batched fitting of %i FIDs took %s seconds"
+        % (nvoxel, (timeafter - timebefore).total_seconds())
+    )
+    if np.any(status == 5):
+        logger.warning(
+            "%i of %i FIDs did not converge within max_iter=%i"
+            % (np.sum(status == 5), nvoxel, max_iter)
+        )
+    if np.any(status == 6):
+        logger.warning(
+            "%i of %i FIDs stalled before reaching xtol or ftol"
+            % (np.sum(status == 6), nvoxel)
+        )
+    return argparse.Namespace(
+        names=compiled.names,
+        var_names=compiled.var_names,
+        values=x @ compiled.Pmatrix.T + compiled.offset,
+        x=x,
+        chisqr=chisqr,
+        niter=niter,
+        status=status,
+        success=status == 1,
+    )
+
+
+def batch_to_parameters(fitting_parameters, batch_result, index):
+    """
+    Return the fitted parameters of one voxel of ``fit_batch`` as ``lmfit.Parameters``.
+
+    Args:
+        fitting_parameters (lmfit.Parameters): The initial fitting parameters passed to ``fit_batch``.
+        batch_result (argparse.Namespace): The namespace returned by ``fit_batch``.
+        index (int): Index of the voxel.
+
+    Returns:
+        lmfit.Parameters: A copy of ``fitting_parameters`` with the fitted values.
+    """
+    params = fitting_parameters.copy()
+    for name, value in zip(batch_result.var_names, batch_result.x[index]):
+        params[name].value = value
+    params.update_constraints()
+    return params
@@ -0,0 +1,348 @@
+from copy import deepcopy
+
+import numpy as np
+from lmfit.minimizer import MinimizerResult
+from scipy.optimize import least_squares, leastsq
+
+from ..libs.logger import get_logger
+from .batch import batch_status_messages, levenberg_marquardt_batch
+from .constraints import compile_parameters, split_fixed_peaks
+from .fid import (
+    band_bins,
+    engine_inputs,
+    jacobian_array,
+    jacobian_band,
+    multieq6_array,
+    multieq6_band,
+    spectrum_band,
+)
+from .objective_func import default_objective, objective_range
+
+logger = get_logger(__name__)
+
+# Objective functions that have a compiled equivalent
+compiled_objectives = (default_objective, objective_range)
+scipy_methods = ("least_squares", "leastsq")
+# The built-in Levenberg-Marquardt solver, see levenberg_marquardt_batch
+native_methods = ("native",)
+compiled_methods = scipy_methods + native_methods
+
+
+def compiled_residual(
+    x, compiled, timeaxis, fid, fit_range=None, workspace=None, band=None
+):
+    """
+    Residual of ``default_objective`` (or ``objective_range``) for a plain vector of varying parameters.
+
+    Args:
+        x (numpy.ndarray): The varying parameters, ordered as ``compiled.var_names``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        timeaxis (1D array): The time axis.
+        fid (1D array): The complex FID.
+        fit_range (tuple or None, optional): Indices of the fitting range in the spectrum.
+        workspace (numpy.ndarray, optional): Preallocated complex array with shape ``(npeak, len(timeaxis))``.
+        band (tuple, optional): The result of ``spectrum_band(fid, fit_range)``, precomputed once per fit.
+
+    Returns:
+        numpy.ndarray: The interleaved residual.
+    """
+    popt = (compiled.Pmatrix @ x + compiled.offset).reshape(-1, 5)
+    if fit_range is None:
+        residual = fid - multieq6_array(popt, timeaxis, workspace=workspace)
+    else:
+        if band is None:
+            band = spectrum_band(fid, fit_range)
+        bins, spec = band
+        residual = spec - multieq6_band(popt, timeaxis, bins)
+    return residual.view(residual.real.dtype).astype(float, copy=False)
+
+
+def compiled_jacobian(
+    x, compiled, timeaxis, fid, fit_range=None, workspace=None, band=None
+):
+    """
+    Analytic Jacobian of ``compiled_residual`` with respect to the varying parameters.
+
+    Args:
+        x (numpy.ndarray): The varying parameters, ordered as ``compiled.var_names``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        timeaxis (1D array): The time axis.
+        fid (1D array): Not used in this function but included for interface consistency.
+        fit_range (tuple or None, optional): Indices of the fitting range in the spectrum.
+        workspace (numpy.ndarray, optional): Not used in this function but included for interface consistency.
+        band (tuple, optional): The result of ``spectrum_band(fid, fit_range)``. Only the bins are used.
+
+    Returns:
+        numpy.ndarray: The interleaved Jacobian with shape ``(2 * npts, len(x))``.
+    """
+    popt = (compiled.Pmatrix @ x + compiled.offset).reshape(-1, 5)
+    if fit_range is None:
+        jacobian = jacobian_array(popt, timeaxis)
+    else:
+        bins = band_bins(len(timeaxis), fit_range) if band is None else band[0]
+        jacobian = jacobian_band(popt, timeaxis, bins)
+    # Projected in the precision of the model engine, then returned in double precision
+    jacobian = compiled.Pmatrix.T.astype(jacobian.real.dtype) @ jacobian
+    return -jacobian.view(jacobian.real.dtype).T.astype(float, copy=False)
+
+
+def finite_difference_steps(method, fit_kws, timeaxis):
+    """
+    Default finite-difference steps of ``scipy.optimize`` for a model evaluated in single precision.
+
+    The default steps of ``least_squares`` and ``leastsq`` assume a residual accurate to double
+    precision. For a ``float32`` time axis (see ``pyAMARES.kernel.fid.engine_inputs``), they are
+    below the resolution of the model, so ``diff_step`` and ``epsfcn`` default to the ``float32`` values.
+
+    Args:
+        method (str): ``least_squares`` or ``leastsq``, other methods are left unchanged.
+        fit_kws (dict or None): Options to pass to the optimizer.
+        timeaxis (1D array): The time axis of the model engine.
+
+    Returns:
+        dict or None: ``fit_kws``, or a copy with the default steps for a ``float32`` time axis.
+    """
+    if timeaxis.dtype != np.float32 or method not in scipy_methods:
+        return fit_kws
+    fit_kws = {} if fit_kws is None else dict(fit_kws)
+    eps = np.finfo(np.float32).eps
+    if method == "least_squares":
+        fit_kws.setdefault("diff_step", np.sqrt(eps))
+    else:
+        fit_kws.setdefault("epsfcn", eps)
+    return fit_kws
+
+
+def to_internal(value, lower, upper):
+    """
+    Convert bounded parameters to the unbounded internal values of ``leastsq``.
+
+    The same MINUIT-style transformations as ``lmfit.Parameter.setup_bounds`` are used.
+
+    Args:
+        value (numpy.ndarray): The parameter values.
+        lower (numpy.ndarray): The lower bounds, ``-inf`` if unbounded.
+        upper (numpy.ndarray): The upper bounds, ``inf`` if unbounded.
+
+    Returns:
+        numpy.ndarray: The internal values.
+    """
+    value = np.clip(value, lower, upper)
+    internal = value.copy()
+    both = np.isfinite(lower) & np.isfinite(upper)
+    only_lower = np.isfinite(lower) & ~both
+    only_upper = np.isfinite(upper) & ~both
+    internal[both] = np.arcsin(
+        2 * (value[both] - lower[both]) / (upper[both] - lower[both]) - 1
+    )
+    internal[only_lower] = np.sqrt((value[only_lower] - lower[only_lower] + 1) ** 2 - 1)
+    internal[only_upper] = np.sqrt((upper[only_upper] - value[only_upper] + 1) ** 2 - 1)
+    return internal
+
+
+def from_internal(internal, lower, upper):
+    """
+    Convert the internal values of ``leastsq`` back to bounded parameters.
+
+    Args:
+        internal (numpy.ndarray): The internal values.
+        lower (numpy.ndarray): The lower bounds, ``-inf`` if unbounded.
+        upper (numpy.ndarray): The upper bounds, ``inf`` if unbounded.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The parameter values.
+            - numpy.ndarray: The derivatives of the parameter values with respect to the internal values.
+    """
+    value = internal.copy()
+    grad = np.ones_like(internal)
+    both = np.isfinite(lower) & np.isfinite(upper)
+    only_lower = np.isfinite(lower) & ~both
+    only_upper = np.isfinite(upper) & ~both
+    half_range = (upper[both] - lower[both]) / 2.0
+    value[both] = lower[both] + (np.sin(internal[both]) + 1) * half_range
+    grad[both] = np.cos(internal[both]) * half_range
+    root = np.sqrt(internal[only_lower] ** 2 + 1)
+    value[only_lower] = lower[only_lower] - 1 + root
+    grad[only_lower] = internal[only_lower] / root
+    root = np.sqrt(internal[only_upper] ** 2 + 1)
+    value[only_upper] = upper[only_upper] + 1 - root
+    grad[only_upper] = -internal[only_upper] / root
+    return value, grad
+
+
+def fit_compiled(
+    fid_parameters,
+    fitting_parameters,
+    method="least_squares",
+    fit_range=None,
+    fit_kws=None,
+    analytic_jac=False,
+):
+    """
+    Fit ``default_objective`` (or ``objective_range``) on a plain NumPy vector of the varying parameters.
+
+    The ``expr`` constraints are compiled once by ``compile_parameters``, and ``scipy.optimize``
+    is called directly, so neither ``lmfit.Parameters`` nor asteval is used in the inner loop.
+    The bounds are handled in the same way as lmfit, i.e. natively for ``least_squares`` and with
+    MINUIT-style transformations for ``leastsq``. With ``method="native"``, the built-in
+    ``levenberg_marquardt_batch`` is used instead of ``scipy.optimize``, i.e. a Levenberg-Marquardt
+    solver on the analytic Jacobian with box bounds handled by projection, without bound transforms.
+    The result is written back to an ``lmfit.MinimizerResult`` so that it can be used by
+    ``report_amares`` and ``plotAMARES``.
+
+    Args:
+        fid_parameters (argspace namespace): Contains FID data and the time axis.
+        fitting_parameters (lmfit.Parameters): Parameters for the fitting process.
+        method (str, optional): ``least_squares``, ``leastsq`` or ``native``. Defaults to ``least_squares``.
+        fit_range (tuple or None, optional): Indices of the fitting range in the spectrum. Uses full range if None.
+          Not supported by ``native``.
+        fit_kws (dict, optional): Options to pass to ``scipy.optimize.least_squares`` or ``scipy.optimize.leastsq``.
+          ``max_nfev`` is translated to ``maxfev`` for ``leastsq``. For ``native``, only ``max_nfev`` (the maximum
+          number of iterations), ``xtol`` and ``ftol`` are used.
+        analytic_jac (bool, optional): If True, use the analytic Jacobian instead of finite differences.
+          ``native`` always uses the analytic Jacobian.
+
+    Returns:
+        lmfit.MinimizerResult: Object containing the fitting results.
+
+    Raises:
+        ValueError: If ``method`` is not supported or an ``expr`` constraint is not linear.
+    """
+    if method not in compiled_methods:
+        raise ValueError(
+            "method=%s is not supported, use one of %s" % (method, compiled_methods)
+        )
+    if method in native_methods and fit_range is not None:
+        raise ValueError("method=%s does not support fit_range" % method)
+    compiled = compile_parameters(fitting_parameters)
+    if fit_range is None:
+        # In single precision with initialize_FID(..., precision="single")
+        timeaxis, fid = engine_inputs(fid_parameters)
+    else:
+        timeaxis = fid_parameters.timeaxis
+        fid = np.ascontiguousarray(fid_parameters.fid, dtype=complex)
+    # The fixed peaks are subtracted once, only the other peaks are evaluated in the loop
+    active, fixed_popt = split_fixed_peaks(compiled)
+    if len(fixed_popt):
+        fid = fid - multieq6_array(fixed_popt, timeaxis)
+    workspace = np.empty((len(active.names) // 5, len(timeaxis)), dtype=fid.dtype)
+    band = None if fit_range is None else spectrum_band(fid, fit_range)
+    args = (active, timeaxis, fid, fit_range, workspace, band)
+    fit_kws = {} if fit_kws is None else dict(fit_kws)
+    fit_kws.pop("Dfun", None)
+    if not analytic_jac:
+        fit_kws = finite_difference_steps(method, fit_kws, timeaxis)
+
+    result = MinimizerResult(method=method, aborted=False, errorbars=False)
+    nfev = [0]
+
+    def counted_residual(x, *args):
+        # Count all function evaluations, including finite differences, like lmfit
+        nfev[0] += 1
+        return compiled_residual(x, *args)
+
+    if method in native_methods:
+        unused = set(fit_kws) - {"max_nfev", "xtol", "ftol"}
+        if unused:
+            logger.warning("fit_kws %s are not used by method=%s" % (unused, method))
+        xs, _, niter, status = levenberg_marquardt_batch(
+            compiled.x0[np.newaxis],
+            active,
+            timeaxis,
+            fid[np.newaxis],
+            max_iter=fit_kws.get("max_nfev", 200),
+            xtol=fit_kws.get("xtol", 1e-8),
+            ftol=fit_kws.get("ftol", 1e-8),
+        )
+        x = xs[0]
+        nfev[0] = niter[0]
+        result.success = bool(status[0] == 1)
+        result.status = int(status[0])
+        result.message = batch_status_messages[result.status]
+    elif method == "least_squares":
+        ret = least_squares(
+            counted_residual,
+            compiled.x0,
+            jac=compiled_jacobian if analytic_jac else "2-point",
+            bounds=(compiled.lower, compiled.upper),
+            args=args,
+            **fit_kws,
+        )
+        x = ret.x
+        result.success = ret.success
+        result.status = ret.status
+        result.message = ret.message
+    else:
+        lower, upper = compiled.lower, compiled.upper
+
+        def residual(internal):
+            return counted_residual(from_internal(internal, lower, upper)[0], *args)
+
+        def jacobian(internal):
+            value, grad = from_internal(internal, lower, upper)
+            return compiled_jacobian(value, *args) * grad
+
+        if "max_nfev" in fit_kws:
+            fit_kws["maxfev"] = fit_kws.pop("max_nfev")
+        if analytic_jac:
+            fit_kws["Dfun"] = jacobian
+            # See fitAMARES_kernel, the column scaling of MINPACK stalls near the bounds
+            fit_kws.setdefault("diag", np.ones(len(compiled.x0)))
+        internal, _, _, message, ier = leastsq(
+            residual, to_internal(compiled.x0, lower, upper), full_output=1, **fit_kws
+        )
+        x = from_internal(internal, lower, upper)[0]
+        result.success = ier in [1, 2, 3, 4]
+        result.status = ier
+        result.message = message
+
+    result.nfev = nfev[0]
+    return compiled_result(result, compiled, x, fitting_parameters, args)
+
+
+def compiled_result(result, compiled, x, fitting_parameters, args):
+    """
+    Write the varying parameters found by a compiled fit back to an ``lmfit.MinimizerResult``.
+
+    The statistics, the fitted ``lmfit.Parameters`` and the uncertainties (from the analytic
+    Jacobian, propagated through the linear constraints) are calculated as by lmfit.
+
+    Args:
+        result (lmfit.MinimizerResult): The result with ``method``, ``nfev``, ``success``, ``status`` and ``message`` set.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        x (numpy.ndarray): The fitted varying parameters, ordered as ``compiled.var_names``.
+        fitting_parameters (lmfit.Parameters): The initial fitting parameters.
+        args (tuple): The extra arguments of ``compiled_residual`` and ``compiled_jacobian``, possibly
+          restricted to the peaks that are not fixed (see ``split_fixed_peaks``).
+
+    Returns:
+        lmfit.MinimizerResult: ``result`` with the fitted parameters.
+    """
+    result.var_names = compiled.var_names
+    result.init_vals = list(compiled.x0)
+    result.init_values = dict(zip(compiled.var_names, compiled.x0))
+    result.x = x
+    result.residual = compiled_residual(x, *args).copy()
+    result._calculate_statistics()
+    result.params = deepcopy(fitting_parameters)
+    for name, value in zip(compiled.var_names, x):
+        result.params[name].value = value
+    result.params.update_constraints()
+
+    # Uncertainties from the Jacobian, propagated through the linear constraints
+    result.covar = None
+    try:
+        jac = compiled_jacobian(x, *args)
+        result.covar = np.linalg.inv(jac.T @ jac) * result.redchi
+    except np.linalg.LinAlgError:
+        logger.warning("Cannot estimate the covariance matrix!")
+    if result.covar is not None:
+        stderr = np.sqrt(
+            np.abs(np.diag(compiled.Pmatrix @ result.covar @ compiled.Pmatrix.T))
+        )
+        for name, err in zip(compiled.names, stderr):
+            if name in result.init_values or result.params[name].expr:
+                result.params[name].stderr = err
+        result.errorbars = bool(np.all(np.isfinite(stderr)))
+    return result
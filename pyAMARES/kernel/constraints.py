@@ -0,0 +1,292 @@
+import argparse
+import re
+from collections import OrderedDict
+
+import numpy as np
+import sympy
+from sympy.parsing import sympy_parser
+
+from ..libs.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Parameter layouts, keyed by the constraint structure of the prior knowledge
+_layout_cache = OrderedDict()
+layout_cache_size = 128
+
+
+def get_var_names(params):
+    """
+    Return the names of the parameters that are varied by the optimizer.
+
+    The order is identical to ``lmfit.Minimizer``'s ``var_names``, i.e. the order of
+    the parameters in ``params`` with ``vary=True`` and no ``expr``.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        list of str: Names of the varying parameters.
+    """
+    return [name for name, par in params.items() if par.vary and not par.expr]
+
+
+def constraint_matrix(params):
+    """
+    Build the matrix of partial derivatives of all parameters with respect to the varying parameters.
+
+    The ``expr`` constraints of the prior knowledge (e.g. ``ak_BATP/2`` or ``freq_BATP-15``)
+    are differentiated once with sympy, so that the Jacobian of the model with respect to
+    all ``5 x npeak`` parameters (``Jac6``) can be mapped to the varying parameters by a
+    matrix product. Chained expressions (an ``expr`` that refers to another constrained
+    parameter) are resolved recursively. The derivatives are evaluated at the current
+    parameter values, so they are exact for the linear constraints used by AMARES.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The matrix with shape ``(len(params), nvar)``, where element
+              ``(i, j)`` is the derivative of the i-th parameter with respect to the j-th varying parameter.
+            - list of str: Names of the varying parameters (see ``get_var_names``).
+    """
+    names = list(params.keys())
+    var_names = get_var_names(params)
+    var_index = {name: i for i, name in enumerate(var_names)}
+    values = {sympy.Symbol(name): par.value for name, par in params.items()}
+    rows = {}
+
+    def get_row(name, visiting=()):
+        if name in rows:
+            return rows[name]
+        par = params[name]
+        row = np.zeros(len(var_names))
+        if name in var_index:
+            row[var_index[name]] = 1.0
+        elif par.expr:
+            if name in visiting:
+                raise ValueError("Circular expr found for parameter %s" % name)
+            parsed = sympy_parser.parse_expr(par.expr)
+            for symbol in parsed.free_symbols:
+                if str(symbol) not in params:
+                    # e.g. constants defined in the asteval symtable
+                    continue
+                partial_d = float(sympy.diff(parsed, symbol).subs(values).evalf())
+                row += partial_d * get_row(str(symbol), visiting + (name,))
+        rows[name] = row
+        return row
+
+    Pmatrix = np.array([get_row(name) for name in names]).reshape(
+        len(names), len(var_names)
+    )
+    return Pmatrix, var_names
+
+
+def check_linear_constraints(params):
+    """
+    Check that all ``expr`` constraints are linear in the other parameters.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Raises:
+        ValueError: If an ``expr`` has a non-zero second derivative.
+    """
+    for name, par in params.items():
+        if not par.expr:
+            continue
+        parsed = sympy_parser.parse_expr(par.expr)
+        symbols = [x for x in parsed.free_symbols if str(x) in params]
+        for i, symbol_i in enumerate(symbols):
+            for symbol_j in symbols[i:]:
+                if sympy.diff(parsed, symbol_i, symbol_j) != 0:
+                    raise ValueError(
+                        "expr=%s of parameter %s is not linear!" % (par.expr, name)
+                    )
+
+
+def layout_key(params):
+    """
+    Return the part of the fitting parameters that determines their layout.
+
+    The names, the ``vary`` flags and the ``expr`` strings are fixed for a prior knowledge file
+    (and for the parameters derived from it, e.g. by ``filter_param_by_ppm``), while the values
+    and bounds change from fit to fit.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        tuple: A hashable key.
+    """
+    return tuple((name, bool(par.vary), par.expr) for name, par in params.items())
+
+
+def expr_peak(expr):
+    """
+    Return the peak that an ``expr`` constraint refers to, e.g. ``BATP`` for ``freq_BATP-15``.
+
+    Args:
+        expr (str): The ``expr`` of a parameter.
+
+    Returns:
+        str or None: The name of the peak of the first parameter in ``expr``, None if there is none.
+    """
+    parts = re.split(r"(\W+)", expr)[0].split("_")
+    return parts[1] if len(parts) > 1 else None
+
+
+def parameter_layout(params):
+    """
+    Return the layout of the fitting parameters, built once per prior knowledge structure.
+
+    The layout holds everything that is otherwise reparsed from the ``expr`` strings on every
+    fit or report, e.g. by ``create_pmatrix`` and ``check_removed_expr``. It is cached by
+    ``layout_key``, so all voxels of a dataset that share one prior knowledge file share one layout.
+    At most ``layout_cache_size`` layouts are kept, the least recently used is evicted first.
+    The cached arrays must not be modified.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        argparse.Namespace: A namespace with the following attributes:
+
+            - names (list of str): Names of all parameters.
+            - index (dict): Map from parameter name to its index in ``names``.
+            - peaklist (list of str): Names of the peaks, in the order of ``params``.
+            - var_names (list of str): Names of the varying parameters (see ``get_var_names``).
+            - free (numpy.ndarray): Indices of the varying parameters.
+            - fixed (numpy.ndarray): Indices of the fixed parameters without ``expr``.
+            - expr (numpy.ndarray): Indices of the parameters with ``expr``.
+            - exprs (dict): Map from parameter name to its ``expr``.
+            - expr_peaks (dict): Map from parameter name to the peak its ``expr`` refers to.
+            - linear (bool): True if all ``expr`` constraints are linear.
+            - Pmatrix (numpy.ndarray): The matrix returned by ``constraint_matrix``.
+            - crlb_Pmatrix (numpy.ndarray or None): The prior knowledge matrix of the CRLB calculation,
+              None (identity) if no ``expr`` depends on a varying parameter, as ``create_pmatrix``.
+    """
+    key = layout_key(params)
+    if key in _layout_cache:
+        _layout_cache.move_to_end(key)
+        return _layout_cache[key]
+
+    names = list(params.keys())
+    var_names = get_var_names(params)
+    exprs = {name: par.expr for name, par in params.items() if par.expr}
+    peaklist = list(dict.fromkeys(name.split("_", 1)[1] for name in names))
+    try:
+        check_linear_constraints(params)
+        linear = True
+    except ValueError:
+        linear = False
+    Pmatrix, _ = constraint_matrix(params)
+    expr_rows = [names.index(name) for name in exprs]
+    if np.any(Pmatrix[expr_rows]):
+        crlb_Pmatrix = Pmatrix
+    else:
+        crlb_Pmatrix = None  # No prior knowledge
+    layout = argparse.Namespace(
+        names=names,
+        index={name: i for i, name in enumerate(names)},
+        peaklist=peaklist,
+        var_names=var_names,
+        free=np.array([names.index(name) for name in var_names], dtype=int),
+        fixed=np.array(
+            [
+                i
+                for i, par in enumerate(params.values())
+                if not par.vary and not par.expr
+            ],
+            dtype=int,
+        ),
+        expr=np.array(expr_rows, dtype=int),
+        exprs=exprs,
+        expr_peaks={name: expr_peak(expr) for name, expr in exprs.items()},
+        linear=linear,
+        Pmatrix=Pmatrix,
+        crlb_Pmatrix=crlb_Pmatrix,
+    )
+    if linear:
+        # The derivatives of non-linear constraints depend on the parameter values
+        _layout_cache[key] = layout
+        while len(_layout_cache) > layout_cache_size:
+            _layout_cache.popitem(last=False)
+    return layout
+
+
+def compile_parameters(params):
+    """
+    Compile the fitting parameters into a linear map from the varying parameters.
+
+    The ``expr`` constraints generated by ``generateparameter`` (e.g. J-coupled multiplets)
+    are linear, so the full ``5 x npeak`` parameter vector can be written as
+    ``Pmatrix @ x + offset``, where ``x`` is the plain NumPy vector of the varying parameters
+    and ``offset`` holds the fixed parameters and the constant terms of the constraints.
+    This is done once per fit, so the residual function does not need ``lmfit.Parameters``
+    or its asteval interpreter.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        argparse.Namespace: A namespace with the following attributes:
+
+            - names (list of str): Names of all parameters.
+            - var_names (list of str): Names of the varying parameters (see ``get_var_names``).
+            - Pmatrix (numpy.ndarray): The matrix returned by ``constraint_matrix``.
+            - offset (numpy.ndarray): The constant vector with shape ``(len(params),)``.
+            - x0 (numpy.ndarray): The initial values of the varying parameters.
+            - lower (numpy.ndarray): The lower bounds of the varying parameters.
+            - upper (numpy.ndarray): The upper bounds of the varying parameters.
+
+    Raises:
+        ValueError: If an ``expr`` constraint is not linear.
+    """
+    layout = parameter_layout(params)
+    if not layout.linear:
+        check_linear_constraints(params)  # raise the error
+    Pmatrix, var_names = layout.Pmatrix, layout.var_names
+    values = np.array([par.value for par in params.values()], dtype=float)
+    x0 = np.array([params[name].value for name in var_names], dtype=float)
+    return argparse.Namespace(
+        names=list(params.keys()),
+        var_names=var_names,
+        Pmatrix=Pmatrix,
+        offset=values - Pmatrix @ x0,
+        x0=x0,
+        lower=np.array([params[name].min for name in var_names], dtype=float),
+        upper=np.array([params[name].max for name in var_names], dtype=float),
+    )
+
+
+def split_fixed_peaks(compiled):
+    """
+    Split the compiled parameters into the peaks that depend on the varying parameters and the fixed peaks.
+
+    The FID of the fixed peaks, e.g. all peaks except those selected by ``set_vary_parameters``,
+    does not change during a fit, so it can be subtracted from the data once instead of being
+    recomputed in every residual evaluation.
+
+    Args:
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+
+    Returns:
+        tuple:
+            - argparse.Namespace: A copy of ``compiled`` restricted to the peaks that depend on the
+              varying parameters. ``var_names``, ``x0``, ``lower`` and ``upper`` are unchanged.
+            - numpy.ndarray: The parameter array of the fixed peaks with shape ``(nfixed, 5)``.
+    """
+    nvar = len(compiled.var_names)
+    rows = compiled.Pmatrix.reshape(-1, 5, nvar)
+    offset = compiled.offset.reshape(-1, 5)
+    active = np.any(rows != 0, axis=(1, 2))
+    if np.all(active):
+        return compiled, offset[:0]
+    names = np.array(compiled.names).reshape(-1, 5)
+    active_compiled = argparse.Namespace(**vars(compiled))
+    active_compiled.names = list(names[active].ravel())
+    active_compiled.Pmatrix = rows[active].reshape(-1, nvar)
+    active_compiled.offset = offset[active].ravel()
+    return active_compiled, offset[~active]
@@ -1,4 +1,7 @@
 # import re
+import argparse
+import threading
+
 import matplotlib.pyplot as plt
 import nmrglue as ng
 import numpy as np
@@ -7,6 +10,112 @@ from ..libs.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Time axis bases, keyed by the acquisition geometry (npts, deadtime, dwell time)
+_basis_cache = {}
+# Scratch buffers of the model engine, one set per thread
+_scratch = threading.local()
+# Real floating point types of the model engine, see initialize_FID(precision=...)
+precision_dtypes = {"double": np.float64, "single": np.float32}
+
+
+def complex_dtype(x):
+    """
+    Return the complex type of the model engine for the time axis ``x``.
+
+    The model engine follows the precision of the time axis: ``complex64`` for a ``float32``
+    time axis (see ``engine_inputs``) and ``complex128`` otherwise.
+
+    Args:
+        x (1D array): The time axis.
+
+    Returns:
+        type: ``numpy.complex64`` or ``numpy.complex128``.
+    """
+    return np.complex64 if np.asarray(x).dtype == np.float32 else np.complex128
+
+
+def engine_inputs(fid_parameters, fid=None):
+    """
+    Return the time axis and the FID in the precision of the model engine.
+
+    With ``initialize_FID(..., precision="single")``, the time axis is converted to ``float32``
+    (its basis is cached by ``time_basis`` like the double precision one) and the FID to
+    ``complex64``, so ``multieq6_array`` and ``jacobian_array`` evaluate the model in single precision.
+
+    Args:
+        fid_parameters (argparse.Namespace): The namespace returned by ``initialize_FID``.
+        fid (numpy.ndarray, optional): The complex FID(s). If None, ``fid_parameters.fid`` is used.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The read-only time axis.
+            - numpy.ndarray: The contiguous complex FID(s).
+    """
+    precision = getattr(fid_parameters, "precision", "double")
+    if fid is None:
+        fid = fid_parameters.fid
+    timeaxis = fid_parameters.timeaxis
+    if precision != "double":
+        timeaxis = time_basis(np.asarray(timeaxis, dtype=precision_dtypes[precision])).t
+    return timeaxis, np.ascontiguousarray(fid, dtype=complex_dtype(timeaxis))
+
+
+def time_basis(x):
+    """
+    Return the precomputed, read-only powers of a time axis.
+
+    The time axis only depends on ``sw``, ``deadtime`` and the number of points, so the basis is
+    cached by ``(len(x), x[0], x[1] - x[0])`` and the precision of ``x`` (``float32`` or double),
+    and shared by all fits with the same acquisition geometry. ``equation6_kernel`` and ``jacobian_array`` look it up instead of recomputing
+    ``x * x`` and the other products of the time axis on every call.
+
+    Args:
+        x (1D array): The time axis.
+
+    Returns:
+        argparse.Namespace: A namespace with the read-only arrays ``t`` (a copy of ``x``), ``minus_t`` (``-x``),
+        ``t2`` (``x * x``), ``t2m1`` (``x * x - x``) and ``t2pi`` (``2j * pi * x``), and the cache ``key``.
+    """
+    x = np.asarray(x)
+    dtype = np.float32 if x.dtype == np.float32 else np.float64
+    key = (len(x), float(x[0]), float(x[1] - x[0]) if len(x) > 1 else 0.0, dtype)
+    basis = _basis_cache.get(key)
+    if basis is not None and (basis.t is x or np.array_equal(basis.t, x)):
+        return basis
+    t = np.array(x, dtype=dtype)
+    t2pi = (2j * np.pi * t).astype(complex_dtype(t))
+    basis = argparse.Namespace(
+        key=key, t=t, minus_t=-t, t2=t * t, t2m1=t * t - t, t2pi=t2pi
+    )
+    for array in (basis.t, basis.minus_t, basis.t2, basis.t2m1, basis.t2pi):
+        array.flags.writeable = False
+    if len(_basis_cache) >= 16:
+        _basis_cache.clear()
+    _basis_cache[key] = basis
+    return basis
+
+
+def scratch_buffer(name, shape, dtype=complex):
+    """
+    Return a reusable scratch array of the model engine for the current thread.
+
+    The array is only valid until the next call with the same ``name`` in the same thread,
+    so it must never be returned to the caller.
+
+    Args:
+        name (str): Name of the buffer.
+        shape (tuple): Shape of the buffer.
+        dtype (numpy.dtype, optional): Data type of the buffer. Defaults to complex.
+
+    Returns:
+        numpy.ndarray: An uninitialized array.
+    """
+    buffers = _scratch.__dict__.setdefault("buffers", {})
+    buffer = buffers.get(name)
+    if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+        buffer = buffers[name] = np.empty(shape, dtype=dtype)
+    return buffer
+
 
 def interleavefid(fid):
     """
@@ -19,7 +128,8 @@ def interleavefid(fid):
         numpy.ndarray: A numpy array with interleaved real and imaginary parts of the FID signal.
     """
     if len(fid.shape) == 1:
-        newfid = np.zeros(len(fid) * 2, dtype=float)
+        # float32 for a complex64 FID, see engine_inputs
+        newfid = np.zeros(len(fid) * 2, dtype=np.result_type(fid.real, np.float32))
         newfid[::2] = fid.real
         newfid[1::2] = fid.imag
 
@@ -57,6 +167,27 @@ def uninterleave(fid):
     return fid2
 
 
+def complex_view(arr):
+    """
+    Return the complex array of an interleaved array, without a copy where possible.
+
+    The interleaved outputs of ``multieq6`` and ``Jac6`` are float views of complex arrays, so they
+    are viewed as complex again instead of being copied by ``uninterleave``.
+
+    Args:
+        arr (numpy.ndarray): A 1D or 2D array with interleaved real and imaginary parts along the first axis.
+
+    Returns:
+        numpy.ndarray: The complex array, a view of ``arr`` if its memory layout allows it.
+    """
+    dtype = np.result_type(arr.dtype, np.complex64)
+    if arr.ndim == 1 and arr.flags.c_contiguous:
+        return arr.view(dtype)
+    if arr.ndim == 2 and arr.T.flags.c_contiguous:
+        return arr.T.view(dtype).T
+    return uninterleave(arr)
+
+
 def equation6(x, ak=75, fk=0, dk=50, phi=0, g=0):
     """
     Generate a FID signal according to equation 6 of Vanhamme, L. et al,
@@ -82,49 +213,363 @@ def equation6(x, ak=75, fk=0, dk=50, phi=0, g=0):
     return interleavefid(fid)
 
 
-def multieq6(params, x, fid=None, return_mat=False):
+def params_to_array(params):
+    """
+    Convert the AMARES fitting parameters into a ``(npeak, 5)`` array.
+
+    Args:
+        params (lmfit.Parameters): Object containing the FID signal parameters, ordered as
+          ``ak``, ``freq``, ``dk``, ``phi`` and ``g`` for each peak.
+
+    Returns:
+        numpy.ndarray: An array with shape ``(npeak, 5)``, one row per peak.
+    """
+    xInit = np.fromiter(params.valuesdict().values(), dtype=float)
+    paranum = 5
+    assert np.mod(len(xInit), paranum) == 0  # assert 5 parameters
+    return xInit.reshape(-1, paranum)
+
+
+def equation6_kernel(popt, x, out=None):
+    """
+    Vectorized ``equation6`` for all peaks without the complex amplitude ``ak * exp(1j * phi)``.
+
+    All peaks are evaluated in one broadcast against the time axis. The Gaussian term
+    ``x * x`` is skipped when ``g`` is 0 for all peaks (Lorentzian lineshape). For a ``float32``
+    time axis, the decay and the rotation are evaluated separately by the real ``exp``, ``cos`` and
+    ``sin``, which NumPy vectorizes in single precision, unlike the complex ``exp``.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          Leading batch dimensions, e.g. ``(nvoxel, npeak, 5)``, are broadcast.
+        x (1D array): The time axis.
+        out (numpy.ndarray, optional): Preallocated complex array with shape ``(npeak, len(x))``.
+
+    Returns:
+        numpy.ndarray: Complex array with shape ``(npeak, len(x))``, ``complex64`` for a ``float32`` time axis.
+    """
+    fk, dk, g = popt[..., 1:2], popt[..., 2:3], popt[..., 4:5]
+    if out is None:
+        out = np.empty(popt.shape[:-1] + (len(x),), dtype=complex_dtype(x))
+    if out.dtype == np.complex64:
+        decay = scratch_buffer("decay", out.shape, dtype=np.float32)
+        angle = scratch_buffer("angle", out.shape, dtype=np.float32)
+        np.multiply(-dk * (1 - g), x, out=decay)
+        if np.any(g):
+            np.multiply(dk * g, time_basis(x).t2, out=angle)
+            decay -= angle
+        np.exp(decay, out=decay)
+        np.multiply(2 * np.pi * fk, x, out=angle)
+        np.cos(angle, out=out.real)
+        np.multiply(out.real, decay, out=out.real)
+        np.sin(angle, out=out.imag)
+        np.multiply(out.imag, decay, out=out.imag)
+        return out
+    np.multiply(-dk * (1 - g) + 2j * np.pi * fk, x, out=out)
+    if np.any(g):
+        gaussian = scratch_buffer("gaussian", out.shape, dtype=float)
+        np.multiply(dk * g, time_basis(x).t2, out=gaussian)
+        out -= gaussian
+    np.exp(out, out=out)
+    return out
+
+
+def equation6_array(popt, x, out=None):
+    """
+    Vectorized ``equation6`` that returns the FID of each peak.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+        x (1D array): The time axis.
+        out (numpy.ndarray, optional): Preallocated complex array with shape ``(npeak, len(x))``.
+
+    Returns:
+        numpy.ndarray: Complex array with shape ``(npeak, len(x))``, one FID per peak.
+    """
+    out = equation6_kernel(popt, x, out=out)
+    out *= (popt[..., 0] * np.exp(1j * popt[..., 3]))[..., np.newaxis]
+    return out
+
+
+def multieq6_array(popt, x, out=None, workspace=None):
+    """
+    Vectorized model engine that sums the FIDs of all peaks of equation 6 in one broadcast.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          For a stack of parameters with shape ``(nvoxel, npeak, 5)``, the FIDs of all voxels are returned.
+        x (1D array): The time axis.
+        out (numpy.ndarray, optional): Preallocated complex array with shape ``(len(x),)`` for the summed FID.
+        workspace (numpy.ndarray, optional): Preallocated complex array with shape ``(npeak, len(x))``.
+
+    Returns:
+        numpy.ndarray: The complex summed FID with shape ``(len(x),)``, or ``(nvoxel, len(x))``.
+    """
+    if workspace is None:
+        workspace = scratch_buffer(
+            "kernel", popt.shape[:-1] + (len(x),), dtype=complex_dtype(x)
+        )
+    kernel = equation6_kernel(popt, x, out=workspace)
+    amplitude = (popt[..., 0] * np.exp(1j * popt[..., 3])).astype(kernel.dtype)
+    if popt.ndim == 2:
+        return np.dot(amplitude, kernel, out=out)
+    return np.matmul(amplitude[..., np.newaxis, :], kernel, out=out)[..., 0, :]
+
+
+def multieq6_cached(popt, x, cache, out=None):
+    """
+    ``multieq6_array`` that only recomputes the peaks whose parameters changed since the previous call.
+
+    The FID of each peak is kept in ``cache``, so the peaks that are fixed (see ``set_vary_parameters``)
+    are computed only once per fit, and a finite-difference step of one parameter only recomputes the
+    peaks that depend on it.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+        x (1D array): The time axis.
+        cache (dict): An empty dict before the first call, then passed unchanged to every call of a fit.
+          The peaks are recomputed if ``x`` or the number of peaks differ from the cached ones.
+        out (numpy.ndarray, optional): Preallocated complex array with shape ``(len(x),)`` for the summed FID.
+
+    Returns:
+        numpy.ndarray: The complex summed FID with shape ``(len(x),)``.
+    """
+    cached_x = cache.get("x")
+    if (
+        cached_x is None
+        or cached_x.dtype != x.dtype
+        or not np.array_equal(cached_x, x)
+        or cache["popt"].shape != popt.shape
+    ):
+        peaks = equation6_array(popt, x)
+        ones = np.ones(len(peaks), dtype=peaks.dtype)
+        # A copy, so that a time axis modified in place is not mistaken for the cached one
+        cache.update(x=np.array(x), popt=popt.copy(), peaks=peaks, ones=ones)
+    else:
+        changed = np.any(cache["popt"] != popt, axis=1)
+        if np.any(changed):
+            cache["peaks"][changed] = equation6_array(popt[changed], x)
+            cache["popt"][changed] = popt[changed]
+    # np.sum(peaks, axis=0) would allocate a temporary array of the size of peaks
+    return np.dot(cache["ones"], cache["peaks"], out=out)
+
+
+def multieq6(params, x, fid=None, return_mat=False, cache=None, out=None):
     """
     Combine multiple FID signals according to equation 6 of Vanhamme, L. et al, J Magn Reson 1997,
     129 (1), 35-43.
 
-    This function iterates over subsets of parameters in ``params``, each subset used to generate
-    an FID signal via ``equation6``. The function can return either a matrix of individual FID signals
-    or their sum. An existing FID signal can be subtracted from the sum if provided.
+    The parameters in ``params`` are converted into a ``(npeak, 5)`` array and all peaks are
+    generated by the vectorized ``multieq6_array``. The function can return either a matrix of
+    individual FID signals or their sum. An existing FID signal can be subtracted from the sum if provided.
 
     Args:
         params (dict): Dictionary or similar structure with FID signal parameters.
         x (1D array): The time axis for which the FID signal is generated.
         fid (1D array, optional): Existing FID signal to subtract from the sum of generated FID signals.
         return_mat (bool): If True, returns a matrix of individual FID signals; otherwise, returns their sum.
+        cache (dict, optional, new in 0.3.30): If given, only the peaks whose parameters changed since the
+          previous call with the same ``cache`` are recomputed, see ``multieq6_cached``.
+        out (numpy.ndarray, optional, new in 0.3.30): Preallocated complex array with shape ``(len(x),)``.
+          The summed FID is written into it and its interleaved float view is returned.
 
     Returns:
         1D or 2D array: Array of individual FID signals or their sum, optionally with ``fid`` subtracted.
     """
-    xInit = np.array(list(params.valuesdict().values()))
-    paranum = 5
-    assert np.mod(len(xInit), paranum) == 0  # assert 5 parameters
+    popt = params_to_array(params)
+    if return_mat:
+        return equation6_array(popt, x)
+    if cache is None:
+        fittedfid = multieq6_array(popt, x, out=out)
+    else:
+        fittedfid = multieq6_cached(popt, x, cache, out=out)
+    # A complex array viewed as float is already interleaved
+    fittedfid = fittedfid.view(fittedfid.real.dtype)
+    if fid is not None:
+        return fittedfid - interleavefid(fid)
+    return fittedfid
 
-    fidmat = []
-    for counter in range(
-        len(xInit) // paranum
-    ):  # Each peak must have identical number of parameters
-        args = xInit[counter * paranum : (counter + 1) * paranum]
-        equation_result = equation6(x, *args)
 
-        if return_mat:
-            fidmat.append(uninterleave(equation_result))
-        else:
-            fidmat.append(equation_result)
+def jacobian_array(popt, x, include_g=True):
+    """
+    Vectorized Jacobian of ``multieq6_array`` with respect to all parameters.
 
-    fids = np.array(fidmat)
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          Leading batch dimensions, e.g. ``(nvoxel, npeak, 5)``, are broadcast.
+        x (1D array): The time axis.
+        include_g (bool, optional): If False, the derivative with respect to ``g`` is excluded (see ``Jac6c``).
 
-    if return_mat:
-        return fids
+    Returns:
+        numpy.ndarray: Complex array with shape ``(npeak * 5, len(x))`` (or ``(npeak * 4, len(x))``
+        if ``include_g`` is False), i.e. the transposed complex Jacobian.
+    """
+    ak, dk, phi = popt[..., 0:1], popt[..., 2:3], popt[..., 3:4]
+    g = np.clip(popt[..., 4:5], 0.0, 1.0)
+    nparam = 5 if include_g else 4
+    basis = time_basis(x)
+
+    jacobian = np.empty(popt.shape[:-1] + (nparam, len(x)), dtype=complex_dtype(x))
+    d_amp = equation6_kernel(popt, x, out=jacobian[..., 0, :])
+    d_amp *= np.exp(1j * phi)
+    inputfids = np.multiply(
+        d_amp, ak, out=scratch_buffer("inputfids", d_amp.shape, dtype=d_amp.dtype)
+    )
+    np.multiply(inputfids, basis.t2pi, out=jacobian[..., 1, :])  # d_freq
+    # d_damp = -inputfids * x * (g * x - g + 1) = -inputfids * (x + g * (x * x - x))
+    if np.any(g):
+        factor = scratch_buffer("factor", inputfids.shape, dtype=basis.t.dtype)
+        np.multiply(-g, basis.t2m1, out=factor)
+        factor -= basis.t
     else:
-        fittedfid = np.sum(fids, axis=0)
-        if fid is not None:
-            return fittedfid - interleavefid(fid)
-        return fittedfid
+        factor = basis.minus_t
+    np.multiply(inputfids, factor, out=jacobian[..., 2, :])  # d_damp
+    np.multiply(inputfids, 1j, out=jacobian[..., 3, :])  # d_ph
+    if include_g:
+        factor = scratch_buffer("factor", inputfids.shape, dtype=basis.t.dtype)
+        np.multiply(-dk, basis.t2m1, out=factor)
+        np.multiply(inputfids, factor, out=jacobian[..., 4, :])  # d_g
+    return jacobian.reshape(popt.shape[:-2] + (-1, len(x)))
+
+
+def band_bins(npts, fit_range):
+    """
+    Return the DFT bins of a slice of the spectrum in NMR order (``ng.proc_base.fft``).
+
+    Args:
+        npts (int): Number of points of the FID.
+        fit_range (tuple): Indices ``(start, stop)`` of the slice of the spectrum.
+
+    Returns:
+        numpy.ndarray: The indices of the corresponding bins of ``numpy.fft.fft``.
+    """
+    return np.fft.fftshift(np.arange(npts))[fit_range[0] : fit_range[1]]
+
+
+def spectrum_band(fid, fit_range):
+    """
+    Return the DFT bins and the spectrum of an FID in the slice ``fit_range``.
+
+    Args:
+        fid (1D array): The complex FID.
+        fit_range (tuple): Indices ``(start, stop)`` of the slice of the spectrum.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The DFT bins, see ``band_bins``.
+            - numpy.ndarray: The complex spectrum ``ng.proc_base.fft(fid)[start:stop]``.
+    """
+    spec = ng.proc_base.fft(np.asarray(fid, dtype=complex))
+    return band_bins(len(fid), fit_range), spec[fit_range[0] : fit_range[1]]
+
+
+def band_sums(popt, x, bins, order=2):
+    """
+    Closed-form DFT of the Lorentzian FIDs of all peaks (and of their products with ``x`` and ``x * x``)
+    at the given bins.
+
+    With ``x[j] = x[0] + j * dt`` and ``u = exp((-dk + 2j * pi * fk) * dt - 2j * pi * bins / npts)``,
+    the DFT of ``x**k * exp((-dk + 2j * pi * fk) * x)`` is a finite geometric series in ``u``. The
+    sums are evaluated in O(1) per peak and bin, so the cost is proportional to the number of bins
+    rather than the number of points. Where ``u`` is within ``1 / npts`` of 1 (a very narrow line
+    on a bin), the series is summed explicitly.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          Leading batch dimensions are broadcast. ``g`` is ignored.
+        x (1D array): The uniformly sampled time axis.
+        bins (numpy.ndarray): The DFT bins, see ``band_bins``.
+        order (int, optional): Highest power of ``x``, 0, 1 or 2. Defaults to 2.
+
+    Returns:
+        list of numpy.ndarray: ``order + 1`` complex arrays with shape ``(npeak, len(bins))``.
+    """
+    npts = len(x)
+    dt = (x[-1] - x[0]) / (npts - 1)
+    s = (-popt[..., 2] + 2j * np.pi * popt[..., 1])[..., np.newaxis]
+    u = np.exp(s * dt - 2j * np.pi * bins / npts)
+    un = np.exp(s * dt * npts)  # u ** npts
+    near = np.abs(1 - u) * npts < 1
+    v = 1 / np.where(near, 1, 1 - u)
+    # Sums of j**k * u**j for j = 0, ..., npts - 1
+    q = [(1 - un) * v]
+    if order > 0:
+        q.append(v * (q[0] - 1 - (npts - 1) * un))
+    if order > 1:
+        q.append(v * (2 * q[1] - q[0] + 1 - (npts - 1) ** 2 * un))
+    if np.any(near):
+        j = np.arange(npts)
+        powers = u[near][:, np.newaxis] ** j
+        for k in range(order + 1):
+            q[k][near] = powers @ (j**k).astype(float)
+    t0 = x[0]
+    sums = [q[0]]
+    if order > 0:
+        sums.append(t0 * q[0] + dt * q[1])
+    if order > 1:
+        sums.append(t0 * t0 * q[0] + 2 * t0 * dt * q[1] + dt * dt * q[2])
+    start = np.exp(s * t0)
+    return [start * total for total in sums]
+
+
+def multieq6_band(popt, x, bins):
+    """
+    DFT of ``multieq6_array`` at the given bins, without a full FFT.
+
+    Lorentzian peaks (``g`` is 0 for all peaks) are evaluated in closed form by ``band_sums``.
+    Otherwise, the FID is generated and Fourier transformed.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          Leading batch dimensions are broadcast.
+        x (1D array): The uniformly sampled time axis.
+        bins (numpy.ndarray): The DFT bins, see ``band_bins``.
+
+    Returns:
+        numpy.ndarray: The complex spectrum with shape ``(len(bins),)``.
+    """
+    if np.any(popt[..., 4]):
+        return np.fft.fft(multieq6_array(popt, x), axis=-1)[..., bins]
+    (s0,) = band_sums(popt, x, bins, order=0)
+    amplitude = popt[..., 0] * np.exp(1j * popt[..., 3])
+    return np.matmul(amplitude[..., np.newaxis, :], s0)[..., 0, :]
+
+
+def jacobian_band(popt, x, bins, include_g=True):
+    """
+    DFT of ``jacobian_array`` at the given bins, without a full FFT.
+
+    Lorentzian peaks (``g`` is 0 for all peaks) are evaluated in closed form by ``band_sums``.
+    Otherwise, the Jacobian is generated in the time domain and Fourier transformed.
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(npeak, 5)``, see ``params_to_array``.
+          Leading batch dimensions are broadcast.
+        x (1D array): The uniformly sampled time axis.
+        bins (numpy.ndarray): The DFT bins, see ``band_bins``.
+        include_g (bool, optional): If False, the derivative with respect to ``g`` is excluded.
+
+    Returns:
+        numpy.ndarray: Complex array with shape ``(npeak * 5, len(bins))`` (or ``(npeak * 4, len(bins))``
+        if ``include_g`` is False).
+    """
+    if np.any(popt[..., 4]):
+        jacobian = jacobian_array(popt, x, include_g=include_g)
+        return np.fft.fft(jacobian, axis=-1)[..., bins]
+    ak, dk = popt[..., 0:1], popt[..., 2:3]
+    nparam = 5 if include_g else 4
+    sums = band_sums(popt, x, bins, order=2 if include_g else 1)
+
+    phase = np.exp(1j * popt[..., 3:4])
+    jacobian = np.empty(popt.shape[:-1] + (nparam, len(bins)), dtype=complex)
+    d_amp = np.multiply(sums[0], phase, out=jacobian[..., 0, :])
+    first = ak * phase * sums[1]  # DFT of x * inputfids
+    np.multiply(first, 2j * np.pi, out=jacobian[..., 1, :])  # d_freq
+    np.negative(first, out=jacobian[..., 2, :])  # d_damp
+    np.multiply(d_amp, 1j * ak, out=jacobian[..., 3, :])  # d_ph
+    if include_g:
+        np.multiply(ak * phase * dk, sums[1] - sums[2], out=jacobian[..., 4, :])  # d_g
+    return jacobian.reshape(popt.shape[:-2] + (-1, len(bins)))
 
 
 def Jac6(params, x, fid=None):
@@ -142,38 +587,9 @@ def Jac6(params, x, fid=None):
     Returns:
         numpy.ndarray: The interleaved Jacobian matrix of the FID signals with respect to the parameters.
     """
-    poptall = list(params.valuesdict().values())
-    ak = np.array(poptall[::5])
-    dk = np.array(poptall[2::5])
-    g = np.array(poptall[4::5])
-
-    # if len(g[g > 1]) > 0:
-    #     print("Warning, g>1", g)
-    # if len(g[g < 0]):
-    #     print("warning! g<0", g)
-    g[g > 1] = 1.0
-    g[g < 0] = 0.0
-
-    inputfids = multieq6(params, x, return_mat=True).T
-    assert len(inputfids.shape) == 2
-    pts, npeak = inputfids.shape
-    x2 = np.tile(x, (npeak, 1)).T
-
-    d_freq = inputfids * 2j * np.pi * x2
-    d_damp = -1 * inputfids * x2 * (g * x2 - g + 1)
-    d_amp = inputfids * 1 / ak
-    d_ph = inputfids * 1j
-    d_g = -1 * dk * (x2 - 1) * x2 * inputfids
-
-    jacobian = np.zeros((pts, npeak * 5), dtype=complex)
-
-    jacobian[:, 0::5] = d_amp
-    jacobian[:, 1::5] = d_freq
-    jacobian[:, 2::5] = d_damp
-    jacobian[:, 3::5] = d_ph
-    jacobian[:, 4::5] = d_g
-
-    return interleavefid(jacobian)
+    jacobian = jacobian_array(params_to_array(params), x)
+    # Interleaved, shape (2 * len(x), npeak * 5)
+    return jacobian.view(jacobian.real.dtype).T
 
 
 def Jac6c(params, x, fid=None):
@@ -192,36 +608,9 @@ def Jac6c(params, x, fid=None):
         numpy.ndarray: The interleaved Jacobian matrix of the FID signals with respect to the parameters,
                        excluding the lineshape parameter ``g``.
     """
-    poptall = list(params.valuesdict().values())
-    ak = np.array(poptall[::5])
-    dk = np.array(poptall[2::5])  # noqa F841
-    g = np.array(poptall[4::5])
-
-    # if len(g[g > 1]) > 0:
-    #     print("Warning, g>1", g)
-    # if len(g[g < 0]):
-    #     print("warning! g<0", g)
-    g[g > 1] = 1.0
-    g[g < 0] = 0.0
-
-    inputfids = multieq6(params, x, return_mat=True).T
-    assert len(inputfids.shape) == 2
-    pts, npeak = inputfids.shape
-    x2 = np.tile(x, (npeak, 1)).T
-
-    d_freq = inputfids * 2j * np.pi * x2
-    d_damp = -1 * inputfids * x2 * (g * x2 - g + 1)
-    d_amp = inputfids * 1 / ak
-    d_ph = inputfids * 1j
-
-    jacobian = np.zeros((pts, npeak * 4), dtype=complex)
-
-    jacobian[:, 0::4] = d_amp
-    jacobian[:, 1::4] = d_freq
-    jacobian[:, 2::4] = d_damp
-    jacobian[:, 3::4] = d_ph
-    # jacobian[:, 4::5] = d_g
-    return interleavefid(jacobian)
+    jacobian = jacobian_array(params_to_array(params), x, include_g=False)
+    # Interleaved, shape (2 * len(x), npeak * 4)
+    return jacobian.view(jacobian.real.dtype).T
 
 
 def fft_params(timeaxis, params, fid=False, return_mat=False):
@@ -244,10 +633,11 @@ def fft_params(timeaxis, params, fid=False, return_mat=False):
     # parmas is the lmfit Parameters() style
     if return_mat:
         return multieq6(params, timeaxis, return_mat=return_mat)
+    fittedfid = multieq6_array(params_to_array(params), timeaxis)
     if fid:
-        return uninterleave(multieq6(params, timeaxis, return_mat=return_mat))
+        return fittedfid
     # spec = np.fft.fftshift(np.fft.fft((uninterleave(multieq6(params, timeaxis)))))
-    spec = ng.proc_base.fft((uninterleave(multieq6(params, timeaxis))))
+    spec = ng.proc_base.fft(fittedfid)
     return spec
 
 
@@ -417,7 +807,7 @@ def simulate_fid(
     deadtime = float(deadtime)
     dwelltime = 1.0 / sw  # noqa F841  #place holder
     timeaxis = np.arange(0, dwelltime * fid_len, dwelltime) + deadtime  # timeaxis
-    fidsim = uninterleave(multieq6(x=timeaxis, params=params))
+    fidsim = multieq6_array(params_to_array(params), timeaxis)
     if snr_target is not None:
         fidsim = add_noise_FID(fidsim, snr_target, indsignal, pts_noise)
     if preview:
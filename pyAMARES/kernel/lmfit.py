@@ -1,4 +1,3 @@
-import re
 from datetime import datetime
 
 import numpy as np
@@ -6,13 +5,30 @@ import pandas as pd
 from lmfit import Minimizer, Parameters
 
 from ..libs.logger import get_logger
-from .fid import Compare_to_OXSA, fft_params
-from .objective_func import default_objective
+from .compiled import (
+    compiled_methods,
+    compiled_objectives,
+    finite_difference_steps,
+    fit_compiled,
+    native_methods,
+    scipy_methods,
+)
+from .constraints import expr_peak, parameter_layout
+from .fid import Compare_to_OXSA, engine_inputs, fft_params, spectrum_band
+from .multistart import fit_multistart
+from .objective_func import (
+    default_objective,
+    get_analytic_jacobian,
+    objective_range,
+    objective_workspace,
+)
+from .result import AMARESResult, FIDNamespace
+from .varpro import fit_varpro
 
 logger = get_logger(__name__)
 
 
-def check_removed_expr(df):
+def check_removed_expr(df, layout=None):
     """
     Checks if the expression ('expr') for all parameters in a ftting parameter
     Dataframe is restricted to a parameter that has already been filtered out.
@@ -23,6 +39,8 @@ def check_removed_expr(df):
 
     Args:
         df (pandas.DataFrame): The fitting parameters
+        layout (argparse.Namespace, optional): The ``parameter_layout`` of the parameters before filtering,
+          used to look up the peak that each ``expr`` refers to instead of parsing it again.
 
     Returns:
         pandas.DataFrame: A copy of the input DataFrame with updated 'expr' column
@@ -40,8 +58,11 @@ def check_removed_expr(df):
     def correct_expr(row):
         if row["expr"] is None:
             return row["expr"], row["vary"]
-        parts = re.split(r"(\W+)", row["expr"])
-        if parts[0].split("_")[1] not in peaklist:
+        if layout is not None and row["name"] in layout.expr_peaks:
+            peak = layout.expr_peaks[row["name"]]
+        else:
+            peak = expr_peak(row["expr"])
+        if peak not in peaklist:
             # warnings.warn(f"{row['name'].split('_')[1]} is already removed! Parameters restrained to it will be set to vary.", UserWarning)
             logger.warning(
                 f"{row['name'].split('_')[1]} is already removed! Parameters restrained to it will be set to vary."
@@ -73,20 +94,20 @@ def filter_param_by_ppm(allpara, fit_ppm, MHz, delta=100):
     fit_Hz = np.array(fit_ppm) * MHz
     # print(f"{fit_Hz=}")
     logger.info("fit_Hz=%s" % fit_Hz)
-    tofilter_pd = parameters_to_dataframe(allpara)
-    chemshift_pd = tofilter_pd[tofilter_pd["name"].str.startswith("freq")]
-
-    filtered_df = chemshift_pd[
-        (chemshift_pd["value"] > np.min(fit_Hz) - delta)
-        & (chemshift_pd["value"] < np.max(fit_Hz) + delta)
+    layout = parameter_layout(allpara)
+    suffixes = [
+        peak
+        for peak in layout.peaklist
+        if np.min(fit_Hz) - delta
+        < allpara["freq_" + peak].value
+        < np.max(fit_Hz) + delta
     ]
-
-    suffixes = [x.replace("freq_", "") for x in filtered_df["name"]]
+    tofilter_pd = parameters_to_dataframe(allpara)
     return_filtered_df = tofilter_pd[
         tofilter_pd["name"].apply(lambda x: any(x.endswith(s) for s in suffixes))
     ]
     # Remove the expr if it is mathmatically restrained to another parameter that has already been removed.
-    return_filtered_df = check_removed_expr(return_filtered_df)
+    return_filtered_df = check_removed_expr(return_filtered_df, layout=layout)
     return dataframe_to_parameters(return_filtered_df)
 
 
@@ -327,6 +348,10 @@ def fitAMARES_kernel(
     method="least_squares",
     fit_range=None,
     fit_kws=None,
+    analytic_jac=False,
+    compiled=False,
+    varpro=False,
+    multistart=0,
 ):
     """
     Core fitting routine for the AMARES algorithm using a specified objective function and fitting parameters.
@@ -336,20 +361,37 @@ def fitAMARES_kernel(
         fitting_parameters (lmfit.Parameters): Parameters for the fitting process.
         objective_func (function): The objective function to be minimized, should take at least the fitting parameters and additional data as arguments.
         method (str, optional): Minimization method used by lmfit.Minimizer. Defaults to 'least_squares'.
+          ``native`` (new in 0.3.30) selects the built-in Levenberg-Marquardt solver of the compiled mode,
+          see ``pyAMARES.kernel.compiled.fit_compiled``.
         fit_range (tuple or None, optional): Indices specifying the fitting range on the ppm scale. Uses full range if None.
         fit_kws (dict, optional): Options to pass to the lmfit.Minimizer
+        analytic_jac (bool, optional, default False, new in 0.3.30): If True, the analytic Jacobian
+          of ``objective_func`` (see ``pyAMARES.kernel.objective_func.get_analytic_jacobian``) is passed
+          to the minimizer instead of finite differences. Only ``default_objective`` and ``objective_range``
+          are supported; other objective functions, and ``expr`` constraints that are not linear,
+          fall back to finite differences.
+        compiled (bool, optional, default False, new in 0.3.30): If True, the ``expr`` constraints
+          are compiled once into a linear map and the fit runs on a plain NumPy vector without
+          ``lmfit.Parameters`` in the inner loop (see ``pyAMARES.kernel.compiled.fit_compiled``).
+          Only ``default_objective`` and ``objective_range`` with ``least_squares`` or ``leastsq``
+          are supported; otherwise the lmfit.Minimizer is used, with ``default_objective`` keeping the
+          FID of each peak between calls (see ``pyAMARES.kernel.fid.multieq6_cached``).
+        varpro (bool, optional, default False, new in 0.3.30): If True, the amplitudes (and the phases
+          where the prior knowledge allows it) are solved by linear least squares inside each residual
+          evaluation, so the optimizer only sees the nonlinear parameters (see ``pyAMARES.kernel.varpro.fit_varpro``).
+          Only ``default_objective`` over the full time domain with ``least_squares`` or ``leastsq`` is supported;
+          otherwise ``compiled`` and ``analytic_jac`` are used.
+        multistart (int, optional, default 0, new in 0.3.30): If larger than 1, the number of starting points
+          fitted concurrently by ``pyAMARES.kernel.multistart.fit_multistart`` within the bounds of
+          ``fitting_parameters``. The best candidate is then refined by ``method`` (it is returned as is
+          for ``native``), and the statistics of all candidates are attached as ``multistart``. Only
+          ``default_objective`` over the full time domain is supported.
 
     Returns:
         lmfit.MinimizerResult: Object containing the fitting results.
     """
     timebefore = datetime.now()
-    if fit_range is None:
-        min_obj = Minimizer(
-            objective_func,
-            fitting_parameters,
-            fcn_kws={"x": fid_parameters.timeaxis, "fid": fid_parameters.fid},
-        )
-    else:
+    if fit_range is not None:
         from ..util import get_ppm_limit
 
         fit_range = get_ppm_limit(fid_parameters.ppm, fit_range)
@@ -358,15 +400,140 @@ def fitAMARES_kernel(
             "Fitting range %s ppm to %s ppm!"
             % (fid_parameters.ppm[fit_range[0]], fid_parameters.ppm[fit_range[1]])
         )
-        min_obj = Minimizer(
-            objective_func,
-            fitting_parameters,
-            fcn_kws={
-                "x": fid_parameters.timeaxis,
-                "fid": fid_parameters.fid,
-                "fit_range": fit_range,
-            },
-        )
+    if multistart > 1:
+        best = None
+        if objective_func is default_objective and fit_range is None:
+            try:
+                best = fit_multistart(
+                    fid_parameters,
+                    fitting_parameters,
+                    nstarts=multistart,
+                    fit_kws=fit_kws,
+                )
+            except ValueError as error:
+                logger.warning("Cannot use the multi-start mode: %s" % error)
+        else:
+            logger.warning(
+                "The multi-start mode does not support objective_func=%s with fit_range=%s!"
+                % (objective_func, fit_range)
+            )
+        if best is not None:
+            if method in native_methods:
+                return best
+            out_obj = fitAMARES_kernel(
+                fid_parameters,
+                best.params,
+                objective_func,
+                method,
+                fit_range,
+                fit_kws=fit_kws,
+                analytic_jac=analytic_jac,
+                compiled=compiled,
+                varpro=varpro,
+            )
+            out_obj.multistart = best.multistart
+            return out_obj
+        logger.warning("Fit from the initial values only!")
+    if varpro:
+        out_obj = None
+        if (
+            objective_func is default_objective
+            and fit_range is None
+            and method in scipy_methods
+        ):
+            try:
+                out_obj = fit_varpro(
+                    fid_parameters, fitting_parameters, method=method, fit_kws=fit_kws
+                )
+            except ValueError as error:
+                logger.warning("Cannot use VARPRO: %s" % error)
+        else:
+            logger.warning(
+                "VARPRO does not support objective_func=%s with method=%s and fit_range=%s!"
+                % (objective_func, method, fit_range)
+            )
+        if out_obj is not None:
+            timeafter = datetime.now()
+            logger.info(
+                "VARPRO fitting with method=%s took %s seconds"
+                % (method, (timeafter - timebefore).total_seconds())
+            )
+            return out_obj
+        logger.warning("Fit all parameters instead!")
+    if method in native_methods:
+        compiled = True  # The native solver runs on the compiled parameters only
+    if compiled:
+        if objective_func in compiled_objectives and method in compiled_methods:
+            try:
+                out_obj = fit_compiled(
+                    fid_parameters,
+                    fitting_parameters,
+                    method=method,
+                    fit_range=fit_range,
+                    fit_kws=fit_kws,
+                    analytic_jac=analytic_jac,
+                )
+            except ValueError as error:
+                logger.warning("Cannot compile the fitting parameters: %s" % error)
+                out_obj = None
+        else:
+            logger.warning(
+                "The compiled mode does not support objective_func=%s with method=%s!"
+                % (objective_func, method)
+            )
+            out_obj = None
+        if out_obj is not None:
+            timeafter = datetime.now()
+            logger.info(
+                "Compiled fitting with method=%s took %s seconds"
+                % (method, (timeafter - timebefore).total_seconds())
+            )
+            return out_obj
+        if method in native_methods:
+            raise ValueError(
+                "method=%s requires default_objective without fit_range and linear expr constraints"
+                % method
+            )
+        logger.warning("Use the lmfit.Minimizer instead!")
+    if analytic_jac:
+        jacobian = get_analytic_jacobian(objective_func, fitting_parameters)
+        if jacobian is None:
+            logger.warning(
+                "There is no analytic Jacobian for objective_func=%s with these "
+                "parameters, use finite differences instead!" % objective_func
+            )
+        else:
+            fit_kws = {} if fit_kws is None else dict(fit_kws)
+            fit_kws["Dfun"] = jacobian
+            if method == "leastsq" and "diag" not in fit_kws:
+                # With an exact Jacobian, the automatic column scaling of MINPACK
+                # collapses the trust region as soon as a bounded parameter approaches
+                # its limit, where the gradient of lmfit's bound transform vanishes.
+                nvar = jacobian.keywords["Pmatrix"].shape[1]
+                fit_kws["diag"] = np.ones(nvar)
+    if fit_range is None:
+        # In single precision with initialize_FID(..., precision="single")
+        timeaxis, fid = engine_inputs(fid_parameters)
+        fcn_kws = {"x": timeaxis, "fid": fid}
+        if fit_kws is None or "Dfun" not in fit_kws:
+            fit_kws = finite_difference_steps(method, fit_kws, timeaxis)
+        if objective_func is default_objective:
+            # The FID is interleaved once per fit and the model is written into a reused buffer
+            fcn_kws["workspace"] = objective_workspace(fid, timeaxis)
+            if compiled:
+                # Only the peaks whose parameters changed are recomputed, see multieq6_cached
+                fcn_kws["cache"] = {}
+        min_obj = Minimizer(objective_func, fitting_parameters, fcn_kws=fcn_kws)
+    else:
+        fcn_kws = {
+            "x": fid_parameters.timeaxis,
+            "fid": fid_parameters.fid,
+            "fit_range": fit_range,
+        }
+        if objective_func is objective_range:
+            # The spectrum of the FID in the fitting range is computed only once
+            fcn_kws["band"] = spectrum_band(fid_parameters.fid, fit_range)
+        min_obj = Minimizer(objective_func, fitting_parameters, fcn_kws=fcn_kws)
 
     if fit_kws is not None:
         out_obj = min_obj.minimize(method=method, **fit_kws)
@@ -392,6 +559,12 @@ def fitAMARES(
     plotParameters=None,
     initialize_with_lm=False,
     fit_kws=None,
+    analytic_jac=False,
+    compiled=False,
+    lightweight=False,
+    lazy_report=False,
+    varpro=False,
+    multistart=0,
 ):
     """
     Fit the AMARES algorithm to the given FID parameters and fitting parameters.
@@ -418,14 +591,38 @@ def fitAMARES(
 
             If None, default parameters defined in fid_parameters.plotParameters are used.
 
+        fit_kws (dict, optional): Options to pass to the lmfit.Minimizer. If None, ``max_nfev``, ``xtol`` and ``ftol`` are autogenerated.
+        analytic_jac (bool, optional, default False, new in 0.3.30): If True, use the analytic Jacobian
+          instead of finite differences. See ``fitAMARES_kernel`` for details.
+        compiled (bool, optional, default False, new in 0.3.30): If True, fit on a compiled linear
+          map of the parameters instead of ``lmfit.Parameters``. See ``fitAMARES_kernel`` for details.
+        lightweight (bool, optional, default False, new in 0.3.30): If True, neither ``fid_parameters`` is
+          copied or modified nor the reports are generated. A compact ``AMARESResult`` record is returned instead,
+          whose reports are built only when accessed. ``ifplot``, ``inplace`` and ``plotParameters`` are not used.
+        lazy_report (bool, optional, default False, new in 0.3.30): If True, only the CRLBs (``fid_parameters.crlb``)
+          are calculated with NumPy (see ``pyAMARES.util.crlb.numeric_crlb``). ``result_multiplets``, ``result_sum``,
+          ``styled_df``, ``simple_df`` and ``amares_to_plot_pd`` are generated by ``report_amares`` when one of them is
+          accessed for the first time. Requires the ``FIDNamespace`` returned by ``initialize_FID``.
+        varpro (bool, optional, default False, new in 0.3.30): If True, solve the amplitudes and phases by
+          variable projection inside the nonlinear fit. See ``fitAMARES_kernel`` for details.
+        multistart (int, optional, default 0, new in 0.3.30): If larger than 1, fit this number of starting points
+          within the bounds concurrently and start from the best one. With ``initialize_with_lm``, only the
+          initializer is multi-started. See ``fitAMARES_kernel`` for details.
+
     Returns:
         If ``inplace=True``, the function returns the lmfit.MinimizerResult object while the input ``fid_parameters`` is modified in place.
         Otherwise, the function returns the modified ``fid_parameters`` instead of modifying ``fid_parameters`` inplace.
+        If ``lightweight=True``, the function returns a ``pyAMARES.kernel.result.AMARESResult``.
 
     """
+    from ..util.crlb import numeric_crlb
     from ..util.report import report_amares
 
-    if inplace:
+    if lightweight:
+        logger.info(
+            "Return a lightweight AMARESResult, fid_parameters is not modified!"
+        )
+    elif inplace:
         logger.info("The fid_parameters will be modified inplace!")
     else:
         from copy import deepcopy
@@ -452,6 +649,10 @@ def fitAMARES(
             method,
             fit_range,
             fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+            compiled=compiled,
+            varpro=varpro,
+            multistart=multistart,
         )  # fitting kernel
     else:
         logger.info(
@@ -465,6 +666,10 @@ def fitAMARES(
             "leastsq",
             fit_range,
             fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+            compiled=compiled,
+            varpro=varpro,
+            multistart=multistart,
         )  # initializer
         out_obj = fitAMARES_kernel(
             fid_parameters,
@@ -473,10 +678,29 @@ def fitAMARES(
             method,
             fit_range,
             fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+            compiled=compiled,
+            varpro=varpro,
         )  # fitting kernel
+        if hasattr(params_LM, "multistart"):
+            out_obj.multistart = params_LM.multistart
 
-    # report_fit(out_obj)
-    report_amares(out_obj.params, fid_parameters, verbose=False)  # CRLB estimation
+    if lightweight:
+        return AMARESResult.from_minimizer_result(
+            out_obj, fid_parameters, fitting_parameters
+        )
+    if lazy_report and not isinstance(fid_parameters, FIDNamespace):
+        logger.warning(
+            "lazy_report requires the FIDNamespace returned by initialize_FID, "
+            "generate the reports now!"
+        )
+        lazy_report = False
+    if lazy_report:
+        fid_parameters.defer_report(out_obj.params)
+        fid_parameters.crlb = numeric_crlb(out_obj.params, fid_parameters)
+    else:
+        # report_fit(out_obj)
+        report_amares(out_obj.params, fid_parameters, verbose=False)  # CRLB estimation
     resultfid = fft_params(fid_parameters.timeaxis, out_obj.params, fid=True)
     print_lmfit_fitting_results(
         out_obj
@@ -484,16 +708,10 @@ def fitAMARES(
     fid_parameters.resNormSq, fid_parameters.relativeNorm = Compare_to_OXSA(
         inputfid=fid_parameters.fid, resultfid=resultfid
     )
-    amares_to_plot_pd = fid_parameters.result_multiplets[
-        ["chem shift(ppm)"]
-    ].copy()  # Make a copy here
-    amares_to_plot_pd.loc[:, "id"] = range(len(amares_to_plot_pd))
-    amares_to_plot_pd.loc[:, "name"] = amares_to_plot_pd.index
-    amares_to_plot_pd = amares_to_plot_pd.copy()  # avoid SettingWithCopyWarning
-    amares_to_plot_pd.set_index("id", inplace=True)
-    amares_to_plot_pd.columns = ["freq", "name"]
-
-    fid_parameters.amares_to_plot_pd = amares_to_plot_pd
+    if not lazy_report:
+        fid_parameters.amares_to_plot_pd = amares_to_plot_dataframe(
+            fid_parameters.result_multiplets
+        )
     fid_parameters.fitted_fid = fft_params(
         timeaxis=fid_parameters.timeaxis, params=out_obj.params, fid=True
     )
@@ -510,6 +728,27 @@ def fitAMARES(
         return fid_parameters
 
 
+def amares_to_plot_dataframe(result_multiplets):
+    """
+    Create the table of peak names and chemical shifts used to label the peaks in ``plotAMARES``.
+
+    Args:
+        result_multiplets (pandas.DataFrame): The ``result_multiplets`` generated by ``report_amares``.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with the columns ``freq`` (ppm) and ``name``.
+    """
+    amares_to_plot_pd = result_multiplets[
+        ["chem shift(ppm)"]
+    ].copy()  # Make a copy here
+    amares_to_plot_pd.loc[:, "id"] = range(len(amares_to_plot_pd))
+    amares_to_plot_pd.loc[:, "name"] = amares_to_plot_pd.index
+    amares_to_plot_pd = amares_to_plot_pd.copy()  # avoid SettingWithCopyWarning
+    amares_to_plot_pd.set_index("id", inplace=True)
+    amares_to_plot_pd.columns = ["freq", "name"]
+    return amares_to_plot_pd
+
+
 def plotAMARES(fid_parameters, fitted_params=None, plotParameters=None, filename=None):
     """
     Plots the results of AMARES fitting.
@@ -0,0 +1,233 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from lmfit.minimizer import MinimizerResult
+
+from ..libs.logger import get_logger
+from .batch import batch_status_messages, levenberg_marquardt_batch
+from .compiled import compiled_result
+from .constraints import compile_parameters, split_fixed_peaks
+from .fid import engine_inputs, multieq6_array
+
+logger = get_logger(__name__)
+
+sampling_methods = ("sobol", "lhs")
+
+
+def latin_hypercube(nsamples, ndim, rng):
+    """
+    Latin hypercube sample of the unit hypercube.
+
+    Args:
+        nsamples (int): Number of samples.
+        ndim (int): Number of dimensions.
+        rng (numpy.random.Generator): The random number generator.
+
+    Returns:
+        numpy.ndarray: Samples with shape ``(nsamples, ndim)``, one in each of the ``nsamples`` strata of every dimension.
+    """
+    strata = np.argsort(rng.random((ndim, nsamples)), axis=1).T
+    return (strata + rng.random((nsamples, ndim))) / nsamples
+
+
+def multistart_points(compiled, nstarts, sampling="sobol", seed=None):
+    """
+    Generate starting points of the varying parameters within the prior knowledge bounds.
+
+    The first point is the initial value ``compiled.x0`` (from the prior knowledge or HSVD), the others
+    are spread over the box of the bounds by a scrambled Sobol sequence or a Latin hypercube. Where a
+    bound is infinite, e.g. the upper bound of the amplitudes, the box ends at ``x0 +/- |x0|``.
+
+    Args:
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        nstarts (int): Number of starting points, including ``compiled.x0``.
+        sampling (str, optional): ``sobol`` or ``lhs``. Sobol requires ``scipy>=1.7``, otherwise a Latin
+          hypercube is used. Defaults to ``sobol``.
+        seed (int, optional): Seed of the random number generator.
+
+    Returns:
+        numpy.ndarray: The starting points with shape ``(nstarts, nvar)``.
+
+    Raises:
+        ValueError: If ``sampling`` is not supported.
+    """
+    if sampling not in sampling_methods:
+        raise ValueError(
+            "sampling=%s is not supported, use one of %s" % (sampling, sampling_methods)
+        )
+    x0 = compiled.x0
+    half_width = np.where(x0 != 0, np.abs(x0), 1.0)
+    lower = np.where(np.isfinite(compiled.lower), compiled.lower, x0 - half_width)
+    upper = np.where(np.isfinite(compiled.upper), compiled.upper, x0 + half_width)
+    rng = np.random.default_rng(seed)
+    nsamples = nstarts - 1
+    unit = None
+    if sampling == "sobol" and nsamples > 0:
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            logger.warning("Sobol sampling requires scipy>=1.7, use lhs instead!")
+        else:
+            # The balance properties of Sobol sequences require a power of 2 points
+            sobol = qmc.Sobol(len(x0), scramble=True, seed=rng)
+            unit = sobol.random_base2(int(np.ceil(np.log2(nsamples))))[:nsamples]
+    if unit is None:
+        unit = latin_hypercube(nsamples, len(x0), rng)
+    return np.vstack([x0, lower + unit * (upper - lower)])
+
+
+def fit_multistart(
+    fid_parameters,
+    fitting_parameters,
+    nstarts=16,
+    sampling="sobol",
+    seed=None,
+    num_workers=None,
+    time_budget=None,
+    round_iter=10,
+    abandon_factor=2.0,
+    fit_kws=None,
+):
+    """
+    Fit ``default_objective`` from many starting points concurrently and return the best fit.
+
+    The starting points are generated by ``multistart_points``. All candidates are fitted by the
+    Levenberg-Marquardt solver of ``levenberg_marquardt_batch`` on the compiled parameters, in rounds
+    of ``round_iter`` iterations that are split over a thread pool (NumPy releases the GIL in the model
+    engine). After each round, the candidates whose chi-square is above ``abandon_factor`` times the
+    best chi-square are abandoned, and no new round is started once ``time_budget`` is spent
+    (at least one round is always fitted).
+
+    Args:
+        fid_parameters (argspace namespace): Contains FID data and the time axis.
+        fitting_parameters (lmfit.Parameters): The initial fitting parameters, which define the bounds.
+        nstarts (int, optional): Number of starting points, including the initial values. Defaults to 16.
+        sampling (str, optional): ``sobol`` or ``lhs``, see ``multistart_points``. Defaults to ``sobol``.
+        seed (int, optional): Seed of the starting points.
+        num_workers (int, optional): Number of threads. If None, the number of CPUs is used.
+        time_budget (float, optional): Wall time in seconds after which no new round is started.
+          If None, the candidates are fitted until they converge or are abandoned.
+        round_iter (int, optional): Number of iterations per round. Defaults to 10.
+        abandon_factor (float, optional): Candidates with a chi-square above ``abandon_factor`` times the
+          best chi-square are abandoned after each round. Defaults to 2.0.
+        fit_kws (dict, optional): ``max_nfev`` (the maximum number of iterations per candidate, 200 by
+          default), ``xtol`` and ``ftol`` of ``levenberg_marquardt_batch``. Other options are ignored.
+
+    Returns:
+        lmfit.MinimizerResult: The fit of the best candidate, with the attribute ``multistart``, an
+        ``argparse.Namespace`` with the following attributes:
+
+            - starts (numpy.ndarray): The starting points with shape ``(nstarts, nvar)``.
+            - values (numpy.ndarray): The fitted values of all parameters with shape ``(nstarts, len(names))``.
+            - chisqr (numpy.ndarray): Chi-square of each candidate.
+            - niter (numpy.ndarray): Number of iterations of each candidate.
+            - status (numpy.ndarray): The status of each candidate, see ``levenberg_marquardt_batch``.
+            - converged (numpy.ndarray): True for the candidates that converged.
+            - abandoned (numpy.ndarray): True for the candidates that were abandoned.
+            - best (int): Index of the best candidate.
+            - nbest (int): Number of candidates within 1e-4 (relative) of the best chi-square.
+            - spread (numpy.ndarray): Standard deviation of the values of the candidates within ``abandon_factor``
+              of the best chi-square.
+            - elapsed (float): Wall time in seconds.
+
+    Raises:
+        ValueError: If ``sampling`` is not supported or an ``expr`` constraint is not linear.
+    """
+    timebefore = datetime.now()
+    compiled = compile_parameters(fitting_parameters)
+    timeaxis, fid = engine_inputs(fid_parameters)
+    # The fixed peaks are subtracted once, see split_fixed_peaks
+    active, fixed_popt = split_fixed_peaks(compiled)
+    if len(fixed_popt):
+        fid = fid - multieq6_array(fixed_popt, timeaxis)
+    fit_kws = {} if fit_kws is None else fit_kws
+    max_iter = fit_kws.get("max_nfev", 200)
+    xtol = fit_kws.get("xtol", 1e-8)
+    ftol = fit_kws.get("ftol", 1e-8)
+
+    starts = multistart_points(compiled, nstarts, sampling=sampling, seed=seed)
+    x = starts.copy()
+    chisqr = np.full(nstarts, np.inf)
+    niter = np.zeros(nstarts, dtype=int)
+    status = np.full(nstarts, 5)
+    abandoned = np.zeros(nstarts, dtype=bool)
+
+    def fit_round(idx):
+        fids = np.broadcast_to(fid, (len(idx), len(fid)))
+        return levenberg_marquardt_batch(
+            x[idx],
+            active,
+            timeaxis,
+            fids,
+            max_iter=min(round_iter, max_iter - np.min(niter[idx])),
+            xtol=xtol,
+            ftol=ftol,
+        )
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        while True:
+            running = np.flatnonzero((status == 5) & ~abandoned & (niter < max_iter))
+            if len(running) == 0:
+                break
+            elapsed = (datetime.now() - timebefore).total_seconds()
+            if time_budget is not None and np.any(niter) and elapsed > time_budget:
+                logger.warning(
+                    "The time budget of %s seconds is spent, %i candidates are still running"
+                    % (time_budget, len(running))
+                )
+                break
+            chunks = np.array_split(running, min(num_workers, len(running)))
+            for idx, (xs, chisqrs, niters, statuses) in zip(
+                chunks, pool.map(fit_round, chunks)
+            ):
+                x[idx], chisqr[idx] = xs, chisqrs
+                niter[idx] += niters
+                status[idx] = statuses
+            # Clearly losing candidates are not fitted any further
+            abandoned |= (status != 1) & (chisqr > abandon_factor * np.min(chisqr))
+
+    best = int(np.argmin(chisqr))
+    converged = status == 1
+    values = x @ compiled.Pmatrix.T + compiled.offset
+    stats = argparse.Namespace(
+        starts=starts,
+        values=values,
+        chisqr=chisqr,
+        niter=niter,
+        status=status,
+        converged=converged,
+        abandoned=abandoned,
+        best=best,
+        nbest=int(np.sum(chisqr <= chisqr[best] * (1 + 1e-4))),
+        spread=np.std(values[chisqr <= abandon_factor * chisqr[best]], axis=0),
+        elapsed=(datetime.now() - timebefore).total_seconds(),
+    )
+    logger.info(
+        "Multi-start fitting of %i candidates took %s seconds: %i converged, %i stalled, %i abandoned, "
+        "the best chi-square %g was reached by %i candidates"
+        % (
+            nstarts,
+            stats.elapsed,
+            np.sum(converged),
+            np.sum(status == 6),
+            np.sum(abandoned),
+            chisqr[best],
+            stats.nbest,
+        )
+    )
+
+    result = MinimizerResult(method="native", aborted=False, errorbars=False)
+    result.nfev = int(niter[best])
+    result.success = bool(converged[best])
+    result.status = int(status[best])
+    result.message = batch_status_messages[result.status]
+    workspace = np.empty((len(active.names) // 5, len(timeaxis)), dtype=fid.dtype)
+    args = (active, timeaxis, fid, None, workspace, None)
+    result = compiled_result(result, compiled, x[best], fitting_parameters, args)
+    result.multistart = stats
+    return result
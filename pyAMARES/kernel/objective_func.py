@@ -1,23 +1,95 @@
-import nmrglue as ng
+from functools import partial
+
 import numpy as np
 
-from .fid import interleavefid, multieq6, uninterleave
+from ..libs.logger import get_logger
+from .constraints import check_linear_constraints, parameter_layout
+from .fid import (
+    Jac6,
+    band_bins,
+    complex_dtype,
+    interleavefid,
+    jacobian_band,
+    multieq6,
+    multieq6_band,
+    params_to_array,
+    spectrum_band,
+    uninterleave,
+)
 
+logger = get_logger(__name__)
 
-def default_objective(params, x, fid):
-    fittedspec = multieq6(params, x)
-    residual = interleavefid(fid) - fittedspec
-    return residual
 
+def objective_workspace(fid, x):
+    """
+    Buffers of ``default_objective`` that are built once per fit (see ``fitAMARES_kernel``).
 
-def objective_range(params, x, fid, fit_range=None):
-    fittedspec = multieq6(params, x)
-    residual = interleavefid(fid) - fittedspec
+    Args:
+        fid (1D array): The complex FID.
+        x (1D array): The time axis.
+
+    Returns:
+        dict: ``interleaved``, the interleaved FID, and ``model``, a complex buffer for the model
+        in the precision of ``x`` whose float view is already interleaved.
+    """
+    return {
+        "interleaved": interleavefid(fid),
+        "model": np.empty(len(x), dtype=complex_dtype(x)),
+    }
+
+
+def default_objective(params, x, fid, cache=None, workspace=None):
+    """
+    Interleaved residual of the FID and the model of ``multieq6`` over the full time domain.
+
+    With a ``workspace`` (see ``objective_workspace``), the FID is not interleaved again, and the
+    model is written into a preallocated complex buffer whose float view is already interleaved,
+    so the returned residual is the only array allocated per call. It is not a view of a reused
+    buffer because the optimizers keep previous residuals, e.g. for finite differences.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+        x (1D array): The time axis.
+        fid (1D array): The complex FID.
+        cache (dict, optional): The FID of each peak (see ``multieq6_cached``) kept between the calls of a fit.
+        workspace (dict, optional): The result of ``objective_workspace(fid, x)``, built once per fit.
+
+    Returns:
+        numpy.ndarray: The interleaved residual, always in double precision.
+    """
+    if workspace is None:
+        residual = interleavefid(fid) - multieq6(params, x, cache=cache)
+        return residual.astype(float, copy=False)
+    fittedspec = multieq6(params, x, cache=cache, out=workspace["model"])
+    # The model may be evaluated in single precision (see engine_inputs), the optimizer is not
+    return np.subtract(workspace["interleaved"], fittedspec, dtype=float)
+
+
+def objective_range(params, x, fid, fit_range=None, band=None):
+    """
+    Residual of the spectrum in the slice ``fit_range``.
+
+    The model spectrum is evaluated only at the DFT bins of ``fit_range`` (see ``multieq6_band``),
+    so the cost is proportional to the width of the fitting range instead of a full FFT per call.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+        x (1D array): The time axis.
+        fid (1D array): The complex FID.
+        fit_range (tuple or None, optional): Indices of the fitting range in the spectrum. If None,
+          the time-domain residual of ``default_objective`` is returned.
+        band (tuple, optional): The result of ``spectrum_band(fid, fit_range)``, precomputed once per fit.
+
+    Returns:
+        numpy.ndarray: The interleaved residual.
+    """
     if fit_range is None:
-        return residual
-    else:
-        residual = ng.proc_base.fft(uninterleave(residual))
-    return interleavefid(residual[fit_range[0] : fit_range[1]])
+        return default_objective(params, x, fid)
+    if band is None:
+        band = spectrum_band(fid, fit_range)
+    bins, spec = band
+    residual = spec - multieq6_band(params_to_array(params), x, bins)
+    return residual.view(float)
 
 
 def objective(params, x, fid):
@@ -30,3 +102,90 @@ def objective3(params, x, fid):
     fittedspec = multieq6(params, x)
     residual = interleavefid(fid) - fittedspec
     return residual**2
+
+
+def default_jacobian(params, x, fid, Pmatrix=None, cache=None, workspace=None):
+    """
+    Analytic Jacobian of ``default_objective``.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+        x (1D array): The time axis.
+        fid (1D array): Not used in this function but included for interface consistency.
+        Pmatrix (numpy.ndarray, optional): The matrix returned by ``constraint_matrix``. If None,
+          the Jacobian with respect to all ``5 x npeak`` parameters is returned.
+        cache (dict, optional): Not used in this function but included for interface consistency with ``default_objective``.
+        workspace (dict, optional): Not used in this function but included for interface consistency with ``default_objective``.
+
+    Returns:
+        numpy.ndarray: The interleaved Jacobian of the residual with shape ``(2 * len(x), nvar)``.
+    """
+    jacobian = -Jac6(params, x)
+    if Pmatrix is None:
+        return jacobian.astype(float, copy=False)
+    # Projected in the precision of the model engine, then returned in double precision
+    return (jacobian @ Pmatrix.astype(jacobian.dtype)).astype(float, copy=False)
+
+
+def jacobian_range(params, x, fid, fit_range=None, Pmatrix=None, band=None):
+    """
+    Analytic Jacobian of ``objective_range``.
+
+    When ``fit_range`` is given, the Jacobian is evaluated only at the DFT bins of the
+    fitting range by ``jacobian_band``, in the same way as the residual of ``objective_range``.
+
+    Args:
+        params (lmfit.Parameters): The fitting parameters.
+        x (1D array): The time axis.
+        fid (1D array): Not used in this function but included for interface consistency.
+        fit_range (tuple or None, optional): Indices of the fitting range in the spectrum.
+        Pmatrix (numpy.ndarray, optional): The matrix returned by ``constraint_matrix``.
+        band (tuple, optional): The result of ``spectrum_band(fid, fit_range)``. Only the bins are used.
+
+    Returns:
+        numpy.ndarray: The interleaved Jacobian of the residual.
+    """
+    if fit_range is None:
+        return default_jacobian(params, x, fid, Pmatrix=Pmatrix)
+    bins = band_bins(len(x), fit_range) if band is None else band[0]
+    jacobian = -jacobian_band(params_to_array(params), x, bins)
+    if Pmatrix is not None:
+        jacobian = Pmatrix.T @ jacobian
+    return jacobian.view(float).T
+
+
+# Objective functions with a known analytic Jacobian
+analytic_jacobians = {
+    default_objective: default_jacobian,
+    objective_range: jacobian_range,
+}
+
+
+def get_analytic_jacobian(objective_func, params):
+    """
+    Return the analytic Jacobian of ``objective_func`` with respect to the varying parameters.
+
+    The returned function has the same signature as ``objective_func`` and can be passed
+    to ``lmfit.Minimizer.minimize`` as ``Dfun`` for both ``leastsq`` and ``least_squares``.
+    The ``expr`` constraints of ``params`` are mapped once by ``constraint_matrix``, so they
+    must be linear: the derivatives of a non-linear ``expr`` change with the parameter values.
+
+    Args:
+        objective_func (callable): The objective function, ``default_objective`` or ``objective_range``.
+        params (lmfit.Parameters): The fitting parameters.
+
+    Returns:
+        callable or None: The Jacobian function, or None if ``objective_func`` has no analytic Jacobian
+        or an ``expr`` of ``params`` is not linear.
+    """
+    jacfunc = analytic_jacobians.get(objective_func)
+    if jacfunc is None:
+        return None
+    layout = parameter_layout(params)
+    if not layout.linear:
+        try:
+            check_linear_constraints(params)
+        except ValueError as error:
+            logger.warning("Cannot use the analytic Jacobian: %s" % error)
+        return None
+    return partial(jacfunc, Pmatrix=layout.Pmatrix)
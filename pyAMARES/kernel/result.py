@@ -0,0 +1,283 @@
+import argparse
+from copy import copy
+
+import numpy as np
+
+# Attributes of the FID namespace that are generated by report_amares and fitAMARES
+report_attributes = (
+    "resultpd",
+    "D",
+    "residual",
+    "variance",
+    "result_multiplets",
+    "result_sum",
+    "styled_df",
+    "simple_df",
+    "metabolites",
+    "fid_padding_removed",
+    "amares_to_plot_pd",
+)
+
+
+class FIDNamespace(argparse.Namespace):
+    """
+    The ``argparse.Namespace`` returned by ``initialize_FID``, whose reports can be deferred.
+
+    After ``defer_report`` is called (see ``fitAMARES(..., lazy_report=True)``), the attributes
+    in ``report_attributes``, such as ``result_multiplets``, ``result_sum`` and ``styled_df``,
+    are generated by ``report_amares`` when one of them is accessed for the first time.
+    """
+
+    def defer_report(self, outparams):
+        """
+        Defer ``report_amares(outparams, self)`` until a report attribute is accessed.
+
+        Args:
+            outparams (lmfit.Parameters): The fitted parameters.
+        """
+        for name in report_attributes:
+            self.__dict__.pop(name, None)
+        self.__dict__["_deferred_report"] = outparams
+
+    def __getattr__(self, name):
+        # Only called if the attribute is not found in __dict__
+        outparams = self.__dict__.get("_deferred_report")
+        if outparams is None or name not in report_attributes:
+            raise AttributeError(
+                "'%s' object has no attribute '%s'" % (type(self).__name__, name)
+            )
+        from ..util.report import report_amares  # delayed import
+        from .lmfit import amares_to_plot_dataframe  # delayed import
+
+        del self.__dict__["_deferred_report"]
+        crlb = self.__dict__.get("crlb")
+        report_amares(outparams, self, verbose=False)
+        if crlb is not None:
+            self.crlb = crlb
+        self.amares_to_plot_pd = amares_to_plot_dataframe(self.result_multiplets)
+        return getattr(self, name)
+
+
+class AMARESResult:
+    """
+    Lightweight record of an AMARES fit.
+
+    Only the fitted parameter vector, its standard errors and a few scalars are stored.
+    The FID namespace and the initial ``lmfit.Parameters`` are kept as references to the
+    shared templates instead of deep copies, and the pandas reports (``result_multiplets``,
+    ``result_sum``, ``styled_df`` and ``simple_df``) are built by ``report_amares`` only when
+    one of them is accessed for the first time.
+
+    Attributes:
+        names (list of str): Names of all parameters.
+        values (numpy.ndarray): The fitted values of all parameters.
+        stderr (numpy.ndarray): The standard errors of all parameters, NaN if not estimated.
+        fid (numpy.ndarray): The measured (input) FID.
+        chisqr (float): Chi-square of the fit.
+        redchi (float): Reduced chi-square of the fit.
+        nfev (int): Number of function evaluations (iterations for the batched engine).
+        success (bool): True if the fit converged.
+        message (str): Message of the optimizer.
+    """
+
+    __slots__ = (
+        "names",
+        "values",
+        "stderr",
+        "fid",
+        "chisqr",
+        "redchi",
+        "nfev",
+        "success",
+        "message",
+        "_fid_parameters",
+        "_fitting_parameters",
+        "_report",
+        "_crlb",
+    )
+
+    def __init__(
+        self,
+        names,
+        values,
+        fid,
+        stderr=None,
+        chisqr=np.nan,
+        redchi=np.nan,
+        nfev=0,
+        success=True,
+        message="",
+        fid_parameters=None,
+        fitting_parameters=None,
+    ):
+        self.names = list(names)
+        self.values = np.asarray(values, dtype=float)
+        self.stderr = (
+            np.full(len(self.names), np.nan)
+            if stderr is None
+            else np.asarray(stderr, dtype=float)
+        )
+        self.fid = fid
+        self.chisqr = chisqr
+        self.redchi = redchi
+        self.nfev = nfev
+        self.success = success
+        self.message = message
+        self._fid_parameters = fid_parameters
+        self._fitting_parameters = fitting_parameters
+        self._report = None
+        self._crlb = None
+
+    @classmethod
+    def from_minimizer_result(cls, out_obj, fid_parameters, fitting_parameters=None):
+        """
+        Create the record from an ``lmfit.MinimizerResult``.
+
+        Args:
+            out_obj (lmfit.MinimizerResult): The result of ``fitAMARES_kernel``.
+            fid_parameters (argparse.Namespace): The FID namespace used for the fit. It is not copied.
+            fitting_parameters (lmfit.Parameters, optional): The initial fitting parameters, used as
+              the template of ``params``. If None, ``out_obj.params`` is used.
+
+        Returns:
+            AMARESResult: The lightweight record.
+        """
+        params = out_obj.params
+        return cls(
+            names=params.keys(),
+            values=[par.value for par in params.values()],
+            fid=fid_parameters.fid,
+            stderr=[
+                np.nan if par.stderr is None else par.stderr for par in params.values()
+            ],
+            chisqr=out_obj.chisqr,
+            redchi=out_obj.redchi,
+            nfev=out_obj.nfev,
+            success=out_obj.success,
+            message=out_obj.message,
+            fid_parameters=fid_parameters,
+            fitting_parameters=params
+            if fitting_parameters is None
+            else fitting_parameters,
+        )
+
+    def __getstate__(self):
+        # The cached reports are rebuilt on demand
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ("_report", "_crlb")
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._report = None
+        self._crlb = None
+
+    def __repr__(self):
+        return "AMARESResult(npeak=%i, chisqr=%.4g, nfev=%s, success=%s)" % (
+            len(self.names) // 5,
+            self.chisqr,
+            self.nfev,
+            self.success,
+        )
+
+    def detach(self):
+        """
+        Drop the references to the FID namespace and the initial parameters, e.g. before
+        sending the record to another process. Use ``attach`` to build the reports afterwards.
+
+        Returns:
+            AMARESResult: The record itself.
+        """
+        self._fid_parameters = None
+        self._fitting_parameters = None
+        self._report = None
+        self._crlb = None
+        return self
+
+    def attach(self, fid_parameters, fitting_parameters):
+        """
+        Set the FID namespace and the initial parameters used to build the reports.
+
+        Args:
+            fid_parameters (argparse.Namespace): The FID namespace used for the fit.
+            fitting_parameters (lmfit.Parameters): The initial fitting parameters.
+
+        Returns:
+            AMARESResult: The record itself.
+        """
+        self._fid_parameters = fid_parameters
+        self._fitting_parameters = fitting_parameters
+        self._report = None
+        self._crlb = None
+        return self
+
+    @property
+    def params(self):
+        """lmfit.Parameters: A copy of the initial parameters with the fitted values."""
+        if self._fitting_parameters is None:
+            raise ValueError("No fitting_parameters attached, use attach() first!")
+        params = self._fitting_parameters.copy()
+        for name, value, stderr in zip(self.names, self.values, self.stderr):
+            if not params[name].expr:
+                params[name].value = value
+            params[name].stderr = None if np.isnan(stderr) else stderr
+        params.update_constraints()
+        return params
+
+    def report(self):
+        """
+        Build (once) and return the report namespace of ``report_amares``.
+
+        Returns:
+            argparse.Namespace: A shallow copy of the FID namespace with ``result_multiplets``,
+            ``result_sum``, ``styled_df`` and ``simple_df``.
+        """
+        if self._report is None:
+            from ..util.report import report_amares  # delayed import
+
+            if self._fid_parameters is None:
+                raise ValueError("No fid_parameters attached, use attach() first!")
+            report = copy(self._fid_parameters)
+            report.fid = self.fid
+            report_amares(self.params, report, verbose=False)
+            self._report = report
+        return self._report
+
+    @property
+    def crlb(self):
+        """
+        numpy.ndarray: The CRLB of all parameters (standard deviation), calculated with NumPy
+        by ``pyAMARES.util.crlb.numeric_crlb`` without building the reports.
+        """
+        if self._crlb is None:
+            from ..util.crlb import numeric_crlb  # delayed import
+
+            if self._fid_parameters is None:
+                raise ValueError("No fid_parameters attached, use attach() first!")
+            report = copy(self._fid_parameters)
+            report.fid = self.fid
+            self._crlb = numeric_crlb(self.params, report)
+        return self._crlb
+
+    @property
+    def result_multiplets(self):
+        """pandas.DataFrame: See ``report_amares``."""
+        return self.report().result_multiplets
+
+    @property
+    def result_sum(self):
+        """pandas.DataFrame: See ``report_amares``."""
+        return self.report().result_sum
+
+    @property
+    def styled_df(self):
+        """pandas.Styler: See ``report_amares``."""
+        return self.report().styled_df
+
+    @property
+    def simple_df(self):
+        """pandas.Styler: See ``report_amares``."""
+        return self.report().simple_df
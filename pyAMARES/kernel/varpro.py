@@ -0,0 +1,334 @@
+import argparse
+
+import numpy as np
+from lmfit.minimizer import MinimizerResult
+from scipy.optimize import least_squares, leastsq, lsq_linear
+
+from ..libs.logger import get_logger
+from .compiled import (
+    compiled_jacobian,
+    compiled_result,
+    from_internal,
+    scipy_methods,
+    to_internal,
+)
+from .constraints import compile_parameters, split_fixed_peaks
+from .fid import equation6_kernel, multieq6_array
+
+logger = get_logger(__name__)
+
+
+def varpro_layout(compiled):
+    """
+    Split the varying parameters into the linear ones, solved inside each residual evaluation, and the nonlinear ones.
+
+    The amplitudes ``ak`` always enter the model linearly. A phase variable ``phi`` is eliminated
+    as well if it only sets the phases of its peaks (``phi_X`` or ``phi_Y = phi_X``, possibly plus
+    a constant) and covers the whole circle, and
+
+    - it belongs to a single amplitude variable, so that ``ak * exp(1j * phi)`` is one free complex
+      amplitude, or
+    - it is the only phase of the model (e.g. all phases linked to one peak), so that the common
+      phase is found in closed form (see ``varpro_solve``).
+
+    Other phases stay nonlinear.
+
+    Args:
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+
+    Returns:
+        argparse.Namespace: A namespace with the following attributes:
+
+            - amp_cols (numpy.ndarray): Columns of the amplitude variables in ``compiled.var_names``.
+            - amp_P (numpy.ndarray): Coefficients of the amplitude variables with shape ``(npeak, len(amp_cols))``.
+            - phase_cols (numpy.ndarray): Columns of the eliminated phase variables.
+            - amp_phase (numpy.ndarray): Index into ``phase_cols`` of the phase of each amplitude variable, -1 if it is known.
+            - shared (bool): True if a single phase is shared by all amplitudes.
+            - linear (numpy.ndarray): Columns of all eliminated variables.
+            - nonlinear (numpy.ndarray): Columns of the nonlinear variables.
+
+    Raises:
+        ValueError: If an amplitude variable also constrains another kind of parameter, or
+          an amplitude is the sum of a variable and a constant.
+    """
+    nvar = len(compiled.var_names)
+    rows = compiled.Pmatrix.reshape(-1, 5, nvar)
+    offset = compiled.offset.reshape(-1, 5)
+    nonzero = rows != 0
+    amp_cols = np.flatnonzero(np.any(nonzero[:, 0], axis=0))
+    if np.any(nonzero[:, 1:][..., amp_cols]):
+        raise ValueError("An amplitude variable also constrains other parameters!")
+    amp_P = rows[:, 0, amp_cols]
+    known_amp = offset[:, 0] != 0
+    if np.any(known_amp & np.any(amp_P != 0, axis=1)):
+        raise ValueError("An amplitude is the sum of a variable and a constant!")
+
+    # The phase variable of each peak, -1 if the phase cannot be eliminated
+    other = np.any(nonzero[:, [0, 1, 2, 4]], axis=(0, 1))
+    peak_phase = np.full(len(rows), -1)
+    for k, row in enumerate(rows[:, 3]):
+        cols = np.flatnonzero(row)
+        if len(cols) == 1 and row[cols[0]] == 1 and not other[cols[0]]:
+            peak_phase[k] = cols[0]
+    full_circle = compiled.upper - compiled.lower >= 2 * np.pi * (1 - 1e-9)
+    excluded = set(np.flatnonzero(~full_circle)) | set(peak_phase[known_amp])
+    while True:
+        peak_phase[np.isin(peak_phase, list(excluded))] = -1
+        groups = [set(peak_phase[amp_P[:, j] != 0]) for j in range(len(amp_cols))]
+        conflicts = set().union(*(g for g in groups if len(g) > 1)) - {-1}
+        if not conflicts:
+            break
+        excluded |= conflicts
+    amp_group = np.array([min(g) for g in groups], dtype=int)
+    candidates = np.unique(amp_group[amp_group >= 0])
+    counts = np.array([np.sum(amp_group == c) for c in candidates], dtype=int)
+
+    shared = (
+        len(candidates) == 1
+        and counts[0] > 1
+        and np.all(amp_group == candidates[0])
+        and not np.any(known_amp)
+    )
+    phase_cols = candidates if shared else candidates[counts == 1]
+    amp_phase = np.array(
+        [
+            np.flatnonzero(phase_cols == c)[0] if c in phase_cols else -1
+            for c in amp_group
+        ],
+        dtype=int,
+    )
+    linear = np.concatenate([amp_cols, phase_cols]).astype(int)
+    return argparse.Namespace(
+        amp_cols=amp_cols,
+        amp_P=amp_P,
+        phase_cols=phase_cols,
+        amp_phase=amp_phase,
+        shared=bool(shared),
+        linear=linear,
+        nonlinear=np.setdiff1d(np.arange(nvar), linear),
+    )
+
+
+def varpro_solve(xn, compiled, layout, timeaxis, fid, workspace=None):
+    """
+    Solve the linear parameters of ``varpro_layout`` for given nonlinear parameters.
+
+    The amplitudes with a known phase are real unknowns and the free complex amplitudes
+    ``ak * exp(1j * phi)`` are pairs of real unknowns of one linear least-squares problem.
+    A phase shared by all amplitudes is found as the leading eigenvector of a 2 x 2 matrix.
+    If the solution violates the bounds of the amplitudes, they are solved again by the
+    bounded ``scipy.optimize.lsq_linear``.
+
+    Args:
+        xn (numpy.ndarray): The nonlinear parameters, ordered as ``layout.nonlinear``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        layout (argparse.Namespace): The layout returned by ``varpro_layout``.
+        timeaxis (1D array): The time axis.
+        fid (1D array): The complex FID.
+        workspace (numpy.ndarray, optional): Preallocated complex array with shape ``(npeak, len(timeaxis))``.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: All varying parameters, ordered as ``compiled.var_names``.
+            - numpy.ndarray: The complex residual.
+    """
+    x = np.zeros(len(compiled.var_names))
+    x[layout.nonlinear] = xn
+    popt = (compiled.Pmatrix @ x + compiled.offset).reshape(-1, 5)
+    kernel = equation6_kernel(popt, timeaxis, out=workspace)
+    phase = np.exp(1j * popt[:, 3])
+    basis = (layout.amp_P * phase[:, np.newaxis]).T @ kernel  # (namp, npts)
+    target = fid - (popt[:, 0] * phase) @ kernel  # amplitudes that are fixed
+    lower = compiled.lower[layout.amp_cols]
+    upper = compiled.upper[layout.amp_cols]
+
+    if layout.shared:
+        # max over phi of the real least squares of exp(-1j * phi) * target
+        gram = np.real(np.conj(basis) @ basis.T)
+        proj = np.conj(basis) @ target
+        proj = np.stack([proj.real, proj.imag], axis=1)
+        solved = np.linalg.lstsq(gram, proj, rcond=None)[0]
+        _, vectors = np.linalg.eigh(proj.T @ solved)
+        amplitude = solved @ vectors[:, -1]
+        phi = np.arctan2(vectors[1, -1], vectors[0, -1])
+        if np.sum(amplitude) < 0:
+            amplitude, phi = -amplitude, phi + np.pi
+        model = np.exp(1j * phi) * basis
+        if np.any(amplitude < lower) or np.any(amplitude > upper):
+            amplitude = lsq_linear(
+                np.concatenate([model.real, model.imag], axis=1).T,
+                np.concatenate([target.real, target.imag]),
+                bounds=(lower, upper),
+            ).x
+        x[layout.amp_cols] = amplitude
+        x[layout.phase_cols] = phi
+        residual = target - amplitude @ model
+    else:
+        complex_amp = layout.amp_phase >= 0
+        design = np.concatenate([basis, 1j * basis[complex_amp]])
+        stacked = np.concatenate([design.real, design.imag], axis=1).T
+        rhs = np.concatenate([target.real, target.imag])
+        coef = np.linalg.lstsq(stacked, rhs, rcond=None)[0]
+        real_amp = ~complex_amp
+        nreal = len(layout.amp_cols)
+        if np.any(coef[:nreal][real_amp] < lower[real_amp]) or np.any(
+            coef[:nreal][real_amp] > upper[real_amp]
+        ):
+            bounds = (
+                np.concatenate(
+                    [
+                        np.where(real_amp, lower, -np.inf),
+                        [-np.inf] * np.sum(complex_amp),
+                    ]
+                ),
+                np.concatenate(
+                    [np.where(real_amp, upper, np.inf), [np.inf] * np.sum(complex_amp)]
+                ),
+            )
+            coef = lsq_linear(stacked, rhs, bounds=bounds).x
+        amplitude = coef[:nreal].astype(complex)
+        amplitude[complex_amp] += 1j * coef[nreal:]
+        # The moduli of the complex amplitudes are clipped to the bounds before the residual
+        modulus = np.clip(
+            np.abs(amplitude[complex_amp]), lower[complex_amp], upper[complex_amp]
+        )
+        phi = np.angle(amplitude[complex_amp])
+        amplitude[complex_amp] = modulus * np.exp(1j * phi)
+        coef = np.concatenate([amplitude.real, amplitude[complex_amp].imag])
+        residual = target - coef @ design
+        x[layout.amp_cols] = amplitude.real
+        x[layout.amp_cols[complex_amp]] = modulus
+        x[layout.phase_cols[layout.amp_phase[complex_amp]]] = phi
+    # Wrap the eliminated phases into their bounds
+    phase_lower = compiled.lower[layout.phase_cols]
+    x[layout.phase_cols] = phase_lower + np.mod(
+        x[layout.phase_cols] - phase_lower, 2 * np.pi
+    )
+    return x, residual
+
+
+def varpro_jacobian(x, compiled, layout, timeaxis, fid):
+    """
+    Kaufman's approximation of the Jacobian of the VARPRO residual.
+
+    The columns of the analytic Jacobian of the nonlinear parameters are projected onto
+    the orthogonal complement of the columns of the linear parameters.
+
+    Args:
+        x (numpy.ndarray): All varying parameters returned by ``varpro_solve``.
+        compiled (argparse.Namespace): The compiled parameters returned by ``compile_parameters``.
+        layout (argparse.Namespace): The layout returned by ``varpro_layout``.
+        timeaxis (1D array): The time axis.
+        fid (1D array): The complex FID.
+
+    Returns:
+        numpy.ndarray: The interleaved Jacobian with shape ``(2 * npts, len(layout.nonlinear))``.
+    """
+    jacobian = compiled_jacobian(x, compiled, timeaxis, fid)
+    nonlinear = jacobian[:, layout.nonlinear]
+    u, s, _ = np.linalg.svd(jacobian[:, layout.linear], full_matrices=False)
+    u = u[:, s > s[:1].max(initial=0) * 1e-10]
+    return nonlinear - u @ (u.T @ nonlinear)
+
+
+def fit_varpro(
+    fid_parameters, fitting_parameters, method="least_squares", fit_kws=None
+):
+    """
+    Fit ``default_objective`` by variable projection (VARPRO).
+
+    The amplitudes, and the phases where the prior knowledge allows it (see ``varpro_layout``),
+    are solved by linear least squares inside each residual evaluation (``varpro_solve``), so
+    the nonlinear optimizer only sees the frequencies, the dampings, ``g`` and the remaining
+    phases, with Kaufman's Jacobian (``varpro_jacobian``). The amplitude ratios and phase links
+    of the prior knowledge are kept by the compiled linear map (``compile_parameters``).
+    The result is written back to an ``lmfit.MinimizerResult`` as by ``fit_compiled``.
+
+    Args:
+        fid_parameters (argspace namespace): Contains FID data and the time axis.
+        fitting_parameters (lmfit.Parameters): Parameters for the fitting process.
+        method (str, optional): ``least_squares`` or ``leastsq``. Defaults to ``least_squares``.
+        fit_kws (dict, optional): Options to pass to ``scipy.optimize.least_squares`` or ``scipy.optimize.leastsq``.
+          ``max_nfev`` is translated to ``maxfev`` for ``leastsq``.
+
+    Returns:
+        lmfit.MinimizerResult: Object containing the fitting results.
+
+    Raises:
+        ValueError: If ``method`` is not supported, an ``expr`` constraint is not linear or
+          the amplitudes are not linear parameters.
+    """
+    if method not in scipy_methods:
+        raise ValueError(
+            "method=%s is not supported, use one of %s" % (method, scipy_methods)
+        )
+    compiled = compile_parameters(fitting_parameters)
+    timeaxis = fid_parameters.timeaxis
+    active, fixed_popt = split_fixed_peaks(compiled)
+    fid = np.ascontiguousarray(fid_parameters.fid, dtype=complex)
+    if len(fixed_popt):
+        fid = fid - multieq6_array(fixed_popt, timeaxis)
+    layout = varpro_layout(active)
+    workspace = np.empty((len(active.names) // 5, len(timeaxis)), dtype=complex)
+    logger.info(
+        "VARPRO: %i of %i varying parameters are nonlinear"
+        % (len(layout.nonlinear), len(compiled.var_names))
+    )
+    fit_kws = {} if fit_kws is None else dict(fit_kws)
+    fit_kws.pop("Dfun", None)
+    lower = compiled.lower[layout.nonlinear]
+    upper = compiled.upper[layout.nonlinear]
+    x0 = np.clip(compiled.x0[layout.nonlinear], lower, upper)
+
+    result = MinimizerResult(method=method, aborted=False, errorbars=False)
+    nfev = [0]
+    last = {}
+
+    def solve(xn):
+        # least_squares evaluates the Jacobian at the last residual
+        if "xn" not in last or not np.array_equal(last["xn"], xn):
+            last["xn"] = xn.copy()
+            last["x"], last["residual"] = varpro_solve(
+                xn, active, layout, timeaxis, fid, workspace=workspace
+            )
+        return last["x"], last["residual"]
+
+    def residual(xn):
+        nfev[0] += 1
+        return solve(xn)[1].view(float)
+
+    def jacobian(xn):
+        return varpro_jacobian(solve(xn)[0], active, layout, timeaxis, fid)
+
+    if method == "least_squares":
+        ret = least_squares(
+            residual, x0, jac=jacobian, bounds=(lower, upper), **fit_kws
+        )
+        xn = ret.x
+        result.success = ret.success
+        result.status = ret.status
+        result.message = ret.message
+    else:
+        if "max_nfev" in fit_kws:
+            fit_kws["maxfev"] = fit_kws.pop("max_nfev")
+        # See fitAMARES_kernel, the column scaling of MINPACK stalls near the bounds
+        fit_kws.setdefault("diag", np.ones(len(x0)))
+        internal, _, _, message, ier = leastsq(
+            lambda internal: residual(from_internal(internal, lower, upper)[0]),
+            to_internal(x0, lower, upper),
+            Dfun=lambda internal: (
+                jacobian(from_internal(internal, lower, upper)[0])
+                * from_internal(internal, lower, upper)[1]
+            ),
+            full_output=1,
+            **fit_kws,
+        )
+        xn = from_internal(internal, lower, upper)[0]
+        result.success = ier in [1, 2, 3, 4]
+        result.status = ier
+        result.message = message
+
+    result.nfev = nfev[0]
+    x = solve(xn)[0]
+    args = (active, timeaxis, fid, None, workspace, None)
+    return compiled_result(result, compiled, x, fitting_parameters, args)
@@ -1,3 +1,5 @@
+import os
+from collections import OrderedDict
 from copy import deepcopy
 
 import matplotlib.pyplot as plt
@@ -6,6 +8,14 @@ import numpy as np
 import scipy
 from scipy.signal import firls, freqz, lfilter
 
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Filters designed by pbfirnew, keyed by fir_design_key, least recently used first
+_design_cache = OrderedDict()
+design_cache_size = 128
+
 
 def fircls1(M, wc, ri, sup):
     """
@@ -84,16 +94,32 @@ def minphlpnew(h0):
     return fir_h  # .astype('complex') # skip h1, Jia
 
 
-def pbfirnew(wl, wh, signal, ri, M0):
-    N = np.max(signal.shape)
-    wc = (wh - wl) / 2
-    # print(f"{wc=} {wh=} {wl=}")
+def stopband_suppression(signal):
+    """
+    Noise level of the FID and the initial stopband suppression factor of ``pbfirnew``.
+
+    Args:
+        signal (1D array): The FID signal array.
 
+    Returns:
+        tuple: The standard deviation of the real part of the last 20 points, and twice its ratio to the
+        normalized maximum of the spectrum.
+    """
+    N = np.max(signal.shape)
     noise = np.std(np.real(signal[-20:]))
     maxs = np.max(np.abs(np.fft.fft(signal))) / np.sqrt(N)
     sup = noise / maxs * 2
     if sup == 0:
         sup = 1e-6
+    return noise, sup
+
+
+def pbfirnew(wl, wh, signal, ri, M0):
+    N = np.max(signal.shape)
+    wc = (wh - wl) / 2
+    # print(f"{wc=} {wh=} {wl=}")
+
+    noise, sup = stopband_suppression(signal)
 
     mnew = 1e10
     ok = 1
@@ -165,6 +191,93 @@ def pbfirnew(wl, wh, signal, ri, M0):
     return fir_h
 
 
+def fir_design_key(wl, wh, signal, ri, M0):
+    """
+    Cache key of the filter that ``pbfirnew`` designs for a FID.
+
+    The design depends on the band (``wl``, ``wh``), the passband ripple ``ri``, the initial filter
+    length ``M0`` and, through the stopband suppression, on the noise level of the FID. The
+    suppression factor is bucketed by powers of 2, the step of the search in ``pbfirnew``, so FIDs
+    with similar noise levels, e.g. the voxels of an MRSI dataset, share one design.
+
+    Args:
+        wl (float): Lower edge of the band, normalized to the Nyquist frequency.
+        wh (float): Upper edge of the band, normalized to the Nyquist frequency.
+        signal (1D array): The FID signal array.
+        ri (float): The passband ripple.
+        M0 (int): The initial filter length.
+
+    Returns:
+        str: The key.
+    """
+    _, sup = stopband_suppression(signal)
+    return "%.12g_%.12g_%.12g_%i_%i" % (wl, wh, ri, M0, np.floor(np.log2(sup)))
+
+
+def save_fir_design(path, fir_h):
+    """
+    Save a filter design of ``cached_pbfirnew`` to its own ``.npy`` file.
+
+    The file is written to a temporary file first and then renamed, so other processes never read a partial file.
+
+    Args:
+        path (str): Path of the ``.npy`` file.
+        fir_h (numpy.ndarray): The complex filter coefficients.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_file = "%s.%i.tmp.npy" % (os.path.splitext(path)[0], os.getpid())
+    np.save(tmp_file, fir_h)
+    os.replace(tmp_file, path)
+
+
+def cached_pbfirnew(wl, wh, signal, ri, M0, cache_dir=None):
+    """
+    ``pbfirnew`` with a least recently used cache of the designed filters.
+
+    The filters are keyed by ``fir_design_key``, and at most ``design_cache_size`` filters are kept.
+    A FID whose key is cached is filtered with the filter designed for the first FID with that key,
+    without the iterative design of ``pbfirnew``.
+
+    Args:
+        wl (float): Lower edge of the band, normalized to the Nyquist frequency.
+        wh (float): Upper edge of the band, normalized to the Nyquist frequency.
+        signal (1D array): The FID signal array.
+        ri (float): The passband ripple.
+        M0 (int): The initial filter length.
+        cache_dir (str, optional): Directory in which each design is saved to its own ``.npy`` file, named
+          after its key, and from which it is loaded on a cache miss. As every design has its own file,
+          processes or sessions that share the directory never overwrite each other's designs.
+
+    Returns:
+        numpy.ndarray: The complex filter coefficients.
+    """
+    key = fir_design_key(wl, wh, signal, ri, M0)
+    if key in _design_cache:
+        _design_cache.move_to_end(key)
+        return _design_cache[key]
+
+    path = None if cache_dir is None else os.path.join(cache_dir, "%s.npy" % key)
+    if path is not None and os.path.exists(path):
+        fir_h = np.load(path)
+    else:
+        fir_h = pbfirnew(wl, wh, signal, ri, M0)
+        if path is not None:
+            save_fir_design(path, fir_h)
+            logger.debug("Saved the filter design %s to %s" % (key, cache_dir))
+    fir_h.flags.writeable = False
+    _design_cache[key] = fir_h
+    while len(_design_cache) > design_cache_size:
+        _design_cache.popitem(last=False)
+    return fir_h
+
+
+def clear_fir_design_cache():
+    """
+    Remove all filter designs from the in-memory cache of ``cached_pbfirnew``.
+    """
+    _design_cache.clear()
+
+
 def MPFIR(
     fid,
     dwelltime,
@@ -175,6 +288,8 @@ def MPFIR(
     carrier=0,
     ifplot=False,
     xlim=None,
+    cache=False,
+    cache_dir=None,
 ):
     """
     Filter out a specific region of the spectrum using the maximum-phase FIR filter (Ref 1)
@@ -193,6 +308,11 @@ def MPFIR(
         carrier (float, optional): The carrier frequency offset in ppm. Defaults to 0.
         ifplot (bool, optional): If True, plots the input and filtered FID signals. Defaults to False.
         xlim (tuple, optional): The x-axis limits for the plot. Defaults to None.
+        cache (bool, optional): If True, the filter is designed once per band, ripple, filter length and
+          noise level bucket and then reused (see ``cached_pbfirnew``), so FIDs that share the acquisition,
+          e.g. MRSI voxels, are only convolved with it. Defaults to False.
+        cache_dir (str, optional): Directory in which the cached filters are persisted, one ``.npy`` file
+          per filter (see ``cached_pbfirnew``). Implies ``cache=True``. Defaults to None.
 
     Returns:
         The filtered FID signal.
@@ -209,7 +329,10 @@ def MPFIR(
     wl = xmin * 2 * step
     wh = xmax * 2 * step
     # print(f"{wl=} {wh=}")
-    fir_h = pbfirnew(wl, wh, signal, rippass, M)
+    if cache or cache_dir is not None:
+        fir_h = cached_pbfirnew(wl, wh, signal, rippass, M, cache_dir=cache_dir)
+    else:
+        fir_h = pbfirnew(wl, wh, signal, rippass, M)
     signal = lfilter(np.flip(fir_h), 1, signal)
     signal = np.concatenate([signal[len(fir_h) - 1 :], np.zeros(len(fir_h) - 1)])
     if ifplot:
@@ -233,7 +356,9 @@ def MPFIR(
     return signal
 
 
-def filter_fid_by_ppm(opts, fit_ppm, ifplot=False, rippass=0.01, M=50):
+def filter_fid_by_ppm(
+    opts, fit_ppm, ifplot=False, rippass=0.01, M=50, cache=False, cache_dir=None
+):
     """
     Filters the FID signal in the argspace Namespace object 'opts' by a specified ppm range.
 
@@ -248,6 +373,9 @@ def filter_fid_by_ppm(opts, fit_ppm, ifplot=False, rippass=0.01, M=50):
         ifplot (bool, optional): If True, plots the original and filtered FID signals. Defaults to False.
         rippass (float, optional): The passband ripple of the MPFIR filter. Defaults to 0.01.
         M (int, optional): The number of coefficients for the MPFIR filter. Defaults to 50.
+        cache (bool, optional): If True, the filter design is cached, see ``MPFIR``. Defaults to False.
+        cache_dir (str, optional): Directory in which the cached filters are persisted, see ``MPFIR``.
+          Defaults to None.
 
     Returns:
         Namespace: A modified copy of 'opts' with the filtered FID signal.
@@ -263,6 +391,8 @@ def filter_fid_by_ppm(opts, fit_ppm, ifplot=False, rippass=0.01, M=50):
         carrier=opts.carrier,
         ifplot=ifplot,
         xlim=opts.xlim,
+        cache=cache,
+        cache_dir=cache_dir,
     )
     opts2.fid = filtered_fid
     return opts2
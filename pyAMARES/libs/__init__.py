@@ -1,3 +1,3 @@
-from .MPFIR import MPFIR, filter_fid_by_ppm
+from .MPFIR import MPFIR, clear_fir_design_cache, filter_fid_by_ppm
 
-__all__ = ["MPFIR", "filter_fid_by_ppm"]
+__all__ = ["MPFIR", "clear_fir_design_cache", "filter_fid_by_ppm"]
@@ -11,8 +11,13 @@ Laudadio T, et.al. "Improved Lanczos algorithms for blackbox MRS data
 quantitation", Journal of Magnetic Resonance, Volume 157, p.292-297, 2002
 
 Functions:
-    hlsvd(data, nsv_sought, dwell_time, sparse=False) -> 6-tuple
-    hlsvdpro(data, nsv_sought, m=None, sparse=True) -> 8-tuple
+    hlsvd(data, nsv_sought, dwell_time, svd_method="dense") -> 6-tuple
+    hlsvdpro(data, nsv_sought, m=None, sparse=False, svd_method=None) -> 8-tuple
+    hankel_operator(data, nrows) -> LinearOperator
+    truncated_svd(operator, k, svd_method="lanczos") -> 3-tuple
+    vandermonde_amplitudes(roots, data, max_cond=1e8) -> ndarray
+    hlsvd_batch(data, nsv_sought, dwell_time, m=None, svd_method="dense")
+        -> structured ndarray
     convert_hlsvd_result(result, dwell)
     create_hlsvd_fids(result, npts, dwell, sum_results=False, convert=True)
     get_testdata()
@@ -38,7 +43,7 @@ import scipy.linalg.lapack as lapack
 # Our modules
 
 
-def hlsvd(data, nsv_sought, dwell_time):
+def hlsvd(data, nsv_sought, dwell_time, svd_method="dense"):
     """
     This calls HLSVDPRO version 2.x code, but simulates the hlsvd.hlsvd()
     call from HLSVDPRO version 1.0.x to maintain the API. See doc string
@@ -52,6 +57,12 @@ def hlsvd(data, nsv_sought, dwell_time):
 
         dwell_time (float): Dwell time in milliseconds.
 
+        svd_method (str): (optional) default "dense". The SVD backend of
+            hlsvdpro(), see its doc string. "lanczos", "randomized" and
+            "auto" are faster for long data, but return only the nsv_sought
+            largest singular values, largest first, instead of all of them
+            in ascending order.
+
     Returns:
         tuple: a 6-tuple containing -
             (int), number of singular values found (nsv_found <= nsv_sought)
@@ -70,7 +81,7 @@ def hlsvd(data, nsv_sought, dwell_time):
 
     """
     m = len(data) // 2
-    r = hlsvdpro(data, nsv_sought, m=m)
+    r = hlsvdpro(data, nsv_sought, m=m, svd_method=svd_method)
     r = convert_hlsvd_result(r, dwell_time)
 
     nsv_found, singular_values, frequencies, damping_factors, amplitudes, phases = r[
@@ -87,7 +98,163 @@ def hlsvd(data, nsv_sought, dwell_time):
     )
 
 
-def hlsvdpro(data, nsv_sought, m=None, sparse=False):
+def hankel_operator(data, nrows):
+    """Hankel matrix of 'data' as a LinearOperator, without forming it.
+
+    Element (i, j) is data[i + j], so the operator equals
+    scipy.linalg.hankel(data[:nrows], data[nrows - 1:]). Products with it and
+    its conjugate transpose are correlations of 'data' with the vector, which
+    are computed by FFTs in O(n log n) instead of O(n**2) operations and
+    memory for n = len(data).
+
+    Args:
+        data (ndarray): an iterable of complex numbers.
+
+        nrows (int): The number of rows of the Hankel matrix. The number of
+            columns is len(data) - nrows + 1.
+
+    Returns:
+        LinearOperator: the (nrows, len(data) - nrows + 1) Hankel operator,
+            which supports matvec, rmatvec, matmat and rmatmat.
+
+    """
+    xx = np.asarray(data, dtype=complex)
+    n = len(xx)
+    ncols = n - nrows + 1
+    # A circular convolution of length >= n is not aliased in the n - length
+    # + 1 samples that are kept below
+    nfft = 1 << (n - 1).bit_length()
+    spectrum = np.fft.fft(xx, nfft)[:, None]
+
+    def correlate(v, length):
+        # sum_j data[i + j] * v[j] for every i, with v of shape (length, p)
+        v = np.asarray(v).reshape(length, -1)
+        y = np.fft.ifft(spectrum * np.fft.fft(v[::-1], nfft, axis=0), axis=0)
+        return y[length - 1 : n]
+
+    return scipy.sparse.linalg.LinearOperator(
+        (nrows, ncols),
+        matvec=lambda v: correlate(v, ncols),
+        rmatvec=lambda u: correlate(np.conj(u), nrows).conj(),
+        matmat=lambda v: correlate(v, ncols),
+        rmatmat=lambda u: correlate(np.conj(u), nrows).conj(),
+        dtype=complex,
+    )
+
+
+def truncated_svd(operator, k, svd_method="lanczos", oversample=20, power_iter=6):
+    """The k largest singular triplets of a (Hankel) operator.
+
+    Args:
+        operator (LinearOperator): e.g. from hankel_operator().
+
+        k (int): The number of singular triplets, k < min(operator.shape).
+
+        svd_method (str): (optional) default "lanczos". "lanczos" uses the
+            implicitly restarted Lanczos bidiagonalization of
+            scipy.sparse.linalg.svds(). "randomized" uses a randomized range
+            finder (Halko, Martinsson & Tropp, SIAM Review 53, 2011) with
+            'power_iter' subspace iterations on k + 'oversample' vectors,
+            followed by a dense SVD of the small projected matrix.
+
+        oversample (int): (optional) default 20, see svd_method.
+
+        power_iter (int): (optional) default 6, see svd_method.
+
+    Returns:
+        tuple: a 3-tuple (u, s, vh) of shapes (nrows, k), (k,) and (k, ncols),
+            sorted by singular value with the largest first.
+
+    """
+    nrows, ncols = operator.shape
+    # Fixed starting vectors make the decomposition reproducible
+    rng = np.random.default_rng(0)
+    if svd_method == "lanczos":
+        v0 = rng.standard_normal(min(nrows, ncols)).astype(complex)
+        u, s, vh = scipy.sparse.linalg.svds(operator, k=k, v0=v0)
+        order = np.argsort(s)[::-1]
+        return u[:, order], s[order], vh[order]
+    if svd_method != "randomized":
+        raise ValueError("svd_method=%s is not supported" % svd_method)
+    p = min(k + oversample, nrows, ncols)
+    omega = rng.standard_normal((ncols, p)) + 1j * rng.standard_normal((ncols, p))
+    q = scipy.linalg.qr(operator.matmat(omega), mode="economic")[0]
+    for _ in range(power_iter):
+        q = scipy.linalg.qr(operator.rmatmat(q), mode="economic")[0]
+        q = scipy.linalg.qr(operator.matmat(q), mode="economic")[0]
+    # operator ~= q @ b with b = q^H @ operator of shape (p, ncols)
+    ub, s, vh = scipy.linalg.svd(
+        operator.rmatmat(q).conj().T, full_matrices=False
+    )
+    return q @ ub[:, :k], s[:k], vh[:k]
+
+
+def vandermonde_amplitudes(roots, data, max_cond=1e8, chunk=1024):
+    """Least-squares complex amplitudes x of data[t] = sum_j x[j] * roots[j]**t.
+
+    Solves the k x k normal equations of the (n, k) Vandermonde system
+    instead of factorizing the Vandermonde matrix. The Gram matrix is a
+    geometric series in closed form,
+
+        G[i, j] = sum_t (conj(r_i) * r_j)**t = expm1(n * L) / expm1(L),
+
+    with L = conj(log(r_i)) + log(r_j), and the right-hand side is
+    accumulated over chunks of 'chunk' time points, so the cost is O(n * k)
+    and the (n, k) matrix is never formed. Where the normal equations are
+    ill-conditioned, cond(G) > max_cond, the amplitudes are solved by the
+    SVD-based least squares (lapack.zgelss) of the full Vandermonde matrix
+    as before.
+
+    Args:
+        roots (ndarray): the signal poles, shape (k,) or (nvoxel, k).
+
+        data (ndarray): the complex data, shape (n,) or (nvoxel, n).
+
+        max_cond (float): (optional) default 1e8. Largest condition number
+            of G that is solved by the normal equations, whose relative
+            error is about max_cond * eps. 0 always uses zgelss.
+
+        chunk (int): (optional) default 1024, see above.
+
+    Returns:
+        ndarray: the complex amplitudes, shape (k,) or (nvoxel, k).
+
+    """
+    single = np.ndim(roots) == 1
+    roots = np.atleast_2d(np.asarray(roots, dtype=complex))
+    data = np.atleast_2d(np.asarray(data, dtype=complex))
+    nvoxel, k = roots.shape
+    n = data.shape[-1]
+
+    logs = np.log(roots)
+    lsum = logs.conj()[:, :, np.newaxis] + logs[:, np.newaxis, :]
+    with np.errstate(all="ignore"):
+        gram = np.where(lsum == 0, n, np.expm1(n * lsum) / np.expm1(lsum))
+
+    # rhs[v, i] = sum_t conj(r_i)**t * data[v, t], with the powers of each
+    # chunk started from an exact exp() and then accumulated
+    rhs = np.zeros((nvoxel, k), dtype=complex)
+    for start in range(0, n, chunk):
+        block = np.empty((nvoxel, min(chunk, n - start), k), dtype=complex)
+        block[:, 0] = np.exp(start * logs.conj())
+        block[:, 1:] = roots.conj()[:, np.newaxis]
+        np.multiply.accumulate(block, axis=1, out=block)
+        rhs += (data[:, np.newaxis, start : start + block.shape[1]] @ block)[:, 0]
+
+    x1 = np.empty((nvoxel, k), dtype=complex)
+    with np.errstate(all="ignore"):
+        w, v = np.linalg.eigh(gram)
+        solved = np.isfinite(w).all(axis=-1) & (w[:, 0] * max_cond > w[:, -1])
+    if np.any(solved):
+        proj = (v[solved].conj().transpose(0, 2, 1) @ rhs[solved, :, np.newaxis])
+        x1[solved] = (v[solved] @ (proj / w[solved, :, np.newaxis]))[..., 0]
+    for i in np.flatnonzero(~solved):
+        zeta = np.vander(roots[i], N=n, increasing=True).T
+        x1[i] = lapack.zgelss(zeta, data[i])[1][:k]
+    return x1[0] if single else x1
+
+
+def hlsvdpro(data, nsv_sought, m=None, sparse=False, svd_method=None):
     """A pure Python implementation of the HLSVDPRO version 2.x package.
 
     Computes a 'sum of lorentzians' model for the complex 'data' passed in
@@ -110,7 +277,19 @@ def hlsvdpro(data, nsv_sought, m=None, sparse=False):
             scipy.sparse.linalg.svds() is used to calculate singular values and
             nsv_sought is passed in as a parameter. If False, scipy.linalg.svd()
             is used to calculate the singular values, and nsv_sought is used to
-            truncate the results returned.
+            truncate the results returned. Only used if svd_method is None.
+
+        svd_method (str): (optional) default None, which is "lanczos" if
+            sparse else "dense". "dense" computes the full SVD of the Hankel
+            matrix with scipy.linalg.svd(), O(n**3) for n = len(data).
+            "lanczos" and "randomized" compute only the nsv_sought largest
+            singular triplets of the implicit Hankel operator, see
+            hankel_operator() and truncated_svd(), in about
+            O(nsv_sought * n log n). "auto" is "dense" for up to 512 points
+            and "lanczos" for longer data. Like scipy.linalg.svd(), the dense
+            path returns all singular values of the Hankel matrix, in
+            ascending order, while the truncated paths (and sparse=True, as
+            before) return only the nsv_sought largest, largest first.
 
     Returns:
         tuple: an 8-tuple containing -
@@ -138,21 +317,32 @@ def hlsvdpro(data, nsv_sought, m=None, sparse=False):
 
     l = n - m - 1
 
-    if mode == "f":
-        x = scipy.linalg.hankel(xx[: l + 1], xx[l:])
-    else:
-        # for backward LP we need to make the hankel matrix:
-        #    x_N-1 x_N-2 ... x_N-M-1
-        #    x_N-2 x_N-3 ... x_N-M-2
-        #      ...
-        #    x_M   x_M-1 ... x_0
+    if svd_method is None:
+        svd_method = "lanczos" if sparse else "dense"
+    elif svd_method == "auto":
+        svd_method = "dense" if n <= 512 else "lanczos"
 
-        x = scipy.linalg.hankel(xx[: m - 1 : -1], xx[m::-1])
+    if svd_method == "dense":
+        if mode == "f":
+            x = scipy.linalg.hankel(xx[: l + 1], xx[l:])
+        else:
+            # for backward LP we need to make the hankel matrix:
+            #    x_N-1 x_N-2 ... x_N-M-1
+            #    x_N-2 x_N-3 ... x_N-M-2
+            #      ...
+            #    x_M   x_M-1 ... x_0
+
+            x = scipy.linalg.hankel(xx[: m - 1 : -1], xx[m::-1])
 
-    if sparse:
-        u, s, vh = scipy.sparse.linalg.svds(x, k=k)
-    else:
         u, s, vh = scipy.linalg.svd(x, full_matrices=False)
+        s = s[::-1]  # the historical, ascending order
+    else:
+        # The same Hankel matrices, applied through FFTs
+        if mode == "f":
+            x = hankel_operator(xx, l + 1)
+        else:
+            x = hankel_operator(np.asarray(xx)[::-1], n - m)
+        u, s, vh = truncated_svd(x, min(k, min(x.shape) - 1), svd_method)
 
     k = min(k, len(s))  # number of singular values found
 
@@ -178,22 +368,114 @@ def hlsvdpro(data, nsv_sought, m=None, sparse=False):
     frequencies = np.arctan2(roots.imag, roots.real) / (math.pi * 2)
 
     # ----------------------------------------------------------------
-    #  Calculate complex-valued amplitudes, using the pseudoinverse
-    #    of the Lrow*kfit Vandermonde matrix zeta.
-    #
-    # FIXME this code, like the Fortran, ignores possible errors
-    #    reported in the "info" return value.
+    #  Calculate complex-valued amplitudes, using the normal equations
+    #    of the Lrow*kfit Vandermonde matrix zeta, or its pseudoinverse
+    #    if they are ill-conditioned.
 
-    zeta = np.vander(roots, N=len(data), increasing=True).T
-    v1, x1, s1, rank, _, info = lapack.zgelss(zeta, data)
+    x1 = vandermonde_amplitudes(roots, data)
 
     # ----------------------------------------------------------------
-    # Discard uneeded values of x
-    x1 = x1[:k]
     amplitudes = np.abs(x1)
     phases = np.arctan2(x1.imag, x1.real)
 
-    return k, s[::-1], frequencies, dampings, amplitudes, phases, u, vh
+    return k, s, frequencies, dampings, amplitudes, phases, u, vh
+
+
+# Fields of the components returned by hlsvd_batch()
+hlsvd_dtype = np.dtype(
+    [
+        ("singular_value", float),
+        ("frequency", float),
+        ("damping", float),
+        ("amplitude", float),
+        ("phase", float),
+    ]
+)
+
+
+def hlsvd_batch(data, nsv_sought, dwell_time, m=None, svd_method="dense"):
+    """The hlsvd() of a stack of FIDs sharing the number of points, e.g. the
+    voxels of an MRSI slab.
+
+    The signal subspace of each voxel is computed like in hlsvdpro(), from
+    a strided (not copied) view of its Hankel matrix or from its Hankel
+    operator. The rest is vectorized over the voxels: the shift matrices
+    are solved from stacked normal equations (the signal subspace is
+    orthonormal), the poles are the stacked eigenvalues of the shift
+    matrices, and the complex amplitudes of all voxels are solved by one
+    vandermonde_amplitudes() call instead of one lapack.zgelss() call per
+    voxel.
+
+    Args:
+        data (ndarray): complex array of shape (nvoxel, npts).
+
+        nsv_sought (int): The number of singular values sought.
+
+        dwell_time (float): Dwell time, the units of the results follow
+            convert_hlsvd_result().
+
+        m (int): (optional) default=npts/2, see hlsvdpro().
+
+        svd_method (str): (optional) default "dense", see hlsvdpro().
+            "lanczos" (or "auto" for more than 512 points) is faster for long
+            data.
+
+    Returns:
+        ndarray: structured array of shape (nvoxel, nsv_found) with the
+            fields of hlsvd_dtype: "singular_value", "frequency", "damping",
+            "amplitude" and "phase", in the same units and order as the
+            results of hlsvd() for each voxel, except that the singular
+            values are sorted with the largest first.
+
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=complex))
+    nvoxel, n = data.shape
+    m = n // 2 if m is None else m
+    l = n - m - 1
+    nrows, ncols = l + 1, m + 1
+    if svd_method == "auto":
+        svd_method = "dense" if n <= 512 else "lanczos"
+    if svd_method == "dense":
+        k = min(nsv_sought, nrows, ncols)
+        # hankel[v, i, j] = data[v, i + j], without copying the data
+        hankel = np.lib.stride_tricks.as_strided(
+            data,
+            shape=(nvoxel, nrows, ncols),
+            strides=(data.strides[0], data.strides[1], data.strides[1]),
+            writeable=False,
+        )
+    else:
+        k = min(nsv_sought, nrows - 1, ncols - 1)
+
+    # scipy.linalg.svd() is faster than a stacked numpy.linalg.svd()
+    uk = np.empty((nvoxel, nrows, k), dtype=complex)
+    sk = np.empty((nvoxel, k))
+    for i in range(nvoxel):
+        if svd_method == "dense":
+            u, s, vh = scipy.linalg.svd(hankel[i], full_matrices=False)
+        else:
+            u, s, vh = truncated_svd(
+                hankel_operator(data[i], nrows), k, svd_method
+            )
+        uk[i], sk[i] = u[:, :k], s[:k]
+
+    # Least-squares solution of ub @ zp = ut for all voxels
+    ub = uk[:, :-1]
+    ubh = ub.conj().transpose(0, 2, 1)
+    zp = np.linalg.solve(ubh @ ub, ubh @ uk[:, 1:])
+    roots = np.linalg.eigvals(zp)
+    # Same order as sorted(roots, reverse=True) in hlsvdpro()
+    roots = np.sort(roots, axis=-1)[:, ::-1]
+
+    x1 = vandermonde_amplitudes(roots, data)
+
+    components = np.empty((nvoxel, k), dtype=hlsvd_dtype)
+    components["singular_value"] = sk
+    components["frequency"] = np.angle(roots) / (2 * np.pi) / dwell_time
+    components["damping"] = dwell_time / np.log(np.abs(roots))
+    components["amplitude"] = np.abs(x1)
+    components["phase"] = np.angle(x1) * (180.0 / 3.1415926)
+    return components
 
 
 def convert_hlsvd_result(result, dwell):
@@ -1,6 +1,10 @@
 from .hsvd import HSVDinitializer
 from .misc import findnearest, get_ppm_limit
-from .multiprocessing import run_parallel_fitting_with_progress
+from .multiprocessing import (
+    fit_time_series,
+    run_parallel_fitting_with_progress,
+    run_spatial_fitting,
+)
 from .report import highlight_dataframe, report_crlb
 from .visualization import combined_plot, plot_fit, preview_HSVD
 
@@ -14,4 +18,6 @@ __all__ = [
     "get_ppm_limit",
     "findnearest",
     "run_parallel_fitting_with_progress",
+    "fit_time_series",
+    "run_spatial_fitting",
 ]
@@ -6,7 +6,9 @@ import scipy
 import sympy
 from sympy.parsing import sympy_parser
 
-from ..kernel import Jac6, multieq6, uninterleave
+from ..kernel import Jac6
+from ..kernel.constraints import parameter_layout
+from ..kernel.fid import complex_view, jacobian_array, multieq6_array, params_to_array
 from ..libs.logger import get_logger
 from .report import report_crlb
 
@@ -36,7 +38,8 @@ def calculateCRB(D, variance, P=None, verbose=False, condthreshold=1e11, cond=Fa
         1. S Cavassila et al NMR Biomed. 2001 Jun;14(4):278-83.
         2. Purvis et al, OXSA: An open-source magnetic resonance spectroscopy analysis toolbox in MATLAB. PLoS ONE 12(9): e0185356.
     """
-    D = uninterleave(D)
+    # The interleaved Jacobian of Jac6 is viewed as complex without a copy
+    D = complex_view(D)
     Dmat = np.dot(D.conj().T, D)
     if verbose:
         # print("D.shape", D.shape, "Dmat.shape", Dmat.shape)
@@ -103,6 +106,157 @@ def calculateCRB(D, variance, P=None, verbose=False, condthreshold=1e11, cond=Fa
     return np.sqrt(np.diag(CRBcov))
 
 
+def calculateCRB_batch(D, variance, P=None, condthreshold=1e11):
+    """
+    Calculates the Cramer-Rao Bounds (CRB) of a stack of fits that share one prior knowledge matrix.
+
+    The same computation as ``calculateCRB`` is done with batched ``numpy.linalg`` calls: the
+    condition numbers of all Fisher information matrices are computed at once, the well-conditioned
+    ones are solved together, and only the ill-conditioned ones fall back to ``scipy.linalg.pinv``.
+
+    Args:
+        D (numpy.ndarray): Stack of Jacobian matrices, either interleaved as in ``calculateCRB`` with
+          shape ``(nvoxel, 2 * npts, nparam)``, or complex with shape ``(nvoxel, npts, nparam)``.
+        variance (float or numpy.ndarray): The noise variance, shared or one per voxel.
+        P (numpy.ndarray, optional): Prior knowledge matrix. Assumes identity if None. Defaults to None.
+        condthreshold (float, optional): Condition number threshold to identify ill-conditioned matrices. Defaults to 1e11.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The CRLBs (standard deviation) with shape ``(nvoxel, nparam)``.
+            - numpy.ndarray: True for voxels whose Fisher information matrix is ill-conditioned.
+    """
+    D = np.asarray(D)
+    if not np.iscomplexobj(D):
+        D = D[..., ::2, :] + D[..., 1::2, :] * 1j
+    Dmat = D.conj().transpose(0, 2, 1) @ D
+    variance = np.broadcast_to(np.asarray(variance, dtype=float), (len(D),))
+    if P is None:  # No prior knowledge
+        P = np.identity(Dmat.shape[-1])
+        Fisher = np.real(Dmat) / variance[:, np.newaxis, np.newaxis]
+    else:
+        Fisher = np.real(P.T @ Dmat @ P) / variance[:, np.newaxis, np.newaxis]
+
+    illconditioned = np.linalg.cond(Fisher) > condthreshold
+    # Only the diagonal of CRBcov = P @ inv(Fisher) @ P.T is needed
+    x = np.empty(Fisher.shape[:-1] + (P.shape[0],))
+    good = ~illconditioned
+    if np.any(good):
+        x[good] = np.linalg.solve(
+            Fisher[good], np.broadcast_to(P.T, (np.sum(good),) + P.T.shape)
+        )
+    for i in np.flatnonzero(illconditioned):
+        x[i] = scipy.linalg.pinv(Fisher[i]) @ P.T
+    variances = np.einsum("ij,...ji->...i", P, x)
+
+    if np.any(illconditioned):
+        logger.warning(
+            "%i of %i Fisher information matrices may be ill-conditioned, "
+            "the condition numbers are higher than %3.3e"
+            % (np.sum(illconditioned), len(Fisher), condthreshold)
+        )
+    unreliable = np.max(variances, axis=-1) < 1e-5
+    if np.any(unreliable):
+        logger.warning(
+            "Ill conditioned matrices of %i voxels! CRLB not reliable!"
+            % np.sum(unreliable)
+        )
+    # Ensure non-negative covariance values
+    return np.sqrt(np.maximum(variances, 0.0)), illconditioned
+
+
+def evaluateCRB_batch(values, timeaxis, fids, P=None, noise_var="OXSA"):
+    """
+    Evaluates the CRLBs of a stack of fits, e.g. the voxels fitted by ``pyAMARES.kernel.batch.fit_batch``.
+
+    The Jacobians are built with ``pyAMARES.kernel.fid.jacobian_array`` for all voxels at once,
+    and the noise variance of each voxel is estimated from its own residual.
+
+    Args:
+        values (numpy.ndarray): The fitted parameters with shape ``(nvoxel, nparam)`` (e.g.
+          ``fit_batch(...).values``) or ``(nvoxel, npeak, 5)``.
+        timeaxis (1D array): The time axis.
+        fids (numpy.ndarray): The complex FIDs with shape ``(nvoxel, len(timeaxis))``.
+        P (numpy.ndarray, optional): Prior knowledge matrix shared by all voxels, e.g. the ``crlb_Pmatrix``
+          of ``pyAMARES.kernel.constraints.parameter_layout``. Assumes identity if None. Defaults to None.
+        noise_var (str or float, optional): See ``estimate_noise_variance``. Defaults to ``OXSA``.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The CRLBs (standard deviation) with shape ``(nvoxel, nparam)``.
+            - numpy.ndarray: True for voxels whose Fisher information matrix is ill-conditioned.
+    """
+    fids = np.atleast_2d(fids)
+    popt = np.asarray(values, dtype=float).reshape(len(fids), -1, 5)
+    D = jacobian_array(popt, timeaxis).transpose(0, 2, 1)
+    residual = multieq6_array(popt, timeaxis) - fids
+    variance = estimate_noise_variance(fids, residual, noise_var)
+    return calculateCRB_batch(D, variance, P=P)
+
+
+def estimate_noise_variance(fid, residual, noise_var="OXSA"):
+    """
+    Estimates the noise variance used by the CRLB calculation.
+
+    Args:
+        fid (numpy.ndarray): The FID signal, or a stack of FIDs with the time axis last.
+        residual (numpy.ndarray): The complex residual of the fit, with the same shape as ``fid``.
+        noise_var (str or float, optional): ``OXSA`` (variance of the residual), ``jMRUI``
+          (variance of the last 10% of the FID), or the noise variance itself. Defaults to ``OXSA``.
+
+    Returns:
+        float or numpy.ndarray: The noise variance, one per FID for a stack of FIDs.
+
+    Raises:
+        ValueError: If ``noise_var`` is not a recognized string or a valid number.
+    """
+    if str(noise_var).startswith("OXSA"):
+        logger.info(
+            "Estimated CRLBs are calculated using the default noise variance "
+            "estimation used by OXSA."
+        )
+        # OXSA style, the "noise as SD in TD from TD residue" option selected in the
+        # Result Window of jMRUI V7.
+        return np.var(residual.real, axis=-1)
+    elif str(noise_var).lower().startswith("jmrui"):
+        logger.info(
+            "Estimated CRLBs are calculated using the default noise variance "
+            "estimation used by jMRUI."
+        )
+        # jMRUI style, "noise as SD in TD from TD FID tall option selected in the
+        # Result Window of jMRUI V7" (I hard-coded last 10% points)
+        return np.var(fid[..., -fid.shape[-1] // 10 :].real, axis=-1)
+    variance = float(noise_var)
+    logger.info(
+        "The CRLB estimation will be divided by the input variance %s" % variance
+    )
+    return variance
+
+
+def numeric_crlb(outparams, opts, verbose=False):
+    """
+    Calculates the CRLBs of the fitted parameters with NumPy only.
+
+    Unlike ``evaluateCRB``, the prior knowledge matrix is taken from the cached layout of
+    ``outparams`` (``pyAMARES.kernel.constraints.parameter_layout``) instead of a DataFrame, no
+    report table is generated, and ``opts`` is not modified.
+
+    Args:
+        outparams (lmfit.Parameters): Output parameters from the lmfit fitting results.
+        opts (argspace.Namespace): An object containing ``timeaxis``, ``fid`` and ``noise_var``.
+        verbose (bool, optional): If True, displays additional information. Defaults to False.
+
+    Returns:
+        numpy.ndarray: The CRLB (standard deviation) of all parameters, in the order of ``outparams``.
+    """
+    popt = params_to_array(outparams)
+    D = jacobian_array(popt, opts.timeaxis).view(float).T
+    residual = multieq6_array(popt, opts.timeaxis) - opts.fid
+    variance = estimate_noise_variance(opts.fid, residual, opts.noise_var)
+    P = parameter_layout(outparams).crlb_Pmatrix
+    return calculateCRB(D, variance, P=P, verbose=verbose)
+
+
 def evaluateCRB(outparams, opts, P=None, Jacfunc=Jac6, verbose=False):
     """
     Evaluates the Cramer-Rao Bound (CRB) for lmfit fitting results,
@@ -127,35 +281,14 @@ def evaluateCRB(outparams, opts, P=None, Jacfunc=Jac6, verbose=False):
         Note: ``opts`` will be modified in place.
     """
     opts.D = Jacfunc(outparams, opts.timeaxis)
-    opts.residual = uninterleave(multieq6(outparams, opts.timeaxis)) - opts.fid
-    if opts.noise_var.startswith("OXSA"):
+    opts.residual = multieq6_array(params_to_array(outparams), opts.timeaxis) - opts.fid
+    try:
+        opts.variance = estimate_noise_variance(opts.fid, opts.residual, opts.noise_var)
+    except ValueError:
         logger.info(
-            "Estimated CRLBs are calculated using the default noise variance "
-            "estimation used by OXSA."
-        )
-        opts.variance = np.var(opts.residual.real)
-        # OXSA style, the "noise as SD in TD from TD residue" option selected in the
-        # Result Window of jMRUI V7.
-    elif opts.noise_var.lower().startswith("jmrui"):
-        logger.info(
-            "Estimated CRLBs are calculated using the default noise variance "
-            "estimation used by jMRUI."
+            "Error: noise_var %s is not a recognized string or a valid number."
+            % opts.variance
         )
-        opts.variance = np.var(opts.fid[-len(opts.fid) // 10 :].real)
-        # jMRUI style, "noise as SD in TD from TD FID tall option selected in the
-        # Result Window of jMRUI V7" (I hard-coded last 10% points)
-    else:
-        try:
-            opts.variance = float(opts.noise_var)
-            logger.info(
-                "The CRLB estimation will be divided by the input variance %s"
-                % opts.variance
-            )
-        except ValueError:
-            logger.info(
-                "Error: noise_var %s is not a recognized string or a valid number."
-                % opts.variance
-            )
 
     if verbose:
         # print("opts.D.shape=%s" % str(opts.D.shape))
@@ -250,9 +383,19 @@ def create_pmatrix(pkpd, verbose=False, ifplot=False):
 
         Pmatrix[y, x] = partial_d
     if ifplot:
-        plt.title("Prior Knowledge Matrix")
-        plt.imshow(Pmatrix, aspect="auto")
-        plt.ylabel("Free parameters")
-        plt.xlabel("All parameters")
+        plot_pmatrix(Pmatrix.T)
 
     return Pmatrix.T
+
+
+def plot_pmatrix(Pmatrix):
+    """
+    Plots a prior knowledge matrix (P-matrix).
+
+    Args:
+        Pmatrix (numpy.ndarray): The P-matrix with shape ``(all parameters, free parameters)``.
+    """
+    plt.title("Prior Knowledge Matrix")
+    plt.imshow(Pmatrix.T, aspect="auto")
+    plt.ylabel("Free parameters")
+    plt.xlabel("All parameters")
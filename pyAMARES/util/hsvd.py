@@ -19,7 +19,15 @@ else:
     # 2025-03-20
     from ..libs import hlsvd
 
-from ..kernel.fid import Compare_to_OXSA, equation6, interleavefid, uninterleave
+from ..kernel.fid import (
+    Compare_to_OXSA,
+    equation6,
+    equation6_array,
+    interleavefid,
+    jacobian_array,
+    multieq6_array,
+    uninterleave,
+)
 from ..kernel.lmfit import parameters_to_dataframe
 from ..libs.hlsvd import create_hlsvd_fids
 from ..libs.logger import get_logger
@@ -83,6 +91,82 @@ def HSVDp0(hsvdfid, timeaxis, ppm, MHz=120, ifplot=True):
     return hsvdp0
 
 
+def hsvd_poles_to_params(result, timeaxis):
+    """
+    Convert the HLSVD components into AMARES parameters in closed form.
+
+    Each component ``amplitude * exp(1j * phase) * exp((-dk + 2j * pi * freq) * n * dwelltime)`` of ``hlsvd``
+    is a Lorentzian line of equation 6 with the same ``freq`` and ``dk``. Its complex amplitude is referred
+    from the first sample to ``timeaxis[0]`` (the dead time), which gives the values that ``HSVDp0`` and
+    ``curve_fit`` of ``equation6`` converge to, with ``ak >= 0`` and ``phi`` in ``[-pi, pi]``.
+
+    Args:
+        result (tuple or numpy.ndarray): The output of ``hlsvd.hlsvd`` with the dwell time in seconds, i.e.
+          frequencies in Hz, damping time constants in seconds and phases in degrees, or the structured
+          array of ``hlsvd_batch`` for a stack of FIDs.
+        timeaxis (numpy.ndarray): The time axis of the FID.
+
+    Returns:
+        numpy.ndarray: Parameter array with shape ``(ncomponent, 5)``, see ``params_to_array``, with ``g`` = 0,
+        or ``(nvoxel, ncomponent, 5)`` for the output of ``hlsvd_batch``.
+    """
+    if isinstance(result, np.ndarray) and result.dtype.names:
+        result = (None, None) + tuple(
+            result[name] for name in ("frequency", "damping", "amplitude", "phase")
+        )
+    freq = np.asarray(result[2], dtype=float)
+    dk = -1.0 / np.asarray(result[3], dtype=float)
+    amplitude = np.asarray(result[4]) * np.exp(
+        2j * np.pi * np.asarray(result[5]) / 360.0
+    )
+    amplitude = amplitude * np.exp((dk - 2j * np.pi * freq) * timeaxis[0])
+    return np.stack(
+        [np.abs(amplitude), freq, dk, np.angle(amplitude), np.zeros_like(freq)],
+        axis=-1,
+    )
+
+
+def refine_hsvd_params(popt, timeaxis, fid, max_nfev=None):
+    """
+    Refine the HSVD components by one joint least-squares fit of their sum to the FID.
+
+    ``g`` is kept fixed, the other parameters of all components are fitted together by
+    ``scipy.optimize.least_squares`` with the vectorized model and Jacobian (``multieq6_array`` and
+    ``jacobian_array``).
+
+    Args:
+        popt (numpy.ndarray): Parameter array with shape ``(ncomponent, 5)``, e.g. from ``hsvd_poles_to_params``.
+        timeaxis (numpy.ndarray): The time axis of the FID.
+        fid (numpy.ndarray): The complex FID.
+        max_nfev (int, optional): Maximum number of function evaluations. If None, the default of
+          ``least_squares`` is used.
+
+    Returns:
+        numpy.ndarray: The refined parameter array with shape ``(ncomponent, 5)``.
+    """
+    popt = np.array(popt, dtype=float)
+    fid = np.asarray(fid, dtype=complex)
+
+    def unpack(x):
+        popt[:, :4] = x.reshape(-1, 4)
+        return popt
+
+    def residual(x):
+        return (multieq6_array(unpack(x), timeaxis) - fid).view(float)
+
+    def jacobian(x):
+        return jacobian_array(unpack(x), timeaxis, include_g=False).view(float).T
+
+    out = scipy.optimize.least_squares(
+        residual, popt[:, :4].ravel(), jac=jacobian, method="lm", max_nfev=max_nfev
+    )
+    popt = unpack(out.x)
+    # ak >= 0 and phi in [-pi, pi]
+    amplitude = popt[:, 0] * np.exp(1j * popt[:, 3])
+    popt[:, 0], popt[:, 3] = np.abs(amplitude), np.angle(amplitude)
+    return popt
+
+
 def assign_hsvd_peaks(measured_peaks_df, peak_info=None):
     """
     Assign peak names to measured peaks based on provided information and keep other columns in the measured_peaks_df.
@@ -220,6 +304,9 @@ def HSVDinitializer(
     lw_threshold=500,
     verbose=False,
     preview=False,
+    fast=False,
+    refine=False,
+    svd_method="dense",
 ):
     """
     Initializes HSVD parameters for a given FID signal.
@@ -231,39 +318,57 @@ def HSVDinitializer(
         lw_threshold (float): Linewidth threshold for filtering out broad components.
         verbose (bool): If True, prints additional information during processing.
         preview (bool): If True, displays a preview of the fitted components.
+        fast (bool): If True, the HLSVD components are converted into AMARES parameters in closed form
+          (``hsvd_poles_to_params``) instead of fitting ``HSVDp0`` and ``equation6`` to each component.
+        refine (bool): If True, the components of the fast path are refined by one joint fit to the FID
+          (``refine_hsvd_params``). Only used if ``fast`` is True.
+        svd_method (str): The SVD backend of ``pyAMARES.libs.hlsvd.hlsvd``. ``lanczos`` or ``auto`` (Lanczos for
+          more than 512 points) compute only the ``num_of_component`` largest singular triplets, which is faster
+          for long FIDs. Defaults to ``dense``.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the initialized parameters for HSVD.
     """
-    result = hlsvd.hlsvd(fid_parameters.fid, num_of_component, fid_parameters.dwelltime)
-    fid2 = create_hlsvd_fids(
-        result,
-        len(fid_parameters.fid),
+    result = hlsvd.hlsvd(
+        fid_parameters.fid,
+        num_of_component,
         fid_parameters.dwelltime,
-        sum_results=False,
-        convert=False,
+        svd_method=svd_method,
     )
-    fid2 = fid2.T
-    plist = []
-    for i in range(num_of_component):
-        currentfid = fid2[:, i]
-        hsvdp0 = HSVDp0(
-            currentfid,
-            fid_parameters.timeaxis,
-            fid_parameters.ppm,
-            MHz=fid_parameters.MHz,
-            ifplot=True if verbose else False,
-        )
-        p2, perr2 = scipy.optimize.curve_fit(
-            equation6,
-            xdata=fid_parameters.timeaxis,
-            ydata=interleavefid(currentfid),
-            p0=hsvdp0,
-        )
-        plist.append(p2)
-        if verbose:
-            # print("fitted p0", p2)
-            logger.debug("fitted p0 %s" % p2)
+    if fast:
+        popt = hsvd_poles_to_params(result, fid_parameters.timeaxis)
+        if refine:
+            popt = refine_hsvd_params(popt, fid_parameters.timeaxis, fid_parameters.fid)
+        fid2 = equation6_array(popt, fid_parameters.timeaxis).T
+        plist = list(popt)
+    else:
+        fid2 = create_hlsvd_fids(
+            result,
+            len(fid_parameters.fid),
+            fid_parameters.dwelltime,
+            sum_results=False,
+            convert=False,
+        ).T
+        plist = []
+        for i in range(num_of_component):
+            currentfid = fid2[:, i]
+            hsvdp0 = HSVDp0(
+                currentfid,
+                fid_parameters.timeaxis,
+                fid_parameters.ppm,
+                MHz=fid_parameters.MHz,
+                ifplot=True if verbose else False,
+            )
+            p2, perr2 = scipy.optimize.curve_fit(
+                equation6,
+                xdata=fid_parameters.timeaxis,
+                ydata=interleavefid(currentfid),
+                p0=hsvdp0,
+            )
+            plist.append(p2)
+            if verbose:
+                # print("fitted p0", p2)
+                logger.debug("fitted p0 %s" % p2)
 
     p_pd = pd.DataFrame(np.array(plist))
     p_pd.columns = ["ak", "freq", "dk", "phi", "g"]
@@ -1,14 +1,49 @@
 import contextlib
+import itertools
+import os
 import sys
-from concurrent.futures import ProcessPoolExecutor
-from copy import deepcopy
+import tempfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from copy import copy, deepcopy
 from datetime import datetime
 
+import numpy as np
+
+from ..kernel.batch import batch_status_messages, batch_to_parameters, fit_batch
+from ..kernel.constraints import compile_parameters
+from ..kernel.fid import fidSNR
 from ..kernel.lmfit import fitAMARES
+from ..kernel.objective_func import default_objective
+from ..kernel.result import AMARESResult
 from ..libs.logger import get_logger
+from .report import report_amares
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
 
 logger = get_logger(__name__)
 
+# Attributes of a fitted FID object that are rebuilt by every fit
+fit_output_attributes = (
+    "styled_df",
+    "simple_df",
+    "out_obj",
+    "fittedParams",
+    "fitted_fid",
+    "amares_to_plot_pd",
+    "result_multiplets",
+    "result_sum",
+    "fid_padding_removed",
+    "D",
+    "residual",
+)
+
+# Per-process state of the worker processes, set by init_worker
+_worker_context = {}
+
 
 @contextlib.contextmanager
 def redirect_stdout_to_file(filename):
@@ -35,6 +70,7 @@ def fit_dataset(
     method="leastsq",
     initialize_with_lm=False,
     objective_func=None,
+    lightweight=False,
 ):
     """
     Fits a dataset to a shared FID Parameter object using the AMARES algorithm
@@ -53,6 +89,8 @@ def fit_dataset(
         initialize_with_lm (bool, optional, default False, new in 0.3.9): If True, a Levenberg-Marquardt initializer (``least_sq``) is executed internally. See ``pyAMARES.lmfit.fitAMARES`` for details.
         objective_func (callable, optional): Custom objective function for ``pyAMARES.lmfit.fitAMARES``. If None,
           the default objective function will be used. Defaults to None.
+        lightweight (bool, optional, default False, new in 0.3.30): If True, the shared FID object is not deep copied,
+          and a detached ``pyAMARES.kernel.result.AMARESResult`` is returned instead of the DataFrame.
 
 
     Returns:
@@ -62,6 +100,21 @@ def fit_dataset(
         Exception: If an error occurs during the fitting process, it is caught and a message is printed to the console, and None is returned.
     """
     try:
+        if lightweight:
+            FIDobj_current = copy(FIDobj_shared)
+            FIDobj_current.fid = fid_current
+            result = fitAMARES(
+                fid_parameters=FIDobj_current,
+                fitting_parameters=initial_params,
+                objective_func=(
+                    default_objective if objective_func is None else objective_func
+                ),
+                method=method,
+                initialize_with_lm=initialize_with_lm,
+                ifplot=False,
+                lightweight=True,
+            )
+            return result.detach()
         FIDobj_current = deepcopy(FIDobj_shared)
         FIDobj_current.fid = fid_current
         if objective_func is None:
@@ -94,6 +147,452 @@ def fit_dataset(
         return None
 
 
+def fit_dataset_batch(
+    fid_chunk,
+    FIDobj_shared,
+    initial_params,
+    batch_size=32,
+    compiled=None,
+    lightweight=False,
+):
+    """
+    Fits a chunk of datasets that share one FID Parameter object with the batched engine ``pyAMARES.kernel.batch.fit_batch``.
+
+    All datasets of the chunk are fitted together in this worker, so the shared FID object
+    is neither deep copied nor passed to ``fitAMARES`` for each dataset. Only the default
+    objective function is supported.
+
+    Args:
+        fid_chunk (numpy.ndarray): The FID datasets to be fitted, where each row corresponds to a different dataset.
+        FIDobj_shared (FID object): A shared FID object template to be used for fitting.
+        initial_params (lmfit.Parameters): Initial fitting parameters for the AMARES algorithm.
+        batch_size (int, optional): Number of datasets solved together by ``fit_batch``. Defaults to 32.
+        compiled (argparse.Namespace, optional): The compiled ``initial_params`` returned by
+          ``pyAMARES.kernel.constraints.compile_parameters``. If None, it is compiled by ``fit_batch``.
+        lightweight (bool, optional, default False): If True, detached ``pyAMARES.kernel.result.AMARESResult``
+          records are returned instead of the DataFrames, and ``report_amares`` is not called.
+
+    Returns:
+        list: A list of DataFrames containing the fitting results (``result_multiplets``) for each dataset of the chunk.
+        The list contains None for all datasets if an error occurs during fitting.
+    """
+    try:
+        batch_result = fit_batch(
+            FIDobj_shared,
+            initial_params,
+            fid_chunk,
+            batch_size=batch_size,
+            compiled=compiled,
+        )
+        if lightweight:
+            nfree = 2 * fid_chunk.shape[-1] - len(batch_result.var_names)
+            return [
+                AMARESResult(
+                    names=batch_result.names,
+                    values=batch_result.values[i],
+                    fid=fid_chunk[i],
+                    chisqr=batch_result.chisqr[i],
+                    redchi=batch_result.chisqr[i] / max(1, nfree),
+                    nfev=batch_result.niter[i],
+                    success=batch_result.success[i],
+                    message=batch_status_messages[batch_result.status[i]],
+                )
+                for i in range(len(fid_chunk))
+            ]
+        result_tables = []
+        for i in range(len(fid_chunk)):
+            # FIDobj_shared is a private copy of this worker
+            FIDobj_shared.fid = fid_chunk[i]
+            params = batch_to_parameters(initial_params, batch_result, i)
+            report_amares(params, FIDobj_shared, verbose=False)
+            result_tables.append(FIDobj_shared.result_multiplets)
+        return result_tables
+    except Exception as e:
+        logger.critical("Error in fit_dataset_batch: %s", e)
+        return [None] * len(fid_chunk)
+
+
+def warm_start_parameters(initial_params, fitted_params, bound_margin=0.01):
+    """
+    Seed the fitting parameters with the result of a previous fit, e.g. the previous time point of a dynamic series.
+
+    The values of the varying parameters are set to the fitted values, and the bounds of ``initial_params``
+    are kept. Parameters that converged to a bound keep their initial value: the derivative of lmfit's bound
+    transform vanishes at the bounds, so a fit that starts there barely moves them and needs many more
+    function evaluations than a cold start.
+
+    Args:
+        initial_params (lmfit.Parameters): The initial fitting parameters with the original bounds.
+        fitted_params (lmfit.Parameters): The fitted parameters of the previous fit.
+        bound_margin (float, optional): A fitted value closer to a bound than ``bound_margin`` times the width
+          of the bounds (or times the absolute initial value if only one bound is finite) counts as converged
+          to the bound. Defaults to 0.01.
+
+    Returns:
+        lmfit.Parameters: A copy of ``initial_params`` seeded with ``fitted_params``.
+    """
+    params = deepcopy(initial_params)
+    for name, par in params.items():
+        if not par.vary or par.expr:
+            continue
+        value = fitted_params[name].value
+        if np.isfinite(par.min) and np.isfinite(par.max):
+            margin = bound_margin * (par.max - par.min)
+        else:
+            margin = bound_margin * abs(par.value)
+        if value - par.min > margin and par.max - value > margin:
+            par.set(value=value)
+    return params
+
+
+def fit_seeded_dataset(
+    fid_current,
+    FIDobj_shared,
+    params,
+    method="leastsq",
+    initialize_with_lm=False,
+    objective_func=None,
+    lightweight=False,
+):
+    """
+    Fits one dataset like ``fit_dataset`` and also returns the fitted parameters, so that they can seed the next fit.
+
+    Args:
+        fid_current (array-like): The current FID dataset to be fitted.
+        FIDobj_shared (FID object): A shared FID object template to be used for fitting.
+        params (lmfit.Parameters): Fitting parameters, e.g. seeded by ``warm_start_parameters``.
+        method (str, optional): The fitting method to be used. Defaults to "leastsq" (Levenberg-Marquardt).
+        initialize_with_lm (bool, optional): If True, a Levenberg-Marquardt initializer is executed internally.
+        objective_func (callable, optional): Custom objective function for ``pyAMARES.lmfit.fitAMARES``.
+        lightweight (bool, optional): If True, a detached ``pyAMARES.kernel.result.AMARESResult`` is returned
+          instead of the DataFrame.
+
+    Returns:
+        tuple:
+            - pandas.DataFrame or AMARESResult: The fitting result, None if an error occurs.
+            - lmfit.Parameters: The fitted parameters, None if an error occurs.
+            - int: Number of function evaluations, 0 if an error occurs.
+    """
+    try:
+        FIDobj_current = copy(FIDobj_shared) if lightweight else deepcopy(FIDobj_shared)
+        FIDobj_current.fid = fid_current
+        out = fitAMARES(
+            fid_parameters=FIDobj_current,
+            fitting_parameters=params,
+            objective_func=(
+                default_objective if objective_func is None else objective_func
+            ),
+            method=method,
+            initialize_with_lm=initialize_with_lm,
+            ifplot=False,
+            inplace=True,
+            lightweight=lightweight,
+        )
+        fitted_params = out.params
+        if lightweight:
+            return out.detach(), fitted_params, out.nfev
+        return FIDobj_current.result_multiplets, fitted_params, out.nfev
+    except Exception as e:
+        logger.critical("Error in fit_seeded_dataset: %s", e)
+        return None, None, 0
+
+
+def warm_start_fits(
+    fid_arrs,
+    FIDobj_shared,
+    initial_params,
+    method="leastsq",
+    initialize_with_lm=False,
+    objective_func=None,
+    lightweight=False,
+):
+    """
+    Fits consecutive FID datasets, e.g. the time points of a dynamic series, each seeded with the previous result.
+
+    The first dataset starts from ``initial_params``. Each following dataset starts from the fitted
+    parameters of the previous one (see ``warm_start_parameters``). If a fit fails, the next dataset
+    starts from ``initial_params`` again.
+
+    Args:
+        fid_arrs (numpy.ndarray): The FID datasets in temporal order, where each row corresponds to a different dataset.
+        FIDobj_shared (FID object): A shared FID object template to be used for fitting.
+        initial_params (lmfit.Parameters): Initial fitting parameters of the first dataset.
+        method (str, optional): The fitting method to be used. Defaults to "leastsq" (Levenberg-Marquardt).
+        initialize_with_lm (bool, optional): If True, a Levenberg-Marquardt initializer is executed internally.
+        objective_func (callable, optional): Custom objective function for ``pyAMARES.lmfit.fitAMARES``. If None,
+          the default objective function will be used. Defaults to None.
+        lightweight (bool, optional): If True, detached ``pyAMARES.kernel.result.AMARESResult`` records are
+          yielded instead of the DataFrames.
+
+    Yields:
+        pandas.DataFrame or AMARESResult: The fitting result of each dataset, None if an error occurs.
+    """
+    params = initial_params
+    for fid_current in fid_arrs:
+        result, fitted_params, _ = fit_seeded_dataset(
+            fid_current,
+            FIDobj_shared,
+            params,
+            method=method,
+            initialize_with_lm=initialize_with_lm,
+            objective_func=objective_func,
+            lightweight=lightweight,
+        )
+        if fitted_params is None:
+            params = initial_params
+        else:
+            params = warm_start_parameters(initial_params, fitted_params)
+        yield result
+
+
+def fit_time_series(
+    fid_arrs,
+    FIDobj_shared,
+    initial_params,
+    method="leastsq",
+    initialize_with_lm=False,
+    objective_func=None,
+    lightweight=False,
+    notebook=True,
+):
+    """
+    Sequentially fits a time series of FID datasets from one voxel, warm-starting each fit from the previous time point.
+
+    See ``warm_start_fits``. For long series, ``run_parallel_fitting_with_progress(..., warm_start=True)``
+    fits contiguous chunks in parallel, each of them warm-started internally.
+
+    Args:
+        fid_arrs (numpy.ndarray): The FID datasets in temporal order, where each row corresponds to a different dataset.
+        FIDobj_shared (FID object): A shared FID object template to be used for fitting.
+        initial_params (lmfit.Parameters): Initial fitting parameters of the first dataset.
+        method (str, optional): The fitting method to be used. Defaults to "leastsq" (Levenberg-Marquardt).
+        initialize_with_lm (bool, optional): If True, a Levenberg-Marquardt initializer is executed internally.
+        objective_func (callable, optional): Custom objective function for ``pyAMARES.lmfit.fitAMARES``.
+        lightweight (bool, optional): If True, ``pyAMARES.kernel.result.AMARESResult`` records are returned
+          instead of DataFrames.
+        notebook (bool, optional): If True, uses tqdm.notebook for progress display in Jupyter notebooks.
+          If False, uses standard tqdm. Defaults to True.
+
+    Returns:
+        list: A list of fitting result objects (pandas DataFrames, or ``AMARESResult`` if ``lightweight=True``) for each FID dataset.
+    """
+    if notebook:
+        from tqdm.notebook import tqdm
+    else:
+        from tqdm import tqdm
+
+    FIDobj_shared = make_fid_template(FIDobj_shared)
+    timebefore = datetime.now()
+    results = list(
+        tqdm(
+            warm_start_fits(
+                fid_arrs,
+                FIDobj_shared,
+                initial_params,
+                method=method,
+                initialize_with_lm=initialize_with_lm,
+                objective_func=objective_func,
+                lightweight=lightweight,
+            ),
+            total=len(fid_arrs),
+            desc="Processing Time Points",
+        )
+    )
+    if lightweight:
+        for result in results:
+            if result is not None:
+                result.attach(FIDobj_shared, initial_params)
+    timeafter = datetime.now()
+    logger.info(
+        "Fitting %i time points took %i seconds",
+        len(fid_arrs),
+        (timeafter - timebefore).total_seconds(),
+    )
+    return results
+
+
+def make_fid_template(FIDobj_shared):
+    """
+    Return a lightweight copy of a FID object to be used as the template of all fitting tasks.
+
+    The outputs of a previous fit (see ``fit_output_attributes``), such as the pandas
+    Styler ``styled_df``, are removed because they are rebuilt by every fit.
+
+    Args:
+        FIDobj_shared (FID object): The shared FID object.
+
+    Returns:
+        FID object: A copy of ``FIDobj_shared`` without the fitting outputs.
+    """
+    FIDobj_template = deepcopy(FIDobj_shared)
+    for attribute in fit_output_attributes:
+        if hasattr(FIDobj_template, attribute):
+            delattr(FIDobj_template, attribute)
+    return FIDobj_template
+
+
+def share_array(arr):
+    """
+    Place an array in shared memory so that worker processes can read it without pickling.
+
+    ``multiprocessing.shared_memory`` is used if available (Python 3.8+), otherwise the
+    array is saved to a temporary ``.npy`` file that the workers memory-map.
+
+    Args:
+        arr (numpy.ndarray): The array to be shared, e.g. the FID matrix.
+
+    Returns:
+        tuple:
+            - tuple: A small picklable description of the shared array, see ``attach_shared_array``.
+            - object: The handle to be passed to ``release_shared_array`` when the workers are done.
+    """
+    arr = np.ascontiguousarray(arr)
+    if shared_memory is None:
+        fd, filename = tempfile.mkstemp(suffix=".npy")
+        os.close(fd)
+        np.save(filename, arr)
+        return ("npy", filename), filename
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return ("shm", shm.name, arr.shape, arr.dtype.str), shm
+
+
+def attach_shared_array(spec):
+    """
+    Attach to an array created by ``share_array`` without copying it.
+
+    Args:
+        spec (tuple): The description returned by ``share_array``.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: The shared array.
+            - object: The ``SharedMemory`` object that must be kept alive as long as the array is used, or None.
+    """
+    if spec[0] == "npy":
+        return np.load(spec[1], mmap_mode="r"), None
+    shm = shared_memory.SharedMemory(name=spec[1])
+    return np.ndarray(spec[2], dtype=np.dtype(spec[3]), buffer=shm.buf), shm
+
+
+def release_shared_array(handle):
+    """
+    Free an array created by ``share_array``.
+
+    Args:
+        handle (object): The handle returned by ``share_array``.
+    """
+    if isinstance(handle, str):
+        os.remove(handle)
+    else:
+        handle.close()
+        handle.unlink()
+
+
+def init_worker(fid_spec, FIDobj_shared, initial_params, compile_params=False):
+    """
+    Initializer of the worker processes of ``run_parallel_fitting_with_progress``.
+
+    The FID template and the initial parameters are unpickled once per process, and the FID
+    matrix is attached from shared memory, so that each task only needs an index range.
+
+    Args:
+        fid_spec (tuple): The description of the shared FID matrix returned by ``share_array``.
+        FIDobj_shared (FID object): The FID template returned by ``make_fid_template``.
+        initial_params (lmfit.Parameters): Initial fitting parameters for the AMARES algorithm.
+        compile_params (bool, optional): If True, ``initial_params`` is compiled once per process
+          for the batched engine (see ``pyAMARES.kernel.constraints.compile_parameters``).
+    """
+    fid_arrs, shm = attach_shared_array(fid_spec)
+    compiled = None
+    if compile_params:
+        try:
+            compiled = compile_parameters(initial_params)
+        except ValueError as e:
+            logger.critical("Cannot compile initial_params: %s", e)
+    _worker_context.update(
+        fid_arrs=fid_arrs,
+        shm=shm,
+        FIDobj_shared=FIDobj_shared,
+        initial_params=initial_params,
+        compiled=compiled,
+    )
+
+
+def fit_shared_chunk(
+    start,
+    stop,
+    method="leastsq",
+    initialize_with_lm=False,
+    objective_func=None,
+    batch_size=None,
+    lightweight=False,
+    warm_start=False,
+):
+    """
+    Fits the datasets ``start:stop`` of the shared FID matrix in a worker process.
+
+    Each dataset is fitted by ``fit_dataset``, the whole chunk by ``fit_dataset_batch``
+    if ``batch_size`` is given, or the chunk as a warm-started series by ``warm_start_fits``
+    if ``warm_start`` is True.
+
+    Returns:
+        list: The fitting results of the datasets.
+    """
+    fid_chunk = np.array(_worker_context["fid_arrs"][start:stop])
+    if warm_start and batch_size is None:
+        return list(
+            warm_start_fits(
+                fid_chunk,
+                _worker_context["FIDobj_shared"],
+                _worker_context["initial_params"],
+                method=method,
+                initialize_with_lm=initialize_with_lm,
+                objective_func=objective_func,
+                lightweight=lightweight,
+            )
+        )
+    if batch_size is not None:
+        return fit_dataset_batch(
+            fid_chunk,
+            _worker_context["FIDobj_shared"],
+            _worker_context["initial_params"],
+            batch_size=batch_size,
+            compiled=_worker_context["compiled"],
+            lightweight=lightweight,
+        )
+    return [
+        fit_dataset(
+            fid_current,
+            _worker_context["FIDobj_shared"],
+            _worker_context["initial_params"],
+            method=method,
+            initialize_with_lm=initialize_with_lm,
+            objective_func=objective_func,
+            lightweight=lightweight,
+        )
+        for fid_current in fid_chunk
+    ]
+
+
+def default_chunk_size(nfid, num_workers, max_chunk_size=256):
+    """
+    Default number of datasets per task of ``run_parallel_fitting_with_progress``.
+
+    About four tasks per worker are created so that the load stays balanced,
+    but a task never holds more than ``max_chunk_size`` datasets.
+
+    Args:
+        nfid (int): Number of datasets.
+        num_workers (int): Number of worker processes.
+        max_chunk_size (int, optional): Upper limit of the chunk size. Defaults to 256.
+
+    Returns:
+        int: The chunk size.
+    """
+    return int(max(1, min(max_chunk_size, np.ceil(nfid / (4 * max(1, num_workers))))))
+
+
 def run_parallel_fitting_with_progress(
     fid_arrs,
     FIDobj_shared,
@@ -104,6 +603,10 @@ def run_parallel_fitting_with_progress(
     logfilename="multiprocess_log.txt",
     objective_func=None,
     notebook=True,
+    batch_size=None,
+    chunk_size=None,
+    lightweight=False,
+    warm_start=False,
 ):
     """
     Runs parallel AMARES fitting of multiple FID datasets using a shared FID object template and initial parameters.
@@ -112,6 +615,11 @@ def run_parallel_fitting_with_progress(
     It utilizes a process pool to handle the fitting tasks concurrently, logging progress and results to a
     specified file ``logfilename``. The execution time is printed upon completion.
 
+    The FID matrix is placed in shared memory once (see ``share_array``), and the FID template and
+    ``initial_params`` are sent once per worker process (see ``init_worker``), so each task only
+    pickles the index range of a chunk of datasets. At most ``2 * num_workers`` chunks are in flight
+    at any time, so the memory used by the pending tasks does not grow with the number of datasets.
+
     Args:
         fid_arrs (numpy.ndarray): An array of FID datasets to be fitted, where
           each row corresponds to a different dataset.
@@ -128,46 +636,93 @@ def run_parallel_fitting_with_progress(
           the default objective function will be used. Defaults to None.
         notebook (bool, optional): If True, uses tqdm.notebook for progress display in Jupyter notebooks.
           If False, uses standard tqdm. Defaults to True.
+        batch_size (int, optional, default None, new in 0.3.30): If given, chunks of ``batch_size`` datasets are
+          fitted together by the batched engine in each worker (see ``fit_dataset_batch``). ``method`` and
+          ``initialize_with_lm`` are not used in this mode. If None, each dataset is fitted by ``fit_dataset``.
+        chunk_size (int, optional, default None, new in 0.3.30): Number of datasets per task. If None,
+          it is determined from the number of datasets and ``num_workers`` by ``default_chunk_size``.
+        lightweight (bool, optional, default False, new in 0.3.30): If True, the workers return compact
+          ``pyAMARES.kernel.result.AMARESResult`` records instead of DataFrames. The records are attached
+          to ``FIDobj_shared`` and ``initial_params`` so that ``result_multiplets`` etc. are built on first access.
+        warm_start (bool, optional, default False, new in 0.3.30): If True, ``fid_arrs`` is treated as a time series.
+          Each chunk of consecutive datasets is fitted sequentially, every fit seeded with the result of the previous
+          dataset (see ``warm_start_fits``), and the chunks are fitted in parallel. Not supported with ``batch_size``.
 
     Returns:
-        list: A list of fitting result objects (e.g., pandas DataFrames) for each FID dataset.
+        list: A list of fitting result objects (e.g., pandas DataFrames, or ``AMARESResult`` if ``lightweight=True``) for each FID dataset.
+
+    Raises:
+        ValueError: If ``batch_size`` is given together with ``objective_func`` or ``warm_start``.
     """
+    if batch_size is not None and objective_func is not None:
+        raise ValueError(
+            "objective_func is not supported by the batched engine, batch_size=%s"
+            % batch_size
+        )
+    if batch_size is not None and warm_start:
+        raise ValueError(
+            "warm_start is not supported by the batched engine, batch_size=%s"
+            % batch_size
+        )
     if notebook:
         from tqdm.notebook import tqdm
     else:
         from tqdm import tqdm
 
-    FIDobj_shared = deepcopy(FIDobj_shared)
-    try:
-        del FIDobj_shared.styled_df
-    except AttributeError:
-        # print("There is no styled_df!")
-        logger.warning("There is no styled_df!")
-    try:
-        del FIDobj_shared.simple_df
-    except AttributeError:
-        # print("There is no styled_df!")
-        logger.warning("There is no simple_df!")
+    FIDobj_shared = make_fid_template(FIDobj_shared)
     timebefore = datetime.now()
-    results = []
+    fid_spec, fid_handle = share_array(fid_arrs)
+    nfid = fid_arrs.shape[0]
 
-    with redirect_stdout_to_file(logfilename):
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
-            futures = [
-                executor.submit(
-                    fit_dataset,
-                    fid_current=fid_arrs[i, :],
-                    FIDobj_shared=FIDobj_shared,
-                    initial_params=initial_params,
-                    method=method,
-                    initialize_with_lm=initialize_with_lm,
-                    objective_func=objective_func,
-                )
-                for i in range(fid_arrs.shape[0])
-            ]
+    if chunk_size is None:
+        chunk_size = default_chunk_size(nfid, num_workers)
+    chunks = ((i, min(i + chunk_size, nfid)) for i in range(0, nfid, chunk_size))
+    results = [None] * nfid
+
+    try:
+        with redirect_stdout_to_file(logfilename):
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=init_worker,
+                initargs=(
+                    fid_spec,
+                    FIDobj_shared,
+                    initial_params,
+                    batch_size is not None,
+                ),
+            ) as executor, tqdm(total=nfid, desc="Processing Datasets") as pbar:
+
+                def submit(chunk):
+                    return executor.submit(
+                        fit_shared_chunk,
+                        *chunk,
+                        method=method,
+                        initialize_with_lm=initialize_with_lm,
+                        objective_func=objective_func,
+                        batch_size=batch_size,
+                        lightweight=lightweight,
+                        warm_start=warm_start,
+                    )
 
-            for future in tqdm(futures, total=len(futures), desc="Processing Datasets"):
-                results.append(future.result())
+                pending = {
+                    submit(chunk): chunk
+                    for chunk in itertools.islice(chunks, 2 * num_workers)
+                }
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, stop = pending.pop(future)
+                        results[start:stop] = future.result()
+                        pbar.update(stop - start)
+                        chunk = next(chunks, None)
+                        if chunk is not None:
+                            pending[submit(chunk)] = chunk
+    finally:
+        release_shared_array(fid_handle)
+    if lightweight:
+        for result in results:
+            if result is not None:
+                result.attach(FIDobj_shared, initial_params)
 
     timeafter = datetime.now()
     # print(
@@ -181,3 +736,220 @@ def run_parallel_fitting_with_progress(
         (timeafter - timebefore).total_seconds(),
     )
     return results
+
+
+def spatial_schedule(coords, snr, nfronts=1):
+    """
+    Orders the voxels of an MRSI grid into wavefronts that start at high-SNR seed voxels.
+
+    The ``nfronts`` voxels with the highest SNR are the seeds. The fronts grow from the seeds
+    simultaneously by a breadth-first search over the face neighbours of the grid (voxels whose
+    coordinates differ by 1 along one axis), so each voxel is assigned to the front that reaches
+    it first and its parent is the neighbour it was reached from. Voxels that are not connected
+    to any seed start new fronts, seeded at their highest-SNR voxel.
+
+    Args:
+        coords (array-like): Integer grid coordinates of the voxels with shape ``(nvoxel, ndim)``.
+        snr (array-like): SNR of each voxel, e.g. from ``pyAMARES.kernel.fid.fidSNR``.
+        nfronts (int, optional): Number of seeds, i.e. of fronts that can be fitted in parallel. Defaults to 1.
+
+    Returns:
+        list of list: The fronts. Each front is a list of ``(index, parent)`` pairs in the order of the
+        search, where ``parent`` is the index of the neighbour that seeds the voxel, or -1 for a seed.
+    """
+    coords = np.asarray(coords, dtype=int).reshape(len(snr), -1)
+    snr = np.nan_to_num(np.asarray(snr, dtype=float), nan=-np.inf)
+    lookup = {tuple(c): i for i, c in enumerate(coords)}
+    if len(lookup) != len(coords):
+        raise ValueError("coords contains duplicate voxels!")
+    offsets = np.concatenate(
+        [np.eye(coords.shape[1], dtype=int), -np.eye(coords.shape[1], dtype=int)]
+    )
+    order = np.argsort(-snr, kind="stable")
+    owner = np.full(len(coords), -1)
+    fronts = []
+
+    def grow(seeds):
+        queue = deque()
+        for seed in seeds:
+            owner[seed] = len(fronts)
+            fronts.append([(int(seed), -1)])
+            queue.append(seed)
+        while queue:
+            i = queue.popleft()
+            for neighbour in coords[i] + offsets:
+                j = lookup.get(tuple(neighbour))
+                if j is not None and owner[j] < 0:
+                    owner[j] = owner[i]
+                    fronts[owner[i]].append((j, int(i)))
+                    queue.append(j)
+
+    grow(order[: max(1, min(nfronts, len(order)))])
+    for i in order:
+        if owner[i] < 0:
+            grow([i])
+    return fronts
+
+
+def fit_shared_front(
+    front,
+    method="leastsq",
+    initialize_with_lm=False,
+    objective_func=None,
+    lightweight=False,
+):
+    """
+    Fits one front of ``spatial_schedule`` in a worker process.
+
+    The seed is fitted with the initial parameters, and every other voxel with the parameters
+    of its parent, seeded by ``warm_start_parameters``.
+
+    Returns:
+        list: ``(result, nfev)`` of the voxels of the front, in the same order.
+    """
+    initial_params = _worker_context["initial_params"]
+    fitted = {}
+    results = []
+    for index, parent in front:
+        params = fitted.get(parent)
+        if params is None:
+            params = initial_params
+        else:
+            params = warm_start_parameters(initial_params, params)
+        result, fitted[index], nfev = fit_seeded_dataset(
+            np.array(_worker_context["fid_arrs"][index]),
+            _worker_context["FIDobj_shared"],
+            params,
+            method=method,
+            initialize_with_lm=initialize_with_lm,
+            objective_func=objective_func,
+            lightweight=lightweight,
+        )
+        results.append((result, nfev))
+    return results
+
+
+def run_spatial_fitting(
+    fid_arrs,
+    coords,
+    FIDobj_shared,
+    initial_params,
+    method="leastsq",
+    initialize_with_lm=False,
+    num_workers=8,
+    nfronts=None,
+    snr=None,
+    logfilename="multiprocess_log.txt",
+    objective_func=None,
+    notebook=True,
+    lightweight=False,
+):
+    """
+    Runs parallel AMARES fitting of the voxels of an MRSI grid, warm-starting each voxel from a fitted neighbour.
+
+    The voxels are ordered by ``spatial_schedule``: the ``nfronts`` voxels with the highest SNR are
+    fitted first with ``initial_params``, and the converged parameters are propagated to their
+    neighbours in breadth-first order (see ``warm_start_parameters``).
+    Each front is fitted sequentially, and the fronts are fitted in parallel by a process pool that
+    shares the FID matrix in the same way as ``run_parallel_fitting_with_progress``. The mean number
+    of function evaluations of the seeds (cold starts) and of the propagated voxels (warm starts) is
+    logged. The seeds are the voxels with the highest SNR, so this is not a comparison of warm and
+    cold starts of the same voxels.
+    Warm starts save function evaluations when the voxels differ from ``initial_params`` more than from
+    each other, e.g. with a generic prior knowledge. If ``initial_params`` is already at the optimum of
+    the noiseless spectrum, a neighbour is a slightly worse start, because its fit also contains its noise.
+
+    Args:
+        fid_arrs (numpy.ndarray): The FID datasets of the voxels with shape ``(nvoxel, npts)``.
+        coords (array-like): Integer grid coordinates of the voxels with shape ``(nvoxel, ndim)``,
+          e.g. ``np.argwhere(mask)`` for the voxels selected by a 2D or 3D ``mask``.
+        FIDobj_shared (FID object): A shared FID object template to be used for all fitting tasks.
+        initial_params (lmfit.Parameters): Initial fitting parameters of the seed voxels.
+        method (str, optional): The fitting method to be used. Defaults to 'leastsq' (Levenberg-Marquardt).
+        initialize_with_lm (bool, optional): If True, a Levenberg-Marquardt initializer is executed internally.
+        num_workers (int, optional): The number of worker processes. Defaults to 8.
+        nfronts (int, optional): Number of seed voxels. More fronts give more parallelism but more cold
+          starts. Defaults to ``num_workers``.
+        snr (array-like, optional): SNR of each voxel used to select the seeds. If None, it is
+          calculated by ``pyAMARES.kernel.fid.fidSNR``.
+        logfilename (str, optional): The name of the file where the progress log is saved. Defaults to 'multiprocess_log.txt'.
+        objective_func (callable, optional): Custom objective function for ``pyAMARES.lmfit.fitAMARES``.
+        notebook (bool, optional): If True, uses tqdm.notebook for progress display in Jupyter notebooks.
+          If False, uses standard tqdm. Defaults to True.
+        lightweight (bool, optional): If True, ``pyAMARES.kernel.result.AMARESResult`` records are returned
+          instead of DataFrames.
+
+    Returns:
+        list: A list of fitting result objects (pandas DataFrames, or ``AMARESResult`` if ``lightweight=True``)
+        in the order of ``fid_arrs``.
+    """
+    if notebook:
+        from tqdm.notebook import tqdm
+    else:
+        from tqdm import tqdm
+
+    nfid = fid_arrs.shape[0]
+    if snr is None:
+        pts_noise = min(200, max(2, fid_arrs.shape[1] // 10))
+        snr = [fidSNR(fid, pts_noise=pts_noise) for fid in fid_arrs]
+    fronts = spatial_schedule(coords, snr, num_workers if nfronts is None else nfronts)
+    FIDobj_shared = make_fid_template(FIDobj_shared)
+    timebefore = datetime.now()
+    fid_spec, fid_handle = share_array(fid_arrs)
+    results = [None] * nfid
+    nfev = np.zeros(nfid, dtype=int)
+
+    try:
+        with redirect_stdout_to_file(logfilename):
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=init_worker,
+                initargs=(fid_spec, FIDobj_shared, initial_params),
+            ) as executor, tqdm(total=nfid, desc="Processing Voxels") as pbar:
+                pending = {
+                    executor.submit(
+                        fit_shared_front,
+                        front,
+                        method=method,
+                        initialize_with_lm=initialize_with_lm,
+                        objective_func=objective_func,
+                        lightweight=lightweight,
+                    ): front
+                    for front in fronts
+                }
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        front = pending.pop(future)
+                        for (index, _), (result, n) in zip(front, future.result()):
+                            results[index] = result
+                            nfev[index] = n
+                        pbar.update(len(front))
+    finally:
+        release_shared_array(fid_handle)
+    if lightweight:
+        for result in results:
+            if result is not None:
+                result.attach(FIDobj_shared, initial_params)
+
+    timeafter = datetime.now()
+    seeds = np.zeros(nfid, dtype=bool)
+    seeds[[front[0][0] for front in fronts]] = True
+    logger.info(
+        "Fitting %i voxels in %i fronts with %i processors took %i seconds",
+        nfid,
+        len(fronts),
+        num_workers,
+        (timeafter - timebefore).total_seconds(),
+    )
+    if np.any(~seeds):
+        logger.info(
+            "Mean number of function evaluations: %.1f for %i seed voxels (cold start, highest SNR), "
+            "%.1f for %i propagated voxels (warm start, lower SNR); not a warm versus cold "
+            "comparison of the same voxels",
+            np.mean(nfev[seeds]),
+            np.sum(seeds),
+            np.mean(nfev[~seeds]),
+            np.sum(~seeds),
+        )
+    return results
@@ -4,10 +4,10 @@ import pandas as pd
 from ..kernel import (
     Jac6,
     Jac6c,
-    parameters_to_dataframe,
     parameters_to_dataframe_result,
     remove_zero_padding,
 )
+from ..kernel.constraints import parameter_layout
 from ..libs.logger import get_logger
 
 logger = get_logger(__name__)
@@ -162,10 +162,12 @@ def report_amares(outparams, fid_parameters, verbose=False):
         pandas.Styler: A DataFrame for presentation of the results with rows whose CRLB<=20
         are highlighted by green.
     """
-    from pyAMARES.util.crlb import create_pmatrix, evaluateCRB  # delayed import
+    from pyAMARES.util.crlb import evaluateCRB, plot_pmatrix  # delayed import
 
-    pkpd = parameters_to_dataframe(outparams)
-    Pmatrix = create_pmatrix(pkpd, ifplot=verbose)
+    # The P matrix is built once per prior knowledge structure
+    Pmatrix = parameter_layout(outparams).crlb_Pmatrix
+    if verbose and Pmatrix is not None:
+        plot_pmatrix(Pmatrix)
     evaluateCRB(outparams, fid_parameters, P=Pmatrix, verbose=verbose)
     resulttable = fid_parameters.resultpd
     peaklist = [
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import pyAMARES
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        default=False,
+        help="run the wall-clock comparisons marked with benchmark",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, use --run-benchmarks to run it")
+    for item in items:
+        if item.get_closest_marker("benchmark") is not None:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def load_fid():
+    """Factory of the FID namespace of ``fid.txt`` in the given precision."""
+
+    def load(precision="double"):
+        # 31P human brain at 7T, 16 peaks with J-coupling constraints
+        return pyAMARES.initialize_FID(
+            pyAMARES.readmrs(os.path.join(CURRENT_DIR, "fid.txt")),
+            priorknowledgefile=os.path.join(
+                CURRENT_DIR, "example_human_brain_31P_7T.csv"
+            ),
+            MHz=120.0,
+            sw=10000,
+            deadtime=300e-6,
+            precision=precision,
+        )
+
+    return load
+
+
+@pytest.fixture(scope="module")
+def fid():
+    # 31P human brain at 7T
+    return pyAMARES.readmrs(os.path.join(CURRENT_DIR, "fid.txt"))
+
+
+@pytest.fixture(scope="module")
+def FIDobj(load_fid):
+    return load_fid()
@@ -0,0 +1,162 @@
+import importlib
+import time
+
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.compiled import fit_compiled
+from pyAMARES.kernel.fid import multieq6_array, multieq6_cached, params_to_array
+from pyAMARES.kernel.lmfit import set_vary_parameters
+from pyAMARES.kernel.objective_func import default_objective
+
+
+def test_native_solver(FIDobj):
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    out_lm, out_native = [
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=True,
+        )
+        for method in ("leastsq", "native")
+    ]
+    assert out_native.success
+    # One model evaluation per iteration of the native solver
+    assert out_native.nfev < out_lm.nfev
+    assert out_native.chisqr <= out_lm.chisqr * 1.001
+    for name, par in out_lm.params.items():
+        if par.vary:
+            assert abs(out_native.params[name].value - par.value) < 0.25 * par.stderr
+
+    out = pyAMARES.fitAMARES(
+        FIDobj, FIDobj.initialParams, method="native", ifplot=False
+    )
+    assert out.result_multiplets.loc["PCr", "amplitude"] == pytest.approx(
+        out_native.params["ak_PCr"].value, rel=1e-6
+    )
+
+
+@pytest.mark.parametrize("analytic_jac", [False, True])
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+def test_compiled_matches_lmfit(FIDobj, method, analytic_jac, monkeypatch):
+    lmfit_module = importlib.import_module("pyAMARES.kernel.lmfit")
+    compiled_fits = []
+
+    def recording_fit_compiled(*args, **kwargs):
+        compiled_fits.append(1)
+        return fit_compiled(*args, **kwargs)
+
+    monkeypatch.setattr(lmfit_module, "fit_compiled", recording_fit_compiled)
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    out_lmfit, out_compiled = [
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+            compiled=compiled,
+        )
+        for compiled in (False, True)
+    ]
+    assert len(compiled_fits) == 1 and out_compiled.success
+    assert out_compiled.chisqr == pytest.approx(out_lmfit.chisqr, rel=1e-6)
+    for name, par in out_lmfit.params.items():
+        compiled_par = out_compiled.params[name]
+        assert (compiled_par.vary, compiled_par.expr) == (par.vary, par.expr)
+        assert compiled_par.value == pytest.approx(par.value, rel=1e-3, abs=1e-3)
+    # The expr-derived values follow the fitted values of the compiled fit
+    params = out_compiled.params
+    assert params["ak_BATP2"].value == pytest.approx(params["ak_BATP"].value / 2)
+    assert params["freq_BATP3"].value == pytest.approx(params["freq_BATP"].value + 15)
+    assert params["phi_PCr"].value == params["phi_BATP"].value
+
+
+@pytest.mark.benchmark
+def test_native_solver_benchmark(FIDobj):
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    timings = {}
+    for method in ("leastsq", "native"):
+        timebefore = time.perf_counter()
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=True,
+        )
+        timings[method] = time.perf_counter() - timebefore
+    print("\nleastsq %.3fs, native %.3fs" % (timings["leastsq"], timings["native"]))
+    assert timings["native"] < timings["leastsq"]
+
+
+def test_incremental_model_updates(FIDobj):
+    popt = params_to_array(FIDobj.initialParams)
+    cache = {}
+    multieq6_cached(popt, FIDobj.timeaxis, cache)
+    perturbed = popt.copy()
+    perturbed[3, 1] += 1.0
+    np.testing.assert_allclose(
+        multieq6_cached(perturbed, FIDobj.timeaxis, cache),
+        multieq6_array(perturbed, FIDobj.timeaxis),
+        rtol=1e-12,
+    )
+    # The cache is checked by value: an equal time axis reuses the peaks, another one does not
+    peaks = cache["peaks"]
+    multieq6_cached(perturbed, FIDobj.timeaxis.copy(), cache)
+    assert cache["peaks"] is peaks
+    shifted = FIDobj.timeaxis + FIDobj.timeaxis[1]
+    np.testing.assert_allclose(
+        multieq6_cached(perturbed, shifted, cache),
+        multieq6_array(perturbed, shifted),
+        rtol=1e-12,
+    )
+
+    # Stage-wise fit of PCr only, the other peaks are subtracted once by the compiled mode
+    params = set_vary_parameters(FIDobj.initialParams, ["ak_PCr", "freq_PCr", "dk_PCr"])
+    out_lmfit, out_compiled = [
+        pyAMARES.fitAMARES_kernel(
+            FIDobj, params, default_objective, method="least_squares", compiled=compiled
+        )
+        for compiled in (False, True)
+    ]
+    assert out_compiled.chisqr == pytest.approx(out_lmfit.chisqr, rel=1e-6)
+    assert out_compiled.params["ak_PCr"].value == pytest.approx(
+        out_lmfit.params["ak_PCr"].value, rel=1e-4
+    )
+    assert out_compiled.params["ak_BATP"].value == FIDobj.initialParams["ak_BATP"].value
+
+
+def test_model_cache_is_opt_in(FIDobj, monkeypatch):
+    fid_module = importlib.import_module("pyAMARES.kernel.fid")
+    calls = []
+
+    def counting_multieq6_cached(*args, **kwargs):
+        calls.append(1)
+        return multieq6_cached(*args, **kwargs)
+
+    monkeypatch.setattr(fid_module, "multieq6_cached", counting_multieq6_cached)
+    pyAMARES.fitAMARES_kernel(
+        FIDobj, FIDobj.initialParams, default_objective, method="least_squares"
+    )
+    assert not calls
+    # The compiled mode does not support nelder, the lmfit.Minimizer fallback uses the cache
+    params = set_vary_parameters(FIDobj.initialParams, ["ak_PCr", "freq_PCr", "dk_PCr"])
+    pyAMARES.fitAMARES_kernel(
+        FIDobj,
+        params,
+        default_objective,
+        method="nelder",
+        compiled=True,
+        fit_kws={"max_nfev": 50},
+    )
+    assert calls
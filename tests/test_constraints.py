@@ -0,0 +1,122 @@
+import importlib
+import os
+from collections import OrderedDict
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel import parameters_to_dataframe
+from pyAMARES.kernel.constraints import parameter_layout
+from pyAMARES.kernel.lmfit import filter_param_by_ppm
+from pyAMARES.util.crlb import create_pmatrix
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+constraints = importlib.import_module("pyAMARES.kernel.constraints")
+
+
+def assert_same_pmatrix(params):
+    expected = create_pmatrix(parameters_to_dataframe(params))
+    Pmatrix = parameter_layout(params).crlb_Pmatrix
+    if expected is None:
+        assert Pmatrix is None
+    else:
+        np.testing.assert_array_equal(Pmatrix, expected)
+
+
+@pytest.mark.parametrize(
+    "priorknowledgefile",
+    [
+        "example_human_brain_31P_7T.csv",
+        "Table1.csv",
+        "FigS2A.csv",
+        "singlet.csv",
+        os.path.join("..", "pyAMARES", "examples", "human_brain_31P_7T.csv"),
+    ],
+)
+def test_crlb_pmatrix_matches_create_pmatrix(fid, priorknowledgefile):
+    FIDobj = pyAMARES.initialize_FID(
+        fid,
+        priorknowledgefile=os.path.join(CURRENT_DIR, priorknowledgefile),
+        MHz=120.0,
+        sw=10000,
+        deadtime=300e-6,
+    )
+    assert_same_pmatrix(FIDobj.initialParams)
+    assert_same_pmatrix(
+        filter_param_by_ppm(FIDobj.initialParams, fit_ppm=(-10, 10), MHz=120.0)
+    )
+
+
+def test_layout_cache(FIDobj):
+    params = FIDobj.initialParams
+    layout = parameter_layout(params)
+
+    # Values and bounds change from fit to fit, the layout does not
+    shifted = deepcopy(params)
+    shifted["freq_BATP"].set(value=shifted["freq_BATP"].value + 10.0)
+    shifted["dk_PCr"].set(max=shifted["dk_PCr"].max * 2)
+    assert parameter_layout(shifted) is layout
+
+    # A fixed parameter
+    fixed = deepcopy(params)
+    fixed["dk_PCr"].set(vary=False)
+    fixed_layout = parameter_layout(fixed)
+    assert fixed_layout is not layout
+    assert "dk_PCr" not in fixed_layout.var_names
+    assert len(fixed_layout.free) == len(layout.free) - 1
+    assert_same_pmatrix(fixed)
+
+    # A fixed amplitude of BATP, the amplitudes of BATP2 and BATP3 are fixed too.
+    # create_pmatrix drops the fixed ak_BATP and shifts the derivatives of the later
+    # expr rows to the wrong parameters, so compare with the constraints directly.
+    fixed = deepcopy(params)
+    fixed["ak_BATP"].set(vary=False)
+    fixed_layout = parameter_layout(fixed)
+    Pmatrix = fixed_layout.crlb_Pmatrix
+    index = fixed_layout.index
+    var_index = {name: i for i, name in enumerate(fixed_layout.var_names)}
+    assert not np.any(Pmatrix[index["ak_BATP2"]])
+    assert not np.any(Pmatrix[index["ak_BATP3"]])
+    assert Pmatrix[index["freq_BATP2"], var_index["freq_BATP"]] == 1.0
+    assert Pmatrix[index["ak_AATP2"], var_index["ak_AATP"]] == 1.0
+
+    # Another J-coupling constraint
+    coupled = deepcopy(params)
+    coupled["ak_BATP2"].set(expr="ak_BATP/3")
+    coupled_layout = parameter_layout(coupled)
+    assert coupled_layout is not layout
+    assert coupled_layout.exprs["ak_BATP2"] == "ak_BATP/3"
+    assert not np.array_equal(coupled_layout.crlb_Pmatrix, layout.crlb_Pmatrix)
+    assert_same_pmatrix(coupled)
+
+    # A constraint removed
+    free = deepcopy(params)
+    free["freq_BATP2"].set(expr="", vary=True)
+    free_layout = parameter_layout(free)
+    assert "freq_BATP2" not in free_layout.exprs
+    assert "freq_BATP2" in free_layout.var_names
+    assert_same_pmatrix(free)
+
+    assert parameter_layout(deepcopy(params)) is layout
+
+
+def test_layout_cache_eviction(FIDobj, monkeypatch):
+    monkeypatch.setattr(constraints, "_layout_cache", OrderedDict())
+    monkeypatch.setattr(constraints, "layout_cache_size", 2)
+    params = FIDobj.initialParams
+    variants = []
+    for name in ("dk_PCr", "dk_BATP", "dk_AATP"):
+        fixed = deepcopy(params)
+        fixed[name].set(vary=False)
+        variants.append(fixed)
+
+    first, second = [parameter_layout(fixed) for fixed in variants[:2]]
+    # The first layout is used again, the second is the least recently used
+    assert parameter_layout(variants[0]) is first
+    parameter_layout(variants[2])
+    assert len(constraints._layout_cache) == 2
+    assert parameter_layout(variants[0]) is first
+    assert parameter_layout(variants[1]) is not second
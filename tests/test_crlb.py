@@ -0,0 +1,72 @@
+from copy import copy
+
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.batch import batch_to_parameters, fit_batch
+from pyAMARES.kernel.constraints import constraint_matrix
+from pyAMARES.kernel.fid import jacobian_array, multieq6_array, params_to_array
+from pyAMARES.util.crlb import (
+    calculateCRB,
+    estimate_noise_variance,
+    evaluateCRB_batch,
+    numeric_crlb,
+)
+
+
+@pytest.fixture(scope="module")
+def batch(FIDobj):
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal((8, len(FIDobj.fid), 2)).view(complex)[..., 0]
+    fids = FIDobj.fid + 0.05 * np.abs(FIDobj.fid).max() * noise
+    return fids, fit_batch(FIDobj, FIDobj.initialParams, fids)
+
+
+def test_numeric_crlb_matches_report_amares(FIDobj):
+    out = pyAMARES.fitAMARES(
+        FIDobj, FIDobj.initialParams, method="least_squares", ifplot=False
+    )
+    lazy = pyAMARES.fitAMARES(
+        FIDobj,
+        FIDobj.initialParams,
+        method="least_squares",
+        ifplot=False,
+        lazy_report=True,
+    )
+    assert "result_multiplets" not in vars(lazy)
+    np.testing.assert_array_equal(lazy.crlb, out.crlb)
+    assert lazy.result_multiplets.equals(out.result_multiplets)
+
+
+def test_batched_crlb_matches_single_voxel(FIDobj, batch):
+    fids, result = batch
+    P, _ = constraint_matrix(FIDobj.initialParams)
+    crlb, illconditioned = evaluateCRB_batch(result.values, FIDobj.timeaxis, fids, P=P)
+    assert crlb.shape == result.values.shape
+    for i, fid in enumerate(fids):
+        opts = copy(FIDobj)
+        opts.fid = fid
+        params = batch_to_parameters(FIDobj.initialParams, result, i)
+        np.testing.assert_allclose(crlb[i], numeric_crlb(params, opts), rtol=1e-6)
+
+        popt = params_to_array(params)
+        D = jacobian_array(popt, FIDobj.timeaxis).view(float).T
+        variance = estimate_noise_variance(
+            fid, multieq6_array(popt, FIDobj.timeaxis) - fid
+        )
+        assert illconditioned[i] == calculateCRB(D, variance, P=P, cond=True)
+
+
+def test_batch_status(FIDobj, batch):
+    fids, result = batch
+    assert np.all(result.status == 1) and np.all(result.success)
+
+    # Without tolerances, the voxels stall once no step reduces chi-square
+    strict = fit_batch(FIDobj, FIDobj.initialParams, fids, xtol=0, ftol=0, max_iter=500)
+    stalled = strict.status == 6
+    assert np.any(stalled)
+    assert not np.any(strict.success[stalled])
+    np.testing.assert_array_equal(strict.success, strict.status == 1)
+    assert np.all(strict.niter[stalled] < 500)
+    np.testing.assert_allclose(strict.chisqr, result.chisqr, rtol=1e-5)
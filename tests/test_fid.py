@@ -0,0 +1,131 @@
+import importlib
+from copy import deepcopy
+
+import numpy as np
+
+import pyAMARES
+from pyAMARES.kernel.fid import (
+    Jac6c,
+    complex_view,
+    equation6,
+    interleavefid,
+    jacobian_array,
+    multieq6,
+    multieq6_array,
+    params_to_array,
+    time_basis,
+    uninterleave,
+)
+from pyAMARES.kernel.objective_func import default_objective, objective_workspace
+
+
+def reference_jacobian(params, x, include_g=True):
+    # The per-peak Jac6 and Jac6c of pyAMARES 0.3.29
+    popt = params_to_array(params)
+    ak, dk, g = popt[:, 0], popt[:, 2], np.clip(popt[:, 4], 0, 1)
+    fids = np.array([uninterleave(equation6(x, *row)) for row in popt]).T
+    x2 = np.tile(x, (len(popt), 1)).T
+    columns = [
+        fids / ak,
+        fids * 2j * np.pi * x2,
+        -fids * x2 * (g * x2 - g + 1),
+        fids * 1j,
+        -dk * (x2 - 1) * x2 * fids,
+    ]
+    nparam = 5 if include_g else 4
+    jacobian = np.zeros((len(x), len(popt) * nparam), dtype=complex)
+    for j in range(nparam):
+        jacobian[:, j::nparam] = columns[j]
+    return interleavefid(jacobian)
+
+
+def test_vectorized_engine_matches_equation6(FIDobj):
+    params = deepcopy(FIDobj.initialParams)
+    # Gaussian and Voigt lines too
+    params["g_BATP"].set(value=0.3)
+    params["g_PCr"].set(value=1.0)
+    params.update_constraints()
+    x = FIDobj.timeaxis
+    rows = params_to_array(params)
+    assert rows[:, 4].any()
+    peaks = np.array([equation6(x, *row) for row in rows])
+
+    np.testing.assert_allclose(multieq6(params, x), peaks.sum(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(
+        multieq6(params, x, fid=FIDobj.fid),
+        peaks.sum(axis=0) - interleavefid(FIDobj.fid),
+        rtol=1e-12,
+    )
+    np.testing.assert_allclose(
+        multieq6(params, x, return_mat=True),
+        np.array([uninterleave(peak) for peak in peaks]),
+        rtol=1e-12,
+    )
+
+    jac = pyAMARES.Jac6(params, x)
+    assert jac.shape == (2 * len(x), 5 * len(rows))
+    scale = np.abs(jac).max()
+    np.testing.assert_allclose(
+        jac, reference_jacobian(params, x), rtol=1e-12, atol=1e-15 * scale
+    )
+    np.testing.assert_allclose(
+        Jac6c(params, x),
+        reference_jacobian(params, x, include_g=False),
+        rtol=1e-12,
+        atol=1e-15 * scale,
+    )
+
+
+def test_time_basis_jacobian_with_gaussian_lines(FIDobj):
+    basis = time_basis(FIDobj.timeaxis)
+    assert FIDobj.timeaxis is basis.t and not basis.t.flags.writeable
+    assert time_basis(FIDobj.timeaxis.copy()) is basis
+
+    popt = params_to_array(FIDobj.initialParams)
+    popt[:, 4] = 0.3
+    jac = jacobian_array(popt, FIDobj.timeaxis).reshape(-1, 5, len(FIDobj.timeaxis))
+    for j in range(5):
+        step = np.zeros_like(popt)
+        step[:, j] = 1e-6 * np.maximum(1.0, np.abs(popt[:, j]))
+        for k in range(len(popt)):
+            perturbed = popt.copy()
+            perturbed[k] += step[k]
+            numeric = (
+                multieq6_array(perturbed, FIDobj.timeaxis)
+                - multieq6_array(popt, FIDobj.timeaxis)
+            ) / step[k, j]
+            np.testing.assert_allclose(
+                jac[k, j], numeric, rtol=0, atol=1e-4 * np.abs(jac[k, j]).max() + 1e-9
+            )
+
+
+def test_complex_residual_without_copies(FIDobj, monkeypatch):
+    params = FIDobj.initialParams
+    workspace = objective_workspace(FIDobj.fid, FIDobj.timeaxis)
+    expected = default_objective(params, FIDobj.timeaxis, FIDobj.fid)
+    first = default_objective(params, FIDobj.timeaxis, FIDobj.fid, workspace=workspace)
+    second = default_objective(
+        params, FIDobj.timeaxis, FIDobj.fid, cache={}, workspace=workspace
+    )
+    np.testing.assert_allclose(first, expected, rtol=1e-12)
+    np.testing.assert_allclose(second, first, rtol=1e-12)
+    # The residual is not the reused model buffer
+    assert not np.shares_memory(second, workspace["model"])
+
+    # The FID is interleaved once per fit on the default lmfit path
+    objective_module = importlib.import_module("pyAMARES.kernel.objective_func")
+    calls = []
+
+    def counting_interleavefid(fid):
+        calls.append(1)
+        return interleavefid(fid)
+
+    monkeypatch.setattr(objective_module, "interleavefid", counting_interleavefid)
+    out = pyAMARES.fitAMARES_kernel(
+        FIDobj, params, default_objective, method="least_squares"
+    )
+    assert out.nfev > 1 and len(calls) == 1
+
+    D = pyAMARES.Jac6(params, FIDobj.timeaxis)
+    assert np.shares_memory(complex_view(D), D)
+    np.testing.assert_array_equal(complex_view(D), uninterleave(D))
@@ -0,0 +1,162 @@
+import time
+
+import numpy as np
+import pytest
+import scipy.linalg
+
+from pyAMARES.kernel.fid import multieq6_array
+from pyAMARES.libs import hlsvd
+from pyAMARES.util.hsvd import HSVDinitializer, hsvd_poles_to_params
+
+
+def test_hankel_operator():
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal(101) + 1j * rng.standard_normal(101)
+    for nrows in (30, 51, 80):
+        op = hlsvd.hankel_operator(data, nrows)
+        dense = scipy.linalg.hankel(data[:nrows], data[nrows - 1 :])
+        assert op.shape == dense.shape
+        v = rng.standard_normal((op.shape[1], 3)) + 0j
+        u = rng.standard_normal((op.shape[0], 3)) + 0j
+        np.testing.assert_allclose(op.matvec(v[:, 0]), dense @ v[:, 0], atol=1e-12)
+        np.testing.assert_allclose(op.matmat(v), dense @ v, atol=1e-12)
+        np.testing.assert_allclose(op.rmatmat(u), dense.conj().T @ u, atol=1e-12)
+
+
+def test_truncated_svd_backends(fid):
+    dense = hlsvd.hlsvdpro(fid, 12, svd_method="dense")
+    for svd_method, rtol in (("lanczos", 1e-8), ("randomized", 1e-2)):
+        result = hlsvd.hlsvdpro(fid, 12, svd_method=svd_method)
+        assert result[0] == 12
+        # Largest first, unlike the historical order of the dense path
+        np.testing.assert_allclose(result[1], dense[1][::-1][:12], rtol=rtol)
+        assert result[6].shape == (len(fid) // 2, 12)
+        # The strong components are the same
+        strong = dense[4] > 0.05 * np.max(dense[4])
+        idx = [np.argmin(np.abs(result[2] - f)) for f in dense[2][strong]]
+        np.testing.assert_allclose(result[2][idx], dense[2][strong], atol=1e-4)
+        np.testing.assert_allclose(result[4][idx], dense[4][strong], rtol=10 * rtol)
+    with pytest.raises(ValueError):
+        hlsvd.hlsvdpro(fid, 12, svd_method="qr")
+    # hlsvd() keeps the dense SVD by default, with all singular values ascending
+    default = hlsvd.hlsvd(fid, 12, 5e-4)
+    assert len(default[1]) == len(fid) // 2
+    np.testing.assert_array_equal(default[1], dense[1])
+    assert np.all(np.diff(default[1]) >= 0)
+
+
+def test_fast_hsvd_initializer(FIDobj):
+    result = hlsvd.hlsvd(FIDobj.fid, 16, FIDobj.dwelltime)
+    popt = hsvd_poles_to_params(result, FIDobj.timeaxis)
+    assert np.all(popt[:, 0] >= 0) and np.all(np.abs(popt[:, 3]) <= np.pi)
+    components = hlsvd.create_hlsvd_fids(
+        result, len(FIDobj.fid), FIDobj.dwelltime, sum_results=True, convert=False
+    )
+    np.testing.assert_allclose(
+        multieq6_array(popt, FIDobj.timeaxis), components, atol=1e-6
+    )
+
+    for fitting_parameters in (None, FIDobj.initialParams):
+        expected = HSVDinitializer(FIDobj, fitting_parameters, num_of_component=16)
+        params = HSVDinitializer(
+            FIDobj, fitting_parameters, num_of_component=16, fast=True
+        )
+        assert list(params) == list(expected)
+        for name in params:
+            # curve_fit may end at a negative amplitude with the phase shifted by pi
+            if name.startswith("ak") or name.startswith("phi"):
+                continue
+            assert params[name].value == pytest.approx(expected[name].value, rel=1e-4)
+        amplitude = np.array(
+            [
+                params[name].value
+                * np.exp(1j * params[name.replace("ak", "phi")].value)
+                for name in params
+                if name.startswith("ak")
+            ]
+        )
+        expected_amplitude = np.array(
+            [
+                expected[name].value
+                * np.exp(1j * expected[name.replace("ak", "phi")].value)
+                for name in expected
+                if name.startswith("ak")
+            ]
+        )
+        np.testing.assert_allclose(amplitude, expected_amplitude, rtol=1e-4, atol=1e-6)
+
+    lanczos = HSVDinitializer(FIDobj, num_of_component=16, svd_method="lanczos")
+    expected = HSVDinitializer(FIDobj, num_of_component=16)
+    for name in expected:
+        assert lanczos[name].value == pytest.approx(expected[name].value, rel=1e-4)
+
+    relative_norm = FIDobj.relativeNorm
+    HSVDinitializer(FIDobj, num_of_component=16, fast=True, refine=True)
+    assert FIDobj.relativeNorm < relative_norm
+
+
+@pytest.mark.parametrize("npts", [256, 1024])
+def test_hlsvd_batch(FIDobj, npts):
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal((4, npts, 2)).view(complex)[..., 0]
+    fids = FIDobj.fid[:npts] + 0.02 * np.max(np.abs(FIDobj.fid)) * noise
+    components = hlsvd.hlsvd_batch(fids, 16, FIDobj.dwelltime)
+    assert components.shape == (4, 16)
+    for fid, component in zip(fids, components):
+        expected = hlsvd.hlsvd(fid, 16, FIDobj.dwelltime)
+        np.testing.assert_allclose(component["frequency"], expected[2], atol=1e-6)
+        np.testing.assert_allclose(component["damping"], expected[3], rtol=1e-6)
+        np.testing.assert_allclose(component["amplitude"], expected[4], rtol=1e-6)
+        assert np.all(np.diff(component["singular_value"]) <= 0)
+    popt = hsvd_poles_to_params(components, FIDobj.timeaxis[:npts])
+    assert popt.shape == (4, 16, 5)
+    np.testing.assert_allclose(
+        popt[1], hsvd_poles_to_params(components[1], FIDobj.timeaxis[:npts])
+    )
+
+
+def vandermonde_data(npts):
+    rng = np.random.default_rng(0)
+    roots = np.exp(
+        -rng.uniform(1e-3, 1e-2, 20) + 2j * np.pi * rng.uniform(-0.5, 0.5, 20)
+    )
+    amplitudes = rng.standard_normal(20) + 1j * rng.standard_normal(20)
+    data = np.vander(roots, N=npts, increasing=True).T @ amplitudes
+    data += 1e-3 * (rng.standard_normal(npts) + 1j * rng.standard_normal(npts))
+    return roots, amplitudes, data
+
+
+def test_vandermonde_amplitudes():
+    roots, amplitudes, data = vandermonde_data(8192)
+    structured = hlsvd.vandermonde_amplitudes(roots, data)
+    np.testing.assert_allclose(structured, amplitudes, atol=1e-3)
+    np.testing.assert_allclose(
+        structured, hlsvd.vandermonde_amplitudes(roots, data, max_cond=0), rtol=1e-10
+    )
+
+    # Nearly coincident poles make the normal equations ill-conditioned, these fall back to zgelss
+    close = roots.copy()
+    close[1] = close[0] * np.exp(1e-7j)
+    stacked = hlsvd.vandermonde_amplitudes(
+        np.stack([roots, close]), np.stack([data, data])
+    )
+    np.testing.assert_allclose(stacked[0], structured)
+    np.testing.assert_allclose(
+        stacked[1], hlsvd.vandermonde_amplitudes(close, data, max_cond=0)
+    )
+
+
+@pytest.mark.benchmark
+def test_vandermonde_amplitudes_benchmark():
+    roots, _, data = vandermonde_data(8192)
+    timings = {}
+    for name, max_cond in (("zgelss", 0), ("structured", 1e8)):
+        timebefore = time.perf_counter()
+        for _ in range(5):
+            hlsvd.vandermonde_amplitudes(roots, data, max_cond=max_cond)
+        timings[name] = (time.perf_counter() - timebefore) / 5
+    print(
+        "\nVandermonde amplitudes of %i points: zgelss %.2f ms, structured %.2f ms"
+        % (len(data), timings["zgelss"] * 1e3, timings["structured"] * 1e3)
+    )
+    assert timings["structured"] < timings["zgelss"]
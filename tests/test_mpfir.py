@@ -0,0 +1,72 @@
+import importlib
+import os
+
+import numpy as np
+import pytest
+
+# pyAMARES.libs re-exports the MPFIR function under the name of its module
+mpfir = importlib.import_module("pyAMARES.libs.MPFIR")
+
+
+@pytest.fixture
+def designs(monkeypatch):
+    """Arguments of the calls of pbfirnew, starting with an empty design cache."""
+    calls = []
+    pbfirnew = mpfir.pbfirnew
+
+    def counted_pbfirnew(*args):
+        calls.append(args)
+        return pbfirnew(*args)
+
+    monkeypatch.setattr(mpfir, "pbfirnew", counted_pbfirnew)
+    mpfir.clear_fir_design_cache()
+    yield calls
+    mpfir.clear_fir_design_cache()
+
+
+def test_cached_mpfir(fid, designs, monkeypatch):
+    dwelltime = 1e-4
+    expected = mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3))
+    filtered = mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3), cache=True)
+    np.testing.assert_array_equal(filtered, expected)
+    assert len(designs) == 2 and len(mpfir._design_cache) == 1
+
+    # Voxels with a similar noise level reuse the design and are only convolved with it
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal((16, len(fid), 2)).view(complex)[..., 0]
+    voxels = fid + 1e-3 * np.std(np.real(fid[-20:])) * noise
+    for voxel in voxels:
+        mpfir.MPFIR(voxel, dwelltime, ppm_range=(-3, 3), cache=True)
+    assert len(designs) == 2 and len(mpfir._design_cache) == 1
+
+    # Another band is another design, the least recently used design is evicted
+    monkeypatch.setattr(mpfir, "design_cache_size", 2)
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-20, 10), cache=True)
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3), cache=True)
+    assert len(designs) == 3
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-10, -5), cache=True)
+    assert len(designs) == 4 and len(mpfir._design_cache) == 2
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3), cache=True)
+    assert len(designs) == 4
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-20, 10), cache=True)
+    assert len(designs) == 5
+
+
+def test_cached_mpfir_dir(fid, designs, tmp_path):
+    dwelltime = 1e-4
+    cache_dir = str(tmp_path / "fir_designs")
+    expected = mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3), cache_dir=cache_dir)
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-10, -5), cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2 and len(designs) == 2
+
+    # Another process that shares the directory adds its design without dropping the others
+    mpfir.clear_fir_design_cache()
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-20, 10), cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 3 and len(designs) == 3
+
+    # A new session loads the designs from the directory
+    mpfir.clear_fir_design_cache()
+    filtered = mpfir.MPFIR(fid, dwelltime, ppm_range=(-3, 3), cache_dir=cache_dir)
+    np.testing.assert_array_equal(filtered, expected)
+    mpfir.MPFIR(fid, dwelltime, ppm_range=(-10, -5), cache_dir=cache_dir)
+    assert len(designs) == 3 and len(mpfir._design_cache) == 2
@@ -0,0 +1,297 @@
+import importlib
+import os
+import pickle
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from pyAMARES.kernel.objective_func import objective_range
+from pyAMARES.util.multiprocessing import (
+    attach_shared_array,
+    default_chunk_size,
+    fit_seeded_dataset,
+    fit_shared_chunk,
+    fit_time_series,
+    init_worker,
+    make_fid_template,
+    release_shared_array,
+    run_parallel_fitting_with_progress,
+    run_spatial_fitting,
+    share_array,
+    spatial_schedule,
+    warm_start_fits,
+    warm_start_parameters,
+)
+
+
+@pytest.fixture(scope="module")
+def generic_params(FIDobj):
+    # Prior knowledge away from the optimum of fid.txt, e.g. a prior knowledge shared by many acquisitions
+    params = deepcopy(FIDobj.initialParams)
+    for name, par in params.items():
+        if not par.vary or par.expr:
+            continue
+        if name.startswith(("freq", "dk")):
+            par.set(value=par.value + 0.2 * (par.max - par.min))
+        elif name.startswith("ak"):
+            par.set(value=0.7 * par.value)
+    return params
+
+
+@pytest.fixture(scope="module")
+def fids(FIDobj):
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal((6, len(FIDobj.fid), 2)).view(complex)[..., 0]
+    return FIDobj.fid + 0.05 * np.abs(FIDobj.fid).max() * noise
+
+
+@pytest.fixture(scope="module")
+def cold_fits(FIDobj, generic_params, fids):
+    return [
+        fit_seeded_dataset(
+            fid, FIDobj, generic_params, method="least_squares", lightweight=True
+        )
+        for fid in fids
+    ]
+
+
+def test_warm_start_parameters(FIDobj):
+    initial_params = FIDobj.initialParams
+    fitted_params = deepcopy(initial_params)
+    fitted_params["freq_PCr"].set(value=10.0)
+    fitted_params["dk_PCr"].set(value=initial_params["dk_PCr"].min)
+    fitted_params["ak_UDPG"].set(value=0.0)
+    params = warm_start_parameters(initial_params, fitted_params)
+    assert params["freq_PCr"].value == 10.0
+    # Values at a bound are not seeded
+    assert params["dk_PCr"].value == initial_params["dk_PCr"].value
+    assert params["ak_UDPG"].value == initial_params["ak_UDPG"].value
+    for name, par in params.items():
+        assert (par.min, par.max) == (
+            initial_params[name].min,
+            initial_params[name].max,
+        )
+
+
+def test_fit_time_series_warm_start(FIDobj, generic_params, fids, cold_fits):
+    cold = cold_fits[:4]
+    warm = fit_time_series(
+        fids[:4],
+        FIDobj,
+        generic_params,
+        method="least_squares",
+        lightweight=True,
+        notebook=False,
+    )
+    assert warm[0].nfev == cold[0][2]
+    for (result, fitted_params, nfev), warm_result in zip(cold[1:], warm[1:]):
+        assert warm_result.success
+        assert warm_result.nfev <= nfev
+        assert warm_result.chisqr == pytest.approx(result.chisqr, rel=1e-4)
+        assert warm_result.params["ak_PCr"].value == pytest.approx(
+            fitted_params["ak_PCr"].value, rel=1e-3
+        )
+    assert sum(r.nfev for r in warm[1:]) < sum(c[2] for c in cold[1:])
+
+    # A failed fit is not used as a seed, the next dataset starts from the initial parameters
+    results = list(
+        warm_start_fits(
+            [fids[0][:100], fids[1]],
+            FIDobj,
+            generic_params,
+            method="least_squares",
+            lightweight=True,
+        )
+    )
+    assert results[0] is None
+    assert results[1].nfev == cold[1][2]
+
+
+def test_batched_parallel_fitting(FIDobj, fids, tmp_path):
+    kwargs = dict(
+        method="least_squares",
+        num_workers=2,
+        logfilename=str(tmp_path / "log.txt"),
+        notebook=False,
+        lightweight=True,
+    )
+    expected = run_parallel_fitting_with_progress(
+        fids[:4], FIDobj, FIDobj.initialParams, **kwargs
+    )
+    results = run_parallel_fitting_with_progress(
+        fids[:4], FIDobj, FIDobj.initialParams, batch_size=2, **kwargs
+    )
+    # The same minimum, the weak peaks are poorly determined
+    for result, expected_result in zip(results, expected):
+        assert result.chisqr == pytest.approx(expected_result.chisqr, rel=1e-5)
+        for name, par in expected_result.params.items():
+            if name.startswith("ak"):
+                assert result.params[name].value == pytest.approx(par.value, abs=5e-3)
+        assert result.params["freq_PCr"].value == pytest.approx(
+            expected_result.params["freq_PCr"].value, abs=1e-3
+        )
+
+    for option in ({"objective_func": objective_range}, {"warm_start": True}):
+        with pytest.raises(ValueError):
+            run_parallel_fitting_with_progress(
+                fids[:4], FIDobj, FIDobj.initialParams, batch_size=2, **kwargs, **option
+            )
+
+
+@pytest.mark.parametrize("backend", ["shm", "npy"])
+def test_shared_array(FIDobj, fids, backend, monkeypatch):
+    mp = importlib.import_module("pyAMARES.util.multiprocessing")
+    if backend == "npy":
+        # Python < 3.8, the workers memory-map a temporary file
+        monkeypatch.setattr(mp, "shared_memory", None)
+    spec, handle = share_array(fids[:3])
+    assert spec[0] == backend
+    try:
+        arr, shm = attach_shared_array(spec)
+        np.testing.assert_array_equal(arr, fids[:3])
+        del arr
+        if shm is not None:
+            shm.close()
+
+        # A worker attaches once and fits index ranges of the shared matrix
+        init_worker(spec, make_fid_template(FIDobj), FIDobj.initialParams)
+        results = fit_shared_chunk(1, 3, method="least_squares", lightweight=True)
+        assert [result.success for result in results] == [True, True]
+        np.testing.assert_array_equal(results[1].fid, fids[2])
+    finally:
+        if mp._worker_context.get("shm") is not None:
+            mp._worker_context["shm"].close()
+        mp._worker_context.clear()
+        release_shared_array(handle)
+    if backend == "npy":
+        assert not os.path.exists(handle)
+    else:
+        with pytest.raises(FileNotFoundError):
+            attach_shared_array(spec)
+
+
+def test_shared_array_released_after_error(FIDobj, fids, tmp_path, monkeypatch):
+    mp = importlib.import_module("pyAMARES.util.multiprocessing")
+    specs = []
+
+    def recording_share_array(arr):
+        spec, handle = share_array(arr)
+        specs.append(spec)
+        return spec, handle
+
+    monkeypatch.setattr(mp, "share_array", recording_share_array)
+    # A lambda cannot be sent to the workers, so the first task fails
+    with pytest.raises((AttributeError, pickle.PicklingError)):
+        run_parallel_fitting_with_progress(
+            fids[:2],
+            FIDobj,
+            FIDobj.initialParams,
+            num_workers=2,
+            logfilename=str(tmp_path / "log.txt"),
+            objective_func=lambda params, x, fid: fid,
+            notebook=False,
+        )
+    (spec,) = specs
+    with pytest.raises(FileNotFoundError):
+        attach_shared_array(spec)
+
+
+def test_chunked_parallel_fitting(FIDobj, fids, tmp_path, monkeypatch):
+    assert default_chunk_size(6, 2) == 1
+    assert default_chunk_size(100, 2) == 13
+    assert default_chunk_size(10**5, 8) == 256
+    assert default_chunk_size(3, 0) == 1
+
+    mp = importlib.import_module("pyAMARES.util.multiprocessing")
+    mp_wait = mp.wait
+    in_flight = []
+
+    def recording_wait(pending, **kwargs):
+        in_flight.append(len(pending))
+        return mp_wait(pending, **kwargs)
+
+    monkeypatch.setattr(mp, "wait", recording_wait)
+    results = run_parallel_fitting_with_progress(
+        fids,
+        FIDobj,
+        FIDobj.initialParams,
+        method="least_squares",
+        num_workers=2,
+        logfilename=str(tmp_path / "log.txt"),
+        notebook=False,
+        chunk_size=1,
+        lightweight=True,
+    )
+    # 6 chunks, at most 2 * num_workers in flight
+    assert max(in_flight) == 4
+    assert len(in_flight) >= 3
+    # Returned in the order of fids
+    assert len(results) == len(fids)
+    for fid, result in zip(fids, results):
+        np.testing.assert_array_equal(result.fid, fid)
+
+
+def test_spatial_schedule():
+    # A row of 5 voxels with two seeds, the fronts meet in the middle
+    fronts = spatial_schedule(np.arange(5)[:, None], [5.0, 1.0, 1.0, 1.0, 4.0], 2)
+    assert fronts == [[(0, -1), (1, 0), (2, 1)], [(4, -1), (3, 4)]]
+    assert spatial_schedule(np.arange(5)[:, None], [5.0, 1.0, 1.0, 1.0, 4.0]) == [
+        [(0, -1), (1, 0), (2, 1), (3, 2), (4, 3)]
+    ]
+
+    # Breadth-first order from the center of a 5x5 grid
+    coords = np.argwhere(np.ones((5, 5)))
+    snr = -np.abs(coords - 2).sum(axis=1).astype(float)
+    (front,) = spatial_schedule(coords, snr)
+    assert front[0] == (12, -1)
+    assert sorted(index for index, _ in front) == list(range(25))
+    distance = [np.abs(coords[index] - 2).sum() for index, _ in front]
+    assert distance == sorted(distance)
+    position = {index: i for i, (index, _) in enumerate(front)}
+    for index, parent in front[1:]:
+        assert position[parent] < position[index]
+        assert np.abs(coords[index] - coords[parent]).sum() == 1
+
+    # Voxels that are not connected to a seed start new fronts at their highest SNR
+    mask = np.zeros((4, 4), dtype=bool)
+    mask[0, :2] = mask[3, 1:] = True
+    coords = np.argwhere(mask)  # (0, 0), (0, 1), (3, 1), (3, 2), (3, 3)
+    fronts = spatial_schedule(coords, [3.0, 1.0, 2.0, np.nan, 5.0], nfronts=1)
+    assert fronts == [[(4, -1), (3, 4), (2, 3)], [(0, -1), (1, 0)]]
+    # More fronts than voxels
+    assert len(spatial_schedule(coords, np.ones(5), nfronts=10)) == 5
+
+    with pytest.raises(ValueError):
+        spatial_schedule([[0, 0], [0, 0]], [1.0, 2.0])
+
+
+def test_run_spatial_fitting(FIDobj, generic_params, fids, cold_fits, tmp_path):
+    coords = np.argwhere(np.ones((2, 3)))
+    snr = [5.0, 1.0, 1.0, 1.0, 1.0, 4.0]
+    results = run_spatial_fitting(
+        fids,
+        coords,
+        FIDobj,
+        generic_params,
+        method="least_squares",
+        num_workers=2,
+        nfronts=2,
+        snr=snr,
+        logfilename=str(tmp_path / "log.txt"),
+        notebook=False,
+        lightweight=True,
+    )
+    # Returned in the order of fids and attached to the template
+    for fid, result, (cold, _, nfev) in zip(fids, results, cold_fits):
+        np.testing.assert_array_equal(result.fid, fid)
+        assert result.success
+        assert result.chisqr == pytest.approx(cold.chisqr, rel=1e-4)
+        assert "PCr" in result.result_multiplets.index
+    seeds = [0, 5]
+    for i in seeds:
+        assert results[i].nfev == cold_fits[i][2]
+    propagated = [i for i in range(len(fids)) if i not in seeds]
+    assert sum(results[i].nfev for i in propagated) < sum(
+        cold_fits[i][2] for i in propagated
+    )
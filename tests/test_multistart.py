@@ -0,0 +1,52 @@
+import argparse
+
+import lmfit
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.fid import multieq6_array, params_to_array
+from pyAMARES.kernel.multistart import fit_multistart
+from pyAMARES.kernel.objective_func import default_objective
+
+
+def test_multistart_escapes_local_minimum():
+    # Two narrow lines, the initial frequency of one of them is far from its true value
+    def lines(freqs):
+        params = lmfit.Parameters()
+        for name, freq in zip("AB", freqs):
+            params.add("ak_" + name, value=1.0, min=0)
+            params.add("freq_" + name, value=freq, min=-800, max=800)
+            params.add("dk_" + name, value=20.0, min=5, max=200)
+            params.add("phi_" + name, value=0.0, min=-np.pi, max=np.pi)
+            params.add("g_" + name, value=0.0, vary=False)
+        return params
+
+    timeaxis = np.arange(1024) / 5000.0
+    rng = np.random.default_rng(1)
+    noise = rng.standard_normal((1024, 2)).view(complex)[:, 0]
+    fid = multieq6_array(params_to_array(lines((120.0, -150.0))), timeaxis)
+    opts = argparse.Namespace(timeaxis=timeaxis, fid=fid + 0.01 * noise)
+    params = lines((-720.0, -150.0))
+
+    single = pyAMARES.fitAMARES_kernel(opts, params, default_objective, method="native")
+    best = fit_multistart(opts, params, nstarts=32, seed=0)
+    assert best.chisqr < 1e-2 * single.chisqr
+    # The global minimum up to the labels of the two lines
+    freqs = sorted(best.params["freq_" + name].value for name in "AB")
+    assert freqs == pytest.approx([-150.0, 120.0], abs=0.5)
+    stats = best.multistart
+    assert stats.chisqr[stats.best] == pytest.approx(best.chisqr, rel=1e-12)
+    assert np.any(stats.abandoned) and stats.nbest >= 1
+    # The first start is the initial values, the others cover the bounds of the frequencies
+    np.testing.assert_array_equal(
+        stats.starts[0], [1.0, -720.0, 20.0, 0.0, 1.0, -150.0, 20.0, 0.0]
+    )
+    assert np.all(np.abs(stats.starts[:, 1]) <= 800)
+    assert np.ptp(stats.starts[:, 1]) > 1000
+
+    out = pyAMARES.fitAMARES_kernel(
+        opts, params, default_objective, method="least_squares", multistart=32
+    )
+    assert out.chisqr == pytest.approx(best.chisqr, rel=1e-4)
+    assert out.multistart.chisqr.shape == (32,)
@@ -0,0 +1,146 @@
+import argparse
+import time
+from copy import deepcopy
+
+import lmfit
+import nmrglue as ng
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.constraints import constraint_matrix
+from pyAMARES.kernel.fid import (
+    interleavefid,
+    multieq6_array,
+    params_to_array,
+    uninterleave,
+)
+from pyAMARES.kernel.objective_func import (
+    default_jacobian,
+    default_objective,
+    get_analytic_jacobian,
+    jacobian_range,
+    objective_range,
+)
+
+
+def test_analytic_jacobian_matches_finite_differences(FIDobj):
+    params = FIDobj.initialParams
+    Pmatrix, var_names = constraint_matrix(params)
+    jac = default_jacobian(params, FIDobj.timeaxis, FIDobj.fid, Pmatrix=Pmatrix)
+    residual0 = default_objective(params, FIDobj.timeaxis, FIDobj.fid)
+    jac_fd = np.zeros_like(jac)
+    for i, name in enumerate(var_names):
+        perturbed = deepcopy(params)
+        step = 1e-6 * max(1.0, abs(perturbed[name].value))
+        perturbed[name].set(value=perturbed[name].value + step)
+        perturbed.update_constraints()
+        residual = default_objective(perturbed, FIDobj.timeaxis, FIDobj.fid)
+        jac_fd[:, i] = (residual - residual0) / step
+    assert jac.shape == (2 * len(FIDobj.fid), len(var_names))
+    np.testing.assert_allclose(jac, jac_fd, rtol=0, atol=1e-5 * np.abs(jac).max())
+
+
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+def test_analytic_jacobian_nfev(FIDobj, method):
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    out_fd, out_jac = [
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+        )
+        for analytic_jac in (False, True)
+    ]
+    assert out_jac.nfev * 3 < out_fd.nfev
+    assert out_jac.chisqr <= out_fd.chisqr * 1.001
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+def test_analytic_jacobian_benchmark(FIDobj, method):
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    timings = {}
+    for analytic_jac in (False, True):
+        timebefore = time.perf_counter()
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=analytic_jac,
+        )
+        timings[analytic_jac] = time.perf_counter() - timebefore
+    print(
+        "\n%s: finite differences %.3fs, analytic Jacobian %.3fs"
+        % (method, timings[False], timings[True])
+    )
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.parametrize("fit_range", [(0, 1024), (380, 520), (600, 610)])
+def test_band_objective_matches_fft(FIDobj, fit_range):
+    # The closed-form band spectrum equals the slice of the FFT of the time-domain residual
+    params = FIDobj.initialParams
+    residual = uninterleave(default_objective(params, FIDobj.timeaxis, FIDobj.fid))
+    expected = interleavefid(ng.proc_base.fft(residual)[fit_range[0] : fit_range[1]])
+    band = objective_range(params, FIDobj.timeaxis, FIDobj.fid, fit_range)
+    np.testing.assert_allclose(
+        band, expected, rtol=0, atol=1e-9 * np.abs(expected).max()
+    )
+
+    Pmatrix, _ = constraint_matrix(params)
+    jac = default_jacobian(params, FIDobj.timeaxis, FIDobj.fid, Pmatrix=Pmatrix)
+    expected = ng.proc_base.fft(uninterleave(jac).T).T[fit_range[0] : fit_range[1]]
+    jac_band = jacobian_range(
+        params, FIDobj.timeaxis, FIDobj.fid, fit_range, Pmatrix=Pmatrix
+    )
+    np.testing.assert_allclose(
+        jac_band,
+        interleavefid(expected),
+        rtol=0,
+        atol=1e-9 * np.abs(expected).max(),
+    )
+
+
+def test_analytic_jacobian_requires_linear_expr():
+    def lines(expr):
+        params = lmfit.Parameters()
+        for name, freq in zip("AB", (120.0, -150.0)):
+            params.add("ak_" + name, value=1.0, min=0)
+            params.add("freq_" + name, value=freq, min=-800, max=800)
+            params.add("dk_" + name, value=20.0, min=5, max=200)
+            params.add("phi_" + name, value=0.0, min=-np.pi, max=np.pi)
+            params.add("g_" + name, value=0.0, vary=False)
+        params["ak_B"].set(expr=expr)
+        return params
+
+    timeaxis = np.arange(1024) / 5000.0
+    truth = lines("ak_A**2")
+    truth["ak_A"].set(value=3.0)
+    fid = multieq6_array(params_to_array(truth), timeaxis)
+    opts = argparse.Namespace(timeaxis=timeaxis, fid=fid)
+
+    assert get_analytic_jacobian(default_objective, lines("2*ak_A")) is not None
+    # The derivative of ak_A**2 depends on ak_A, a P matrix built once would be wrong
+    params = lines("ak_A**2")
+    assert get_analytic_jacobian(default_objective, params) is None
+    out_fd, out_jac = [
+        pyAMARES.fitAMARES_kernel(
+            opts,
+            params,
+            default_objective,
+            method="least_squares",
+            analytic_jac=analytic_jac,
+        )
+        for analytic_jac in (False, True)
+    ]
+    assert out_jac.nfev == out_fd.nfev
+    assert out_jac.params["ak_A"].value == pytest.approx(3.0, rel=1e-6)
+    assert out_jac.params["ak_B"].value == pytest.approx(9.0, rel=1e-6)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.batch import fit_batch
+from pyAMARES.kernel.constraints import constraint_matrix
+from pyAMARES.kernel.fid import (
+    engine_inputs,
+    jacobian_array,
+    multieq6_array,
+    params_to_array,
+)
+from pyAMARES.util.crlb import evaluateCRB_batch
+
+
+@pytest.fixture(scope="module")
+def FIDobjs(FIDobj, load_fid):
+    return FIDobj, load_fid("single")
+
+
+def accuracy_report(names, values, values_single, crlb, crlb_single):
+    """Worst deviation of the single precision fit from the double precision fit, per parameter type."""
+    names = np.array([name.split("_")[0] for name in names])
+    varying = np.all(crlb > 0, axis=0)
+    rows = {}
+    for kind in ("ak", "freq", "dk", "phi", "g"):
+        cols = (names == kind) & varying
+        if not np.any(cols):
+            continue
+        rows[kind] = {
+            "max |dvalue| / CRLB": np.max(
+                np.abs(values_single - values)[:, cols] / crlb[:, cols]
+            ),
+            "max |dCRLB| / CRLB": np.max(
+                np.abs(crlb_single - crlb)[:, cols] / crlb[:, cols]
+            ),
+        }
+    return pd.DataFrame(rows).T
+
+
+def test_single_precision_engine(FIDobjs, load_fid):
+    double, single = FIDobjs
+    timeaxis, fid = engine_inputs(single)
+    assert timeaxis.dtype == np.float32 and fid.dtype == np.complex64
+    assert engine_inputs(double)[0] is double.timeaxis
+    popt = params_to_array(double.initialParams)
+    model = multieq6_array(popt, timeaxis)
+    assert model.dtype == np.complex64
+    expected = multieq6_array(popt, double.timeaxis)
+    assert np.max(np.abs(model - expected)) < 1e-5 * np.max(np.abs(expected))
+    jacobian = jacobian_array(popt, timeaxis)
+    assert jacobian.dtype == np.complex64
+    expected = jacobian_array(popt, double.timeaxis)
+    scale = np.max(np.abs(expected), axis=-1, keepdims=True)
+    assert np.max(np.abs(jacobian - expected) / scale) < 1e-5
+    with pytest.raises(ValueError):
+        load_fid("half")
+
+
+def test_single_precision_accuracy_report(FIDobjs):
+    double, single = FIDobjs
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal((8, len(double.fid), 2)).view(complex)[..., 0]
+    fids = double.fid + 0.05 * np.abs(double.fid).max() * noise
+    result = fit_batch(double, double.initialParams, fids)
+    result_single = fit_batch(single, single.initialParams, fids)
+    assert np.all(result_single.success)
+
+    # The CRLBs are always evaluated in double precision
+    P, _ = constraint_matrix(double.initialParams)
+    crlb, _ = evaluateCRB_batch(result.values, double.timeaxis, fids, P=P)
+    crlb_single, _ = evaluateCRB_batch(result_single.values, double.timeaxis, fids, P=P)
+    report = accuracy_report(
+        result.names, result.values, result_single.values, crlb, crlb_single
+    )
+    # The differences are of the order of the convergence tolerance along poorly determined
+    # directions, where chi-square is flat
+    np.testing.assert_allclose(result_single.chisqr, result.chisqr, rtol=1e-5)
+    assert np.all(report["max |dvalue| / CRLB"] < 0.1)
+    assert np.all(report["max |dCRLB| / CRLB"] < 0.05)
+
+    # Single voxel fit with the analytic Jacobian
+    out = pyAMARES.fitAMARES(
+        double, double.initialParams, method="native", ifplot=False
+    )
+    out_single = pyAMARES.fitAMARES(
+        single, single.initialParams, method="native", ifplot=False
+    )
+    values = params_to_array(out.out_obj.params).reshape(1, -1)
+    values_single = params_to_array(out_single.out_obj.params).reshape(1, -1)
+    report = accuracy_report(
+        result.names,
+        values,
+        values_single,
+        out.crlb.reshape(1, -1),
+        out_single.crlb.reshape(1, -1),
+    )
+    assert np.all(report["max |dvalue| / CRLB"] < 0.1)
+    assert np.all(report["max |dCRLB| / CRLB"] < 0.05)
@@ -0,0 +1,84 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.result import AMARESResult
+
+
+@pytest.fixture(scope="module")
+def eager(FIDobj):
+    return pyAMARES.fitAMARES(
+        FIDobj, FIDobj.initialParams, method="least_squares", ifplot=False
+    )
+
+
+@pytest.fixture()
+def lightweight(FIDobj):
+    return pyAMARES.fitAMARES(
+        FIDobj,
+        FIDobj.initialParams,
+        method="least_squares",
+        ifplot=False,
+        lightweight=True,
+    )
+
+
+def test_lightweight_matches_eager(FIDobj, eager, lightweight):
+    assert isinstance(lightweight, AMARESResult)
+    assert lightweight.chisqr == eager.out_obj.chisqr
+    assert lightweight.nfev == eager.out_obj.nfev
+    # fid_parameters is not modified or copied
+    assert "result_multiplets" not in vars(FIDobj)
+    assert lightweight.fid is FIDobj.fid
+
+    params = lightweight.params
+    assert list(params) == list(eager.fittedParams)
+    for name, par in eager.fittedParams.items():
+        assert params[name].value == par.value
+        assert params[name].stderr == par.stderr
+        assert params[name].expr == par.expr
+    # The initial parameters are only the template
+    assert FIDobj.initialParams["ak_PCr"].value != params["ak_PCr"].value
+
+    assert lightweight.result_multiplets.equals(eager.result_multiplets)
+    assert lightweight.result_sum.equals(eager.result_sum)
+    assert lightweight.report() is lightweight.report()
+    np.testing.assert_allclose(lightweight.crlb, eager.crlb, rtol=1e-10)
+
+
+def test_pickle(eager, lightweight):
+    restored = pickle.loads(pickle.dumps(lightweight))
+    assert restored.names == lightweight.names
+    np.testing.assert_array_equal(restored.values, lightweight.values)
+    np.testing.assert_array_equal(restored.stderr, lightweight.stderr)
+    np.testing.assert_array_equal(restored.fid, lightweight.fid)
+    assert (restored.chisqr, restored.nfev, restored.success) == (
+        lightweight.chisqr,
+        lightweight.nfev,
+        lightweight.success,
+    )
+    assert restored.result_multiplets.equals(eager.result_multiplets)
+
+    # The cached reports are not pickled
+    lightweight.report()
+    lightweight.crlb
+    restored = pickle.loads(pickle.dumps(lightweight))
+    assert restored._report is None and restored._crlb is None
+    assert restored.result_sum.equals(eager.result_sum)
+
+
+def test_detach_attach(FIDobj, eager, lightweight):
+    attached_size = len(pickle.dumps(lightweight))
+    assert lightweight.detach() is lightweight
+    # Only the fitted vector and the FID are sent to another process
+    assert len(pickle.dumps(lightweight)) < attached_size
+    for name in ("params", "crlb", "result_multiplets"):
+        with pytest.raises(ValueError):
+            getattr(lightweight, name)
+
+    restored = pickle.loads(pickle.dumps(lightweight))
+    assert restored.attach(FIDobj, FIDobj.initialParams) is restored
+    assert restored.result_multiplets.equals(eager.result_multiplets)
+    np.testing.assert_allclose(restored.crlb, eager.crlb, rtol=1e-10)
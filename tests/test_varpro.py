@@ -0,0 +1,57 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import pyAMARES
+from pyAMARES.kernel.constraints import compile_parameters, split_fixed_peaks
+from pyAMARES.kernel.fid import multieq6_array
+from pyAMARES.kernel.objective_func import default_objective
+from pyAMARES.kernel.varpro import varpro_layout, varpro_solve
+
+
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+def test_varpro_matches_full_fit(FIDobj, method):
+    tol = np.sqrt(np.abs(np.max(FIDobj.fid))) * 1e-6
+    fit_kws = {"max_nfev": 1000, "xtol": tol, "ftol": tol}
+    out_full, out_varpro = [
+        pyAMARES.fitAMARES_kernel(
+            FIDobj,
+            FIDobj.initialParams,
+            default_objective,
+            method=method,
+            fit_kws=fit_kws,
+            analytic_jac=True,
+            compiled=True,
+            varpro=varpro,
+        )
+        for varpro in (False, True)
+    ]
+    assert out_varpro.nfev <= out_full.nfev
+    assert out_varpro.chisqr <= out_full.chisqr * 1.001
+    for name in ("ak_PCr", "freq_PCr", "phi_BATP"):
+        assert out_varpro.params[name].value == pytest.approx(
+            out_full.params[name].value, rel=1e-3, abs=1e-3
+        )
+
+
+def test_varpro_residual_within_bounds(FIDobj):
+    # A free complex amplitude of PCr, whose modulus is bounded below the data
+    params = deepcopy(FIDobj.initialParams)
+    params["phi_PCr"].set(expr="", vary=True, min=-np.pi, max=np.pi)
+    params["ak_PCr"].set(max=0.5 * params["ak_PCr"].value)
+    compiled = compile_parameters(params)
+    active, fixed_popt = split_fixed_peaks(compiled)
+    fid = FIDobj.fid - multieq6_array(fixed_popt, FIDobj.timeaxis)
+    layout = varpro_layout(active)
+    assert not layout.shared
+
+    x, residual = varpro_solve(
+        active.x0[layout.nonlinear], active, layout, FIDobj.timeaxis, fid
+    )
+    assert np.all(x >= active.lower) and np.all(x <= active.upper)
+    assert x[active.var_names.index("ak_PCr")] == params["ak_PCr"].max
+    popt = (active.Pmatrix @ x + active.offset).reshape(-1, 5)
+    np.testing.assert_allclose(
+        residual, fid - multieq6_array(popt, FIDobj.timeaxis), atol=1e-10
+    )